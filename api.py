@@ -0,0 +1,226 @@
+# SQLite fix for deployment, same as main.py
+try:
+    import pysqlite3
+    import sys
+    sys.modules['sqlite3'] = pysqlite3
+except ImportError:
+    pass
+
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from uuid import uuid4
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+import metrics
+import rag
+from chunk_metadata import build_where
+from history import HistoryStore
+
+# Finished ingest jobs kept for status polling
+MAX_FINISHED_JOBS = 100
+
+jobs = {}
+# Questions answered by this API, opened on startup
+history = None
+# Ingest jobs of this worker queue here; rag.exclusive_ingest serializes them with the other processes of the host
+ingest_lock = asyncio.Lock()
+
+
+class IngestRequest(BaseModel):
+    urls: List[str]
+    # Crawl mode: follow links and sitemap.xml from the URLs
+    crawl: bool = False
+    # Clients cannot start crawls deeper or larger than the configured limits
+    max_depth: int = Field(rag.CRAWL_MAX_DEPTH, ge=0, le=rag.CRAWL_MAX_DEPTH)
+    max_pages: int = Field(rag.CRAWL_MAX_PAGES, ge=1, le=rag.CRAWL_MAX_PAGES)
+
+
+class RetrievalFilters(BaseModel):
+    # Only chunks matching every given filter are searched
+    source: Optional[List[str]] = None
+    domain: Optional[List[str]] = None
+    doc_hash: Optional[List[str]] = None
+    # Unix time in seconds
+    ingested_after: Optional[float] = None
+    ingested_before: Optional[float] = None
+
+
+class AskRequest(BaseModel):
+    question: str
+    search_ef: Optional[int] = None
+    filters: Optional[RetrievalFilters] = None
+
+
+class BatchAskRequest(BaseModel):
+    questions: List[str]
+    search_ef: Optional[int] = None
+    filters: Optional[RetrievalFilters] = None
+
+
+def _open_history():
+    """Open the history store and warm the answer cache from answers given on the current collection"""
+    global history
+    history = HistoryStore(rag.HISTORY_DB, max_entries=rag.HISTORY_MAX_ENTRIES, max_age_days=rag.HISTORY_MAX_AGE_DAYS)
+    rag.warm_answer_cache(history.latest_answers(rag.collection_version(), limit=rag.ANSWER_CACHE_SIZE))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load the embedding model and open the vector store before taking traffic
+    await asyncio.to_thread(rag.initialize_components)
+    await asyncio.to_thread(_open_history)
+    yield
+
+
+app = FastAPI(title="Docubot API", lifespan=lifespan)
+
+
+def _run_ingest(job):
+    """Drive the process_urls generator in a worker thread, recording every status message"""
+    if job["crawl"]:
+        statuses = rag.process_crawl(job["urls"], max_depth=job["max_depth"], max_pages=job["max_pages"])
+    else:
+        statuses = rag.process_urls(job["urls"])
+    for status in statuses:
+        job["messages"].append(status)
+        if status.startswith("Error"):
+            job["status"] = "failed"
+            job["error"] = status
+    if job["status"] != "failed":
+        job["status"] = "succeeded"
+
+
+async def _ingest_job(job):
+    async with ingest_lock:
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        try:
+            await asyncio.to_thread(_run_ingest, job)
+        except Exception as e:
+            logging.error(f"Ingest job {job['id']} failed: {e}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+        job["finished_at"] = time.time()
+
+    # Forget the oldest finished jobs
+    finished = [job_id for job_id, j in jobs.items() if j["status"] in ("succeeded", "failed")]
+    for job_id in finished[:-MAX_FINISHED_JOBS]:
+        del jobs[job_id]
+
+
+@app.post("/ingest", status_code=202)
+async def ingest(request: IngestRequest):
+    urls = [url.strip() for url in request.urls if url.strip()]
+    if not urls:
+        raise HTTPException(status_code=422, detail="No URLs given")
+    job = {
+        "id": str(uuid4()),
+        "urls": urls,
+        "crawl": request.crawl,
+        "max_depth": request.max_depth,
+        "max_pages": request.max_pages,
+        "status": "queued",
+        "messages": [],
+        "error": None,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+    }
+    jobs[job["id"]] = job
+    job["task"] = asyncio.create_task(_ingest_job(job))
+    return {"job_id": job["id"], "status": job["status"]}
+
+
+@app.get("/ingest/{job_id}")
+async def ingest_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return {key: value for key, value in job.items() if key != "task"}
+
+
+def _filters(request):
+    return request.filters.model_dump(exclude_none=True) if request.filters else None
+
+
+def _record(answers, filters):
+    """
+    Store generated answers in the history, so they warm the answer cache of the next start
+    :param answers: (question, answer, sources) tuples; answers without sources are skipped
+    """
+    where = build_where(filters)
+    version = rag.collection_version()
+    for question, answer, sources in answers:
+        if sources:
+            history.add("api", question, answer, sources, filters=where, collection_version=version)
+
+
+@app.post("/ask")
+async def ask(request: AskRequest):
+    filters = _filters(request)
+    evidence = await asyncio.to_thread(rag.retrieve_evidence, request.question, search_ef=request.search_ef,
+                                       filters=filters)
+    # Set before the LLM call for cache hits, which are in the history already
+    generated = evidence["answer"] is None
+    answer, sources = await rag.agenerate_from_evidence(evidence)
+    if generated:
+        await asyncio.to_thread(_record, [(request.question, answer, sources)], filters)
+    return {"answer": answer, "sources": sources}
+
+
+@app.post("/ask/batch")
+async def ask_batch(request: BatchAskRequest):
+    filters = _filters(request)
+    results, stats = await rag.agenerate_answers(request.questions, search_ef=request.search_ef, filters=filters)
+    # Batches skip the answer cache, every answer was generated
+    await asyncio.to_thread(_record, [(question, answer, sources)
+                                      for question, (answer, sources) in zip(request.questions, results)], filters)
+    return {
+        "results": [{"answer": answer, "sources": sources} for answer, sources in results],
+        "stats": stats,
+    }
+
+
+@app.post("/ask/stream")
+async def ask_stream(request: AskRequest):
+    async def events():
+        async for event in rag.astream_answer(request.question, search_ef=request.search_ef, filters=_filters(request)):
+            yield f"data: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/health")
+async def health():
+    if rag.vector_store is None or rag.llm is None:
+        raise HTTPException(status_code=503, detail="Components are not initialized")
+    try:
+        # Heartbeat first: in server mode it is the cheapest check that the Chroma server is up
+        await asyncio.to_thread(rag.read_collection.heartbeat)
+        chunks = await asyncio.to_thread(rag.read_collection.count)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Vector store unavailable: {e}")
+    return {
+        "status": "ok",
+        "vector_store": "server" if rag.CHROMA_HOST else "embedded",
+        "chunks": chunks,
+        "ingest_running": ingest_lock.locked(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return metrics.render_prometheus()
+
+
+if __name__ == "__main__":
+    import os
+    import uvicorn
+    uvicorn.run("api:app", host="0.0.0.0", port=int(os.getenv("API_PORT", "8000")))
@@ -0,0 +1,68 @@
+"""
+Batch question answering throughput: generate_answer in a loop versus generate_answers.
+
+The fixture pages are ingested into a temporary vector store and the fixed
+query set, repeated --repeats times, is answered both ways with the
+deterministic fake LLM. Repeated questions have identical prompts, so the batch
+path also shows the effect of sharing one LLM call between them.
+
+    python -m benchmarks.batch_qa --repeats 5 --llm-latency 0.2
+"""
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.common import DEFAULT_QUERIES, write_results
+from benchmarks.fakes import FakeChatGroq, serve_fixture_pages
+from benchmarks.pipeline import run_ingest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5, help="passes over the fixed query set")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds the fake LLM sleeps per call")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="LLM calls in flight in the batch path")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    import rag
+
+    logging.getLogger().setLevel(args.log_level)
+    rag.VECTORSTORE_DIR = Path(tempfile.mkdtemp(prefix="docubot-bench-"))
+    # Fetch strategies learned from the fixture server stay out of resources/
+    rag.FETCH_STATS_DB = rag.VECTORSTORE_DIR / "fetch_stats.sqlite3"
+    rag.llm = FakeChatGroq(latency=args.llm_latency)
+    # The fake LLM has no quota, only the concurrency limit applies
+    rag.LLM_REQUESTS_PER_MINUTE = rag.LLM_TOKENS_PER_MINUTE = 10 ** 9
+    rag.LLM_MAX_CONCURRENCY = args.max_concurrency
+
+    with serve_fixture_pages() as (_, urls):
+        run_ingest(rag, urls)
+
+    queries = DEFAULT_QUERIES * args.repeats
+
+    start = time.perf_counter()
+    loop_answers = [rag.generate_answer(query) for query in queries]
+    loop_seconds = time.perf_counter() - start
+
+    batch_answers, stats = rag.generate_answers(queries, max_concurrency=args.max_concurrency)
+
+    write_results({
+        "questions": len(queries),
+        "unique_questions": len(set(queries)),
+        "fake_llm_latency_seconds": args.llm_latency,
+        "loop": {
+            "seconds": round(loop_seconds, 3),
+            "questions_per_second": round(len(queries) / loop_seconds, 2),
+        },
+        "batch": stats,
+        "speedup": round(stats["questions_per_second"] / (len(queries) / loop_seconds), 2),
+        "same_answers": loop_answers == batch_answers,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+On-disk size and read latency of chunk text kept in Chroma versus the
+compressed side store (CHUNK_STORE=zstd), with and without a trained
+dictionary and at several zstd levels.
+
+The chunks are written the way ingest writes them, in batches of `--batch`,
+together with random `--dim` vectors (the same vectors in every variant, so
+size differences come from the text). With a dictionary, the store trains it
+as it grows, like in a growing collection: once it holds 64 chunks, then again
+each time it doubles. The chunks the final dictionary was trained on are
+reported, "+dict" variants that ended up without one are flagged. Size is
+everything on disk: the Chroma directory plus the side store and its
+dictionary.
+
+Reads follow search_documents: a vector query for `--fetch-k` candidates, then
+the text of the `--k` chunks MMR would keep. In "chroma" the query returns the
+text of all candidates; with the side store it returns ids and metadata and
+only k chunks are read and decompressed. The (uncompressed) text bytes a
+query reads are reported as a measure of page-cache pressure.
+
+    python -m benchmarks.chunk_store --corpus chunks.jsonl --levels 3 9 19
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.common import latency_summary, load_corpus, write_results
+
+
+def fixture_chunks():
+    from benchmarks.chunking import make_splitters, page_texts
+
+    splitter = make_splitters(400, lambda text: len(text.split()), 254)["recursive"]
+    return [chunk for text in page_texts() for chunk in splitter.split_text(text)]
+
+
+def directory_bytes(path):
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+
+def build(name, texts, vectors, args, level=None, dictionary=False):
+    import chromadb
+
+    from chunk_store import CompressedChunkStore
+
+    workdir = Path(tempfile.mkdtemp(prefix="docubot-chunks-"))
+    collection = chromadb.PersistentClient(path=str(workdir / "chroma")).create_collection(
+        "bench", metadata={"hnsw:space": "cosine"}, embedding_function=None
+    )
+    store = None
+    if level is not None:
+        store = CompressedChunkStore(workdir / "chunks.sqlite3", level=level) if dictionary else \
+            CompressedChunkStore(workdir / "chunks.sqlite3", level=level, min_train_samples=len(texts) + 1)
+    ids = [f"chunk-{i}" for i in range(len(texts))]
+
+    start = time.perf_counter()
+    for offset in range(0, len(texts), args.batch):
+        batch = slice(offset, offset + args.batch)
+        if store is not None:
+            store.add(ids[batch], texts[batch])
+        collection.add(
+            ids=ids[batch],
+            embeddings=vectors[batch].tolist(),
+            documents=texts[batch] if store is None else None,
+            metadatas=[{"source": f"page-{i // 20}"} for i in range(offset, min(offset + args.batch, len(texts)))]
+        )
+    write_seconds = time.perf_counter() - start
+    return {"name": name, "workdir": workdir, "collection": collection, "store": store, "write_seconds": write_seconds}
+
+
+def measure_reads(variant, query_vectors, k, fetch_k):
+    collection, store = variant["collection"], variant["store"]
+    latencies = []
+    text_bytes = 0
+    for query_vector in query_vectors:
+        start = time.perf_counter()
+        results = collection.query(
+            query_embeddings=[query_vector.tolist()],
+            n_results=fetch_k,
+            include=["metadatas"] if store is not None else ["documents", "metadatas"]
+        )
+        # Stand-in for the MMR selection: the first k candidates
+        selected = results["ids"][0][:k]
+        if store is not None:
+            texts = store.get(selected)
+            text_bytes += sum(len(text.encode("utf-8")) for text in texts)
+        else:
+            text_bytes += sum(len(text.encode("utf-8")) for text in results["documents"][0])
+        latencies.append(time.perf_counter() - start)
+    return latency_summary(latencies), text_bytes / len(query_vectors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help=".jsonl chunk corpus; defaults to the persisted collection, "
+                                         "or the fixture pages when there is none")
+    parser.add_argument("--limit", type=int, default=None, help="use at most this many chunks")
+    parser.add_argument("--levels", type=int, nargs="+", default=[3, 9, 19], help="zstd levels to compare")
+    parser.add_argument("--batch", type=int, default=500, help="chunks per write")
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    try:
+        texts = load_corpus(args.corpus, limit=args.limit)
+    except Exception:
+        if args.corpus:
+            raise
+        texts = fixture_chunks()[:args.limit]
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((len(texts), args.dim)).astype(np.float32)
+    query_vectors = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    raw_bytes = sum(len(text.encode("utf-8")) for text in texts)
+    print(f"{len(texts)} chunks, {raw_bytes / 2 ** 20:.1f} MB of text")
+
+    variants = [("chroma", None, False)]
+    variants += [(f"zstd-{level}", level, False) for level in args.levels]
+    variants += [(f"zstd-{level}+dict", level, True) for level in args.levels]
+    results = []
+    for name, level, dictionary in variants:
+        variant = build(name, texts, vectors, args, level=level, dictionary=dictionary)
+        latency, text_bytes = measure_reads(variant, query_vectors, args.k, args.fetch_k)
+        result = {
+            "variant": name,
+            "chunks": len(texts),
+            "disk_mb": round(directory_bytes(variant["workdir"]) / 2 ** 20, 2),
+            "chroma_mb": round(directory_bytes(variant["workdir"] / "chroma") / 2 ** 20, 2),
+            "write_seconds": round(variant["write_seconds"], 2),
+            "text_bytes_read_per_query": round(text_bytes),
+            "read_latency": latency,
+        }
+        if variant["store"] is not None:
+            stats = variant["store"].stats()
+            result["compression_ratio"] = round(stats["raw_bytes"] / max(stats["stored_bytes"] + stats["dictionary_bytes"], 1), 2)
+            result["dictionary_samples"] = stats["dictionary_samples"]
+        results.append(result)
+        if dictionary and not result["dictionary_samples"]:
+            print(f"{name:>13}: no dictionary was trained, too few chunks")
+        print(f"{name:>13}: {result['disk_mb']} MB on disk, ratio {result.get('compression_ratio', 1.0)}, "
+              f"read p50 {latency['p50_ms']} ms, p99 {latency['p99_ms']} ms, "
+              f"{result['text_bytes_read_per_query']} text bytes per query")
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
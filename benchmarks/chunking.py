@@ -0,0 +1,132 @@
+"""
+Chunks that have to be embedded again after a small page edit, with the
+recursive splitter versus content-defined chunking (CHUNKING_MODE=content).
+
+The text of the saved pages in benchmarks/fixtures/pages is extracted and
+cleaned the way ingest does it. For every page `--edits` edits are made at
+random sentence boundaries: a sentence inserted, a sentence deleted, and one
+word changed within a sentence. A chunk of the edited page has to be embedded
+when no chunk of the original page has the same text, which is how content
+mode decides it. Split time per page is reported too.
+
+Token limits are checked with a whitespace word count unless `--tokenizer`
+loads the embedding model's tokenizer.
+
+    python -m benchmarks.chunking --edits 20
+"""
+import argparse
+import random
+import re
+import time
+
+from benchmarks.common import latency_summary, write_results
+from benchmarks.fakes import FIXTURE_PAGES_DIR
+from content_chunking import ContentDefinedSplitter
+
+INSERTED = "Rates rose to 6.72 percent this week, the highest level since May."
+SENTENCE_STARTS = re.compile(r"(?<=[.!?]) (?=[A-Z])")
+
+
+def page_texts():
+    from bs4 import BeautifulSoup
+    from unstructured.cleaners.core import clean_extra_whitespace
+
+    texts = []
+    for page in sorted(FIXTURE_PAGES_DIR.glob("*.html")):
+        soup = BeautifulSoup(page.read_text(encoding="utf-8"), "html.parser")
+        for element in soup(["script", "style", "nav", "header", "footer"]):
+            element.decompose()
+        texts.append(clean_extra_whitespace(soup.get_text(separator=" ", strip=True)))
+    return texts
+
+
+def edit(text, kind, rng):
+    """Apply one edit of the given kind at a random sentence start"""
+    starts = [match.end() for match in SENTENCE_STARTS.finditer(text)]
+    if not starts:
+        return text + " " + INSERTED
+    start = rng.choice(starts)
+    if kind == "insert":
+        return f"{text[:start]}{INSERTED} {text[start:]}"
+    following = [s for s in starts if s > start]
+    end = following[0] if following else len(text)
+    if kind == "delete":
+        return text[:start] + text[end:]
+    words = text[start:end].split(" ")
+    i = rng.randrange(len(words))
+    words[i] = words[i].upper() if words[i].lower() == words[i] else words[i].lower()
+    return text[:start] + " ".join(words) + text[end:]
+
+
+def make_splitters(chunk_size, token_length, max_tokens):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    return {
+        # Same settings as index_documents
+        "recursive": RecursiveCharacterTextSplitter(
+            separators=["\n\n", "\n", ".", "!", "?", ";", " "],
+            chunk_size=chunk_size,
+            chunk_overlap=100,
+            length_function=len,
+            is_separator_regex=False
+        ),
+        "content": ContentDefinedSplitter(chunk_size=chunk_size, max_tokens=max_tokens, token_length=token_length),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--edits", type=int, default=20, help="edits of each kind per page")
+    parser.add_argument("--chunk-size", type=int, default=400)
+    parser.add_argument("--max-tokens", type=int, default=254)
+    parser.add_argument("--tokenizer", action="store_true", help="count tokens with the embedding model's tokenizer")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    if args.tokenizer:
+        from rag import get_tokenizer
+        tokenizer = get_tokenizer()
+
+        def token_length(text):
+            return len(tokenizer.encode(text, add_special_tokens=False))
+    else:
+        def token_length(text):
+            return len(text.split())
+
+    texts = page_texts()
+    results = []
+    for name, splitter in make_splitters(args.chunk_size, token_length, args.max_tokens).items():
+        latencies = []
+        chunks = []
+        for text in texts:
+            start = time.perf_counter()
+            chunks.append(splitter.split_text(text))
+            latencies.append(time.perf_counter() - start)
+
+        rng = random.Random(args.seed)
+        result = {
+            "splitter": name,
+            "pages": len(texts),
+            "chunks_per_page": round(sum(map(len, chunks)) / len(texts), 1),
+            "avg_chunk_chars": round(sum(len(c) for page in chunks for c in page) / sum(map(len, chunks))),
+            "split_time": latency_summary(latencies),
+            "embedded_per_edit": {},
+        }
+        for kind in ("insert", "delete", "change_word"):
+            embedded = 0
+            for text, original in zip(texts, chunks):
+                stored = set(original)
+                for _ in range(args.edits):
+                    embedded += len(set(splitter.split_text(edit(text, kind, rng))) - stored)
+            result["embedded_per_edit"][kind] = round(embedded / (len(texts) * args.edits), 2)
+        results.append(result)
+        print(f"{name:>9}: {result['chunks_per_page']} chunks per page of {result['avg_chunk_chars']} chars, "
+              f"split p50 {result['split_time']['p50_ms']} ms; chunks embedded per edit "
+              + ", ".join(f"{kind} {count}" for kind, count in result["embedded_per_edit"].items()))
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Run benchmarks from the repository root, e.g. ``python -m benchmarks.embedding_backends``.
+"""
+import json
+import platform
+import subprocess
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Fixed query set so results are comparable from run to run
+DEFAULT_QUERIES = [
+    "What is the current 30-year fixed mortgage rate?",
+    "What was the 15-year fixed rate last week?",
+    "How are mortgage rates trending this month?",
+    "What is the average rate on a 5/1 adjustable-rate mortgage?",
+    "How do points affect the mortgage APR?",
+    "What credit score do I need for the best mortgage rate?",
+    "When does Freddie Mac publish the Primary Mortgage Market Survey?",
+    "How much does a 1% rate change affect the monthly payment?",
+    "What are jumbo mortgage rates today?",
+    "Should I refinance when rates drop?",
+    "What is the difference between interest rate and APR?",
+    "How does inflation influence mortgage rates?",
+]
+
+
+def load_corpus(path=None, limit=None):
+    """
+    Load chunk texts for a benchmark
+    :param path: .jsonl file with a "text" or "page_content" field per line, or a .txt file with
+        one chunk per blank-line separated paragraph. Defaults to the persisted Chroma collection.
+    :param limit: optional maximum number of chunks
+    :return: list of chunk texts
+    """
+    if path:
+        path = Path(path)
+        if path.suffix == ".jsonl":
+            texts = []
+            with path.open(encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        texts.append(record.get("text") or record.get("page_content", ""))
+        else:
+            texts = [p.strip() for p in path.read_text(encoding="utf-8").split("\n\n")]
+    else:
+        import chromadb
+        from rag import CHUNK_STORE, COLLECTION_NAME, VECTORSTORE_DIR
+        client = chromadb.PersistentClient(path=str(VECTORSTORE_DIR))
+        stored = client.get_collection(COLLECTION_NAME).get(include=["documents"])
+        texts = stored["documents"]
+        if CHUNK_STORE == "zstd":
+            from chunk_store import CompressedChunkStore
+            texts = CompressedChunkStore(VECTORSTORE_DIR / f"{COLLECTION_NAME}_chunks.sqlite3").get(stored["ids"])
+
+    texts = [t for t in texts if t and t.strip()]
+    return texts[:limit] if limit else texts
+
+
+def save_corpus(texts, path):
+    with Path(path).open("w", encoding="utf-8") as f:
+        for text in texts:
+            f.write(json.dumps({"text": text}) + "\n")
+
+
+def embed_corpus(texts, queries, model_name=None, backend="torch", cache=None):
+    """
+    Embed a corpus and query set once, optionally caching the vectors in an .npz file
+    :return: (corpus vectors, query vectors) as float32 arrays
+    """
+    if cache and Path(cache).exists():
+        with np.load(cache) as data:
+            if len(data["corpus"]) == len(texts) and len(data["queries"]) == len(queries):
+                return data["corpus"], data["queries"]
+
+    from embeddings import get_embeddings
+    from rag import EMBEDDING_MODEL
+    ef = get_embeddings(model_name or EMBEDDING_MODEL, backend=backend)
+    corpus = np.asarray(ef.embed_documents(texts), dtype=np.float32)
+    query_vectors = np.asarray(ef.embed_documents(queries), dtype=np.float32)
+    if cache:
+        np.savez(cache, corpus=corpus, queries=query_vectors)
+    return corpus, query_vectors
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def exact_top_k(query_vectors, corpus_vectors, k):
+    """Brute-force cosine top-k, used as ground truth"""
+    scores = normalize(query_vectors) @ normalize(corpus_vectors).T
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def recall_at_k(reference, candidates):
+    """Mean fraction of the reference neighbours found in the candidate lists"""
+    hits = [len(set(ref) & set(cand)) / max(len(ref), 1) for ref, cand in zip(reference, candidates)]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def latency_summary(seconds):
+    values = np.asarray(seconds, dtype=np.float64) * 1000
+    if values.size == 0:
+        return {"count": 0}
+    return {
+        "count": int(values.size),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(results, path=None):
+    """Print benchmark results as JSON and optionally save them to a file"""
+    payload = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    text = json.dumps(payload, indent=2)
+    print(text)
+    if path:
+        Path(path).write_text(text + "\n", encoding="utf-8")
+    return payload
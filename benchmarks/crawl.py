@@ -0,0 +1,94 @@
+"""
+Crawl-mode ingest throughput on a generated documentation site.
+
+A site of --pages linked HTML pages (plus robots.txt and sitemap.xml) is written
+to a temporary directory and served locally, then crawled and indexed with
+rag.process_crawl into a temporary vector store. Reports pages per minute for
+the whole ingest (fetching overlapped with cleaning, splitting and embedding).
+
+    python -m benchmarks.crawl --pages 300 --host-delay 0.05 --workers 8
+"""
+import argparse
+import logging
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.common import write_results
+from benchmarks.fakes import FakeChatGroq, serve_fixture_pages
+
+WORDS = (
+    "mortgage rate fixed adjustable loan interest payment credit score refinance lender apr points "
+    "escrow closing term principal borrower down payment insurance jumbo conforming survey weekly"
+).split()
+
+
+def build_site(directory, pages, links_per_page=6, words_per_page=600, seed=0):
+    """Write a site of linked pages with a sitemap listing half of them"""
+    rng = random.Random(seed)
+    docs = Path(directory) / "docs"
+    docs.mkdir(parents=True, exist_ok=True)
+    for i in range(pages):
+        links = "".join(f'<a href="/docs/page{j}.html">Page {j}</a> ' for j in rng.sample(range(pages), links_per_page))
+        body = " ".join(rng.choice(WORDS) for _ in range(words_per_page))
+        (docs / f"page{i}.html").write_text(
+            f"<html><head><title>Page {i}</title></head><body><nav>{links}</nav><p>Page {i}. {body}</p></body></html>"
+        )
+    (Path(directory) / "index.html").write_text(
+        "<html><body><p>" + " ".join(rng.choice(WORDS) for _ in range(200)) + "</p>"
+        + "".join(f'<a href="/docs/page{i}.html">Page {i}</a>' for i in range(0, pages, 10)) + "</body></html>"
+    )
+    (Path(directory) / "robots.txt").write_text("User-agent: *\nAllow: /\n")
+    return [f"/docs/page{i}.html" for i in range(0, pages, 2)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300, help="pages in the generated site")
+    parser.add_argument("--max-depth", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--host-delay", type=float, default=0.05)
+    parser.add_argument("--batch-pages", type=int, default=20)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    import rag
+
+    logging.getLogger().setLevel(args.log_level)
+    rag.VECTORSTORE_DIR = Path(tempfile.mkdtemp(prefix="docubot-bench-"))
+    rag.llm = FakeChatGroq()
+    rag.CRAWL_WORKERS = args.workers
+    rag.CRAWL_HOST_DELAY = args.host_delay
+    rag.CRAWL_BATCH_PAGES = args.batch_pages
+
+    site = tempfile.mkdtemp(prefix="docubot-site-")
+    sitemap_paths = build_site(site, args.pages)
+    with serve_fixture_pages(site) as (base_url, _):
+        sitemap = "".join(f"<url><loc>{base_url}{path}</loc></url>" for path in sitemap_paths)
+        (Path(site) / "sitemap.xml").write_text(
+            f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{sitemap}</urlset>'
+        )
+
+        start = time.perf_counter()
+        statuses = list(rag.process_crawl([base_url + "/"], max_depth=args.max_depth, max_pages=args.pages + 1))
+        seconds = time.perf_counter() - start
+
+    errors = [status for status in statuses if status.startswith("Error")]
+    if errors:
+        raise RuntimeError(errors[0])
+    indexed = len({m["source"] for m in rag.vector_store.get(include=["metadatas"])["metadatas"]})
+    write_results({
+        "site_pages": args.pages + 1,
+        "pages_indexed": indexed,
+        "chunks": rag.vector_store._collection.count(),
+        "workers": args.workers,
+        "host_delay_seconds": args.host_delay,
+        "seconds": round(seconds, 2),
+        "pages_per_minute": round(60 * indexed / seconds, 1),
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Compare embedding backends on throughput, resident memory and retrieval recall.
+
+Each backend runs in its own process so the reported peak RSS only covers that
+backend's model. Recall@k is measured against the PyTorch baseline: the top-k
+chunks each backend retrieves for the fixed query set are compared with the
+top-k chunks the "torch" backend retrieves.
+
+    python -m benchmarks.embedding_backends --corpus chunks.jsonl --backends torch onnx onnx-int8
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+
+import numpy as np
+
+from benchmarks.common import DEFAULT_QUERIES, exact_top_k, latency_summary, load_corpus, recall_at_k, write_results
+
+
+def _run_backend(backend, model_name, texts, queries, num_threads):
+    from embeddings import get_embeddings
+
+    start = time.perf_counter()
+    ef = get_embeddings(model_name, backend=backend, num_threads=num_threads)
+    load_seconds = time.perf_counter() - start
+
+    ef.embed_documents(texts[:8])  # Warm-up
+
+    start = time.perf_counter()
+    doc_vectors = np.asarray(ef.embed_documents(texts), dtype=np.float32)
+    embed_seconds = time.perf_counter() - start
+
+    query_vectors, query_latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        query_vectors.append(ef.embed_query(query))
+        query_latencies.append(time.perf_counter() - start)
+
+    return {
+        "load_seconds": load_seconds,
+        "embed_seconds": embed_seconds,
+        "query_latencies": query_latencies,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "doc_vectors": doc_vectors,
+        "query_vectors": np.asarray(query_vectors, dtype=np.float32),
+    }
+
+
+def main():
+    from rag import EMBEDDING_MODEL
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="chunk corpus (.jsonl or .txt); defaults to the persisted collection")
+    parser.add_argument("--limit", type=int, default=1000, help="maximum number of chunks to embed")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--threads", type=int, default=None, help="ONNX Runtime intra-op threads")
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus, limit=args.limit)
+    if not texts:
+        raise SystemExit("Corpus is empty, ingest some URLs or pass --corpus")
+
+    backends = list(dict.fromkeys(["torch"] + args.backends))  # The baseline always runs first
+    ctx = multiprocessing.get_context("spawn")
+    runs = {}
+    for backend in backends:
+        print(f"Running {backend} on {len(texts)} chunks...")
+        with ctx.Pool(1) as pool:
+            runs[backend] = pool.apply(_run_backend, (backend, args.model, texts, DEFAULT_QUERIES, args.threads))
+
+    baseline = runs["torch"]
+    baseline_top = exact_top_k(baseline["query_vectors"], baseline["doc_vectors"], args.k)
+
+    results = []
+    for backend in backends:
+        run = runs[backend]
+        top = exact_top_k(run["query_vectors"], run["doc_vectors"], args.k)
+        agreement = np.sum(run["doc_vectors"] * baseline["doc_vectors"], axis=1) / (
+            np.linalg.norm(run["doc_vectors"], axis=1) * np.linalg.norm(baseline["doc_vectors"], axis=1)
+        )
+        results.append({
+            "backend": backend,
+            "chunks": len(texts),
+            "load_seconds": round(run["load_seconds"], 2),
+            "chunks_per_second": round(len(texts) / run["embed_seconds"], 2),
+            "query_latency": latency_summary(run["query_latencies"]),
+            "peak_rss_mb": round(run["peak_rss_mb"], 1),
+            f"recall_at_{args.k}_vs_torch": round(recall_at_k(baseline_top, top), 4),
+            "mean_cosine_vs_torch": round(float(agreement.mean()), 4),
+        })
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
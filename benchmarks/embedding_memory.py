@@ -0,0 +1,187 @@
+"""
+Total memory of 1/4/8 worker processes that embed questions, with the model
+loaded in every worker, preloaded before fork, or in the embedding sidecar.
+
+- in_process: each worker is spawned and loads its own copy of the model,
+  which is what `uvicorn --workers N` does today
+- preload_fork: one parent loads the model and forks the workers, so the
+  weights sit in copy-on-write pages shared by all of them (gunicorn --preload)
+- sidecar: embedding_server.EmbeddingServer holds the only copy and workers
+  use RemoteEmbeddings over its Unix socket (EMBEDDING_SOCKET)
+
+Each worker embeds `--queries` questions one at a time, all workers at once.
+While they are all still alive, the script reads RSS, PSS and USS of every
+process involved (workers, preloading parent, sidecar). RSS counts shared
+pages once per process, so its total overstates real use; PSS splits each
+shared page between the processes that map it, so the PSS total is the memory
+the deployment actually takes.
+
+    python -m benchmarks.embedding_memory --backend onnx --workers 1 4 8
+    python -m benchmarks.embedding_memory --backend synthetic --vocab 200000   # offline, no model download
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.common import DEFAULT_QUERIES, latency_summary, write_results
+
+MODES = ["in_process", "preload_fork", "sidecar"]
+
+
+def load_model(backend, model_name, vocab):
+    if backend == "synthetic":
+        from benchmarks.fakes import CpuBoundEmbeddings
+        return CpuBoundEmbeddings(vocab=vocab)
+    from embeddings import get_embeddings
+    return get_embeddings(model_name, backend=backend)
+
+
+def run_queries(model, queries, ready, start_event, exit_event, results):
+    model.embed_query(queries[0])  # Warm-up
+    ready.put(os.getpid())
+    start_event.wait()
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        model.embed_query(query)
+        latencies.append(time.perf_counter() - start)
+    results.put(latencies)
+    # Stay alive until memory has been read, so shared pages are split between all workers
+    exit_event.wait()
+
+
+def in_process_worker(spec, queries, ready, start_event, exit_event, results):
+    run_queries(load_model(*spec), queries, ready, start_event, exit_event, results)
+
+
+def sidecar_worker(socket_path, queries, ready, start_event, exit_event, results):
+    from embedding_server import RemoteEmbeddings
+    run_queries(RemoteEmbeddings(socket_path), queries, ready, start_event, exit_event, results)
+
+
+def preload_parent(spec, workers, queries, ready, start_event, exit_event, results):
+    model = load_model(*spec)
+    model.embed_query(queries[0])
+    context = multiprocessing.get_context("fork")
+    children = [
+        context.Process(target=run_queries, args=(model, queries, ready, start_event, exit_event, results))
+        for _ in range(workers)
+    ]
+    for child in children:
+        child.start()
+    # Only after forking: children would inherit the state of the queue's feeder thread, but not the thread
+    ready.put(os.getpid())
+    for child in children:
+        child.join()
+
+
+def sidecar_server(spec, socket_path, ready, exit_event):
+    from embedding_server import EmbeddingServer
+
+    server = EmbeddingServer(load_model(*spec), socket_path)
+    ready.put(os.getpid())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    exit_event.wait()
+    server.server_close()
+
+
+def memory_mb(pids):
+    import psutil
+
+    totals = {"rss_mb": 0.0, "pss_mb": 0.0, "uss_mb": 0.0}
+    for pid in pids:
+        memory = psutil.Process(pid).memory_full_info()
+        totals["rss_mb"] += memory.rss / 2 ** 20
+        totals["pss_mb"] += getattr(memory, "pss", memory.uss) / 2 ** 20
+        totals["uss_mb"] += memory.uss / 2 ** 20
+    return {name: round(value, 1) for name, value in totals.items()}
+
+
+def run_mode(mode, workers, spec, queries):
+    context = multiprocessing.get_context("spawn")
+    ready, results = context.Queue(), context.Queue()
+    start_event, exit_event = context.Event(), context.Event()
+    processes = []
+
+    if mode == "preload_fork":
+        processes.append(context.Process(
+            target=preload_parent, args=(spec, workers, queries, ready, start_event, exit_event, results)
+        ))
+        expected = workers + 1
+    elif mode == "sidecar":
+        socket_path = str(Path(tempfile.mkdtemp(prefix="docubot-embed-")) / "embedding.sock")
+        processes.append(context.Process(target=sidecar_server, args=(spec, socket_path, ready, exit_event)))
+        processes += [
+            context.Process(target=sidecar_worker,
+                            args=(socket_path, queries, ready, start_event, exit_event, results))
+            for _ in range(workers)
+        ]
+        expected = workers + 1
+    else:
+        processes += [
+            context.Process(target=in_process_worker, args=(spec, queries, ready, start_event, exit_event, results))
+            for _ in range(workers)
+        ]
+        expected = workers
+
+    load_start = time.perf_counter()
+    for process in processes:
+        process.start()
+    pids = [ready.get() for _ in range(expected)]
+    startup_seconds = time.perf_counter() - load_start
+
+    wall_start = time.perf_counter()
+    start_event.set()
+    latencies = [seconds for _ in range(workers) for seconds in results.get()]
+    wall_seconds = time.perf_counter() - wall_start
+    memory = memory_mb(pids)
+    exit_event.set()
+    for process in processes:
+        process.join()
+
+    return {
+        "mode": mode,
+        "workers": workers,
+        "processes": len(pids),
+        "startup_seconds": round(startup_seconds, 2),
+        **{f"total_{name}": value for name, value in memory.items()},
+        "pss_mb_per_worker": round(memory["pss_mb"] / workers, 1),
+        "queries_per_second": round(len(latencies) / wall_seconds, 1),
+        "latency": latency_summary(latencies),
+    }
+
+
+def main():
+    from rag import EMBEDDING_MODEL
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="torch", help="embedding backend, or 'synthetic' for a CPU-bound stand-in")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--vocab", type=int, default=100000,
+                        help="rows of the synthetic model's token table, which sets its weight size")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--queries", type=int, default=50, help="questions embedded per worker")
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    spec = (args.backend, args.model, args.vocab)
+    queries = [DEFAULT_QUERIES[i % len(DEFAULT_QUERIES)] for i in range(args.queries)]
+    results = []
+    for mode in args.modes:
+        for workers in args.workers:
+            result = run_mode(mode, workers, spec, queries)
+            results.append(result)
+            print(f"{mode:>12} x{workers}: PSS {result['total_pss_mb']} MB "
+                  f"(RSS {result['total_rss_mb']} MB) over {result['processes']} processes, "
+                  f"query p50 {result['latency']['p50_ms']} ms, {result['queries_per_second']} q/s")
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Query embedding latency while an ingest is embedding chunks, with and without
+the embedding scheduler.
+
+An ingest thread embeds `--chunks` chunks while questions arrive every
+`--query-interval` seconds and are embedded one at a time, the way
+retrieve_documents does it. In "shared" mode both go straight to the model. In
+"scheduled" mode they go through embedding_scheduler.EmbeddingScheduler, where
+ingest batches yield to pending query embeddings. "idle" measures query latency
+with no ingest running.
+
+    python -m benchmarks.embedding_priority --backend onnx-int8 --chunks 2000
+    python -m benchmarks.embedding_priority --backend synthetic   # offline, no model download
+"""
+import argparse
+import random
+import threading
+import time
+
+from benchmarks.common import DEFAULT_QUERIES, latency_summary, write_results
+
+
+def make_chunks(count):
+    rng = random.Random(0)
+    words = " ".join(DEFAULT_QUERIES).lower().split()
+    return [" ".join(rng.choice(words) for _ in range(80)) for _ in range(count)]
+
+
+def run_mode(mode, model, chunks, args):
+    from embedding_scheduler import EmbeddingScheduler
+
+    ef = model
+    if mode == "scheduled":
+        ef = EmbeddingScheduler(model, query_threads=args.query_threads, ingest_threads=args.ingest_threads,
+                                ingest_batch_size=args.ingest_batch)
+
+    ingest = {}
+
+    def run_ingest():
+        start = time.perf_counter()
+        ef.embed_documents(chunks)
+        ingest["seconds"] = time.perf_counter() - start
+
+    thread = threading.Thread(target=run_ingest)
+    if mode != "idle":
+        thread.start()
+
+    latencies = []
+    rng = random.Random(1)
+    deadline = time.perf_counter() + args.idle_seconds
+    while (thread.is_alive() if mode != "idle" else time.perf_counter() < deadline):
+        start = time.perf_counter()
+        ef.embed_query(rng.choice(DEFAULT_QUERIES))
+        latencies.append(time.perf_counter() - start)
+        time.sleep(args.query_interval)
+    if mode != "idle":
+        thread.join()
+
+    result = {"mode": mode, "query_latency": latency_summary(latencies)}
+    if mode != "idle":
+        result["ingest_seconds"] = round(ingest["seconds"], 2)
+        result["ingest_chunks_per_second"] = round(len(chunks) / ingest["seconds"], 1)
+    return result
+
+
+def main():
+    from rag import EMBEDDING_MODEL
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="torch", help="embedding backend, or 'synthetic' for a CPU-bound stand-in")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--chunks", type=int, default=2000, help="chunks embedded by the ingest")
+    parser.add_argument("--query-interval", type=float, default=0.1, help="seconds between questions")
+    parser.add_argument("--idle-seconds", type=float, default=10.0, help="duration of the idle run")
+    parser.add_argument("--query-threads", type=int, default=None)
+    parser.add_argument("--ingest-threads", type=int, default=None)
+    parser.add_argument("--ingest-batch", type=int, default=16)
+    parser.add_argument("--modes", nargs="+", default=["idle", "shared", "scheduled"],
+                        choices=["idle", "shared", "scheduled"])
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    if args.backend == "synthetic":
+        from benchmarks.fakes import CpuBoundEmbeddings
+        model = CpuBoundEmbeddings()
+    else:
+        from embeddings import get_embeddings
+        model = get_embeddings(args.model, backend=args.backend)
+    model.embed_documents(make_chunks(8))  # Warm-up
+
+    chunks = make_chunks(args.chunks)
+    results = []
+    for mode in args.modes:
+        results.append(run_mode(mode, model, chunks, args))
+        latency = results[-1]["query_latency"]
+        print(f"{mode}: query p50 {latency.get('p50_ms')} ms, p99 {latency.get('p99_ms')} ms"
+              + (f", ingest {results[-1]['ingest_chunks_per_second']} chunks/s" if mode != "idle" else ""))
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
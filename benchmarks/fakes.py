@@ -0,0 +1,262 @@
+"""
+Offline stand-ins for the network dependencies of the RAG pipeline: a local
+HTTP server for the saved fixture pages, a deterministic fake of ChatGroq,
+a fake Groq (OpenAI-compatible) HTTP server with quota enforcement and a
+CPU-bound stand-in for the embedding model.
+"""
+import functools
+import http.server
+import json
+import random
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+FIXTURE_PAGES_DIR = Path(__file__).parent / "fixtures" / "pages"
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_fixture_pages(directory=FIXTURE_PAGES_DIR):
+    """
+    Serve saved HTML pages from a local HTTP server
+    :return: (base url, list of page urls)
+    """
+    handler = functools.partial(_QuietHandler, directory=str(directory))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = [f"{base_url}/{page.name}" for page in sorted(Path(directory).glob("*.html"))]
+    try:
+        yield base_url, urls
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class FakeChatGroq(BaseChatModel):
+    """
+    Deterministic ChatGroq replacement. It sleeps for a fixed latency plus a
+    per-token delay and answers with a canned sentence, reporting token usage
+    the way ChatGroq does.
+    """
+    latency: float = 0.05
+    seconds_per_token: float = 0.0
+    answer: str = "Based on the available information, the average 30-year fixed mortgage rate was 6.35% this week."
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-groq"
+
+    def _usage(self, messages):
+        prompt_tokens = sum(len(str(m.content).split()) for m in messages)
+        completion_tokens = len(self.answer.split())
+        return {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def _generate(self, messages: List[Any], stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        usage = self._usage(messages)
+        time.sleep(self.latency + self.seconds_per_token * usage["output_tokens"])
+        message = AIMessage(
+            content=self.answer,
+            usage_metadata=usage,
+            response_metadata={"token_usage": {
+                "prompt_tokens": usage["input_tokens"],
+                "completion_tokens": usage["output_tokens"],
+                "total_tokens": usage["total_tokens"],
+            }}
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class CpuBoundEmbeddings(Embeddings):
+    """
+    Deterministic stand-in for a transformer encoder: a few dense layers over a
+    fixed number of token vectors per text, so the CPU cost per text and per
+    batch behaves like a real model without downloading one
+    :param dim: embedding size
+    :param tokens: token positions per text
+    :param layers: dense layers, each about 2 * tokens * dim^2 FLOPs per text
+    """
+
+    def __init__(self, dim=768, tokens=64, layers=6, batch_size=32, vocab=4096, seed=0):
+        rng = np.random.default_rng(seed)
+        self.tokens = tokens
+        self.batch_size = batch_size
+        self.table = rng.standard_normal((vocab, dim)).astype(np.float32)
+        self.weights = [(rng.standard_normal((dim, dim)) / np.sqrt(dim)).astype(np.float32) for _ in range(layers)]
+
+    def _token_ids(self, text):
+        ids = [zlib.crc32(word.encode()) % len(self.table) for word in text.lower().split()][:self.tokens]
+        return ids + [0] * (self.tokens - len(ids))
+
+    def _encode(self, texts):
+        hidden = self.table[np.array([self._token_ids(text) for text in texts])]
+        for weight in self.weights:
+            hidden = np.tanh(hidden @ weight)
+        pooled = hidden.mean(axis=1)
+        return pooled / np.linalg.norm(pooled, axis=1, keepdims=True)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        return [
+            vector.tolist()
+            for start in range(0, len(texts), self.batch_size)
+            for vector in self._encode(texts[start:start + self.batch_size])
+        ]
+
+    def embed_query(self, text):
+        return self._encode([text])[0].tolist()
+
+
+class _FakeLLMHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        from llm_gateway import estimate_tokens
+
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.rstrip("/") != "/openai/v1/chat/completions":
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        prompt = "".join(str(m.get("content", "")) for m in request.get("messages", []))
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(server.answer)
+        with server.stats_lock:
+            server.stats["requests"] += 1
+            model = request.get("model", "fake")
+            server.stats["models"][model] = server.stats["models"].get(model, 0) + 1
+
+        # Enforce the quota the way the provider does: reject with 429 and Retry-After
+        request_wait = server.request_quota.reserve(1, max_wait=0)
+        token_wait = None
+        if request_wait is not None:
+            token_wait = server.token_quota.reserve(prompt_tokens + completion_tokens, max_wait=0)
+            if token_wait is None:
+                server.request_quota.refund(1)
+        if request_wait is None or token_wait is None:
+            with server.stats_lock:
+                server.stats["rate_limited"] += 1
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}},
+                            headers={"retry-after": "1"})
+            return
+        if random.random() < server.error_rate:
+            with server.stats_lock:
+                server.stats["server_errors"] += 1
+            self._send_json(503, {"error": {"message": "Service unavailable", "type": "internal_server_error"}})
+            return
+
+        with server.stats_lock:
+            server.stats["in_flight"] += 1
+            server.stats["max_in_flight"] = max(server.stats["max_in_flight"], server.stats["in_flight"])
+        try:
+            time.sleep(server.model_latency.get(request.get("model"), server.latency))
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }
+            if not request.get("stream"):
+                self._send_json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "fake"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": server.answer}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            words = server.answer.split(" ")
+            for i, word in enumerate(words):
+                delta = {"content": word if i == 0 else " " + word}
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": request.get("model", "fake"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "x_groq": {"id": completion_id, "usage": usage},
+            }
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            self.close_connection = True
+        finally:
+            with server.stats_lock:
+                server.stats["in_flight"] -= 1
+
+
+@contextmanager
+def serve_fake_llm(tokens_per_minute=6000, requests_per_minute=30, latency=0.2, error_rate=0.0,
+                   answer=FakeChatGroq.model_fields["answer"].default, model_latency=None):
+    """
+    Serve a Groq-compatible chat completions endpoint that enforces a token and
+    request quota with 429 responses, like the real API
+    :param error_rate: fraction of admitted requests answered with a 503
+    :param model_latency: seconds per answer by requested model name, overriding latency
+    :return: (base url for ChatGroq(base_url=...), server; server.stats counts requests, 429s and 503s)
+    """
+    from llm_gateway import TokenBucket
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _FakeLLMHandler)
+    server.daemon_threads = True
+    server.token_quota = TokenBucket(tokens_per_minute)
+    server.request_quota = TokenBucket(requests_per_minute)
+    server.latency = latency
+    server.model_latency = model_latency or {}
+    server.error_rate = error_rate
+    server.answer = answer
+    server.stats_lock = threading.Lock()
+    server.stats = {"requests": 0, "rate_limited": 0, "server_errors": 0, "in_flight": 0, "max_in_flight": 0, "models": {}}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}", server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,130 @@
+"""
+Fetch time of repeated ingests with the default fetch strategy order versus
+the order learned per domain (FETCH_STRATEGY_MEMORY).
+
+The fixture pages are served as three local "sites", told apart by host name
+(127.0.0.1, 127.0.0.2 and 127.0.0.3 all reach the same server):
+
+- open: answers every client
+- curl-only: answers 403 unless the User-Agent is curl, like sites that block
+  browser-looking scrapers
+- mobile-only: answers 403 unless the User-Agent is a phone
+
+Unstructured refuses loopback addresses, so its strategies fail on all three,
+like on a site whose markup it cannot read. Every page is fetched `--runs`
+times with fetch_strategies.PageFetcher, once without history and once with
+a StrategyStats database that carries over from run to run. The pause between
+requests-based retries is `--retry-delay` (2 seconds in process_urls).
+
+    python -m benchmarks.fetch_strategies --runs 3 --retry-delay 2
+"""
+import argparse
+import functools
+import http.server
+import logging
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from benchmarks.common import latency_summary, write_results
+from benchmarks.fakes import FIXTURE_PAGES_DIR
+
+SITES = {"127.0.0.1": "open", "127.0.0.2": "curl-only", "127.0.0.3": "mobile-only"}
+
+
+class _SiteHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        site = SITES.get(self.headers.get("Host", "").split(":")[0], "open")
+        user_agent = self.headers.get("User-Agent", "")
+        if (site == "curl-only" and not user_agent.startswith("curl/")) or \
+                (site == "mobile-only" and "iPhone" not in user_agent):
+            self.send_error(403)
+            return
+        super().do_GET()
+
+
+@contextmanager
+def serve_sites():
+    """:return: dict of site -> page urls"""
+    handler = functools.partial(_SiteHandler, directory=str(FIXTURE_PAGES_DIR))
+    server = http.server.ThreadingHTTPServer(("", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    pages = sorted(page.name for page in Path(FIXTURE_PAGES_DIR).glob("*.html"))
+    try:
+        yield {site: [f"http://{host}:{port}/{page}" for page in pages] for host, site in SITES.items()}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def run_mode(mode, sites, runs, retry_delay):
+    from fetch_strategies import PageFetcher, StrategyStats
+
+    stats = StrategyStats(Path(tempfile.mkdtemp(prefix="docubot-fetch-")) / "fetch_stats.sqlite3") \
+        if mode == "learned" else None
+    attempts_before = _attempts()
+    results = []
+    for run in range(1, runs + 1):
+        fetcher = PageFetcher(stats, retry_delay=retry_delay)
+        for site, urls in sites.items():
+            seconds, strategies = [], Counter()
+            for url in urls:
+                start = time.perf_counter()
+                doc, strategy = fetcher.fetch(url)
+                seconds.append(time.perf_counter() - start)
+                strategies[strategy or "failed"] += 1
+            results.append({
+                "mode": mode,
+                "run": run,
+                "site": site,
+                "pages": len(urls),
+                "fetch_seconds": round(sum(seconds), 2),
+                "per_page": latency_summary(seconds),
+                "strategies": dict(strategies),
+            })
+        fetcher.close()
+        attempts = _attempts()
+        results.append({"mode": mode, "run": run, "attempts": attempts - attempts_before})
+        attempts_before = attempts
+    return results
+
+
+def _attempts():
+    from fetch_strategies import DEFAULT_ORDER, FETCH_ATTEMPTS
+
+    return sum(FETCH_ATTEMPTS.value(strategy=strategy, outcome=outcome)
+               for strategy in DEFAULT_ORDER for outcome in ("success", "failure"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="ingests of every page per mode")
+    parser.add_argument("--retry-delay", type=float, default=2.0, help="seconds between requests-based retries of a URL")
+    parser.add_argument("--log-level", default="ERROR")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    results = []
+    with serve_sites() as sites:
+        for mode in ("default", "learned"):
+            mode_results = run_mode(mode, sites, args.runs, args.retry_delay)
+            results += mode_results
+            for run in range(1, args.runs + 1):
+                rows = [r for r in mode_results if r["run"] == run and "site" in r]
+                attempts = next(r["attempts"] for r in mode_results if r["run"] == run and "attempts" in r)
+                print(f"{mode:>8} run {run}: {attempts} fetch attempts, "
+                      + ", ".join(f"{r['site']} {r['fetch_seconds']}s" for r in rows))
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
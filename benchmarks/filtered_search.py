@@ -0,0 +1,133 @@
+"""
+Query latency of scoped questions (metadata pre-filters) versus searching the
+whole collection, as the collection grows.
+
+For every collection size a persistent collection of random vectors is built,
+spread over `--domains` domains and `--days` ingest days with the metadata that
+index_documents writes. Each query runs the search that search_documents
+issues (fetch_k results with documents, metadatas and embeddings), unfiltered,
+filtered to one domain, and filtered to chunks ingested on the last day.
+
+Filtered queries are timed twice: resolved by Chroma's `where`, and through
+ScopeCache (the first query of a filter loads it, later ones are served from
+memory). "overlap" is the share of Chroma's results the cache also returned;
+the cache searches exactly, Chroma's filtered HNSW search is approximate.
+
+    python -m benchmarks.filtered_search --sizes 10000 50000 100000 --domains 20
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import latency_summary, write_results
+from chunk_metadata import ScopeCache, build_where
+
+BATCH_SIZE = 2000
+DAY = 86400
+
+
+def build_collection(client, size, dim, domains, days, rng):
+    collection = client.create_collection(f"filtered-{size}", embedding_function=None)
+    now = int(time.time())
+    for start in range(0, size, BATCH_SIZE):
+        count = min(BATCH_SIZE, size - start)
+        ids = [str(i) for i in range(start, start + count)]
+        collection.add(
+            ids=ids,
+            embeddings=rng.standard_normal((count, dim)).astype(np.float32).tolist(),
+            documents=[f"chunk {i}" for i in ids],
+            metadatas=[{
+                "source": f"https://site{i % domains}.example/page{i // domains % 50}",
+                "domain": f"site{i % domains}.example",
+                "ingested_at": now - (i % days) * DAY,
+                "doc_hash": f"{i // 20:016x}",
+                "position": i % 20,
+            } for i in range(start, start + count)]
+        )
+    return collection, now
+
+
+def time_queries(search, queries):
+    latencies = []
+    returned = []
+    for query in queries:
+        start = time.perf_counter()
+        results = search(query)
+        latencies.append(time.perf_counter() - start)
+        returned.append(results["ids"][0])
+    return latencies, returned
+
+
+def main():
+    import chromadb
+
+    from vector_backend import SharedCollection
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--domains", type=int, default=20)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--fetch-k", type=int, default=12)
+    parser.add_argument("--scope-cache-chunks", type=int, default=20000)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    workdir = tempfile.mkdtemp(prefix="docubot-filtered-")
+    results = []
+    try:
+        client = chromadb.PersistentClient(path=workdir)
+        for size in args.sizes:
+            collection, now = build_collection(client, size, args.dim, args.domains, args.days, rng)
+            scopes = {
+                "none": None,
+                "domain": build_where({"domain": "site0.example"}),
+                "last_day": build_where({"ingested_after": now - DAY + 1}),
+            }
+            shared = SharedCollection(client, collection.name)
+            for scope, where in scopes.items():
+                def chroma_search(query):
+                    return collection.query(query_embeddings=[query.tolist()], n_results=args.fetch_k, where=where,
+                                            include=["documents", "metadatas", "embeddings"])
+
+                time_queries(chroma_search, queries[:5])  # Warm-up
+                latencies, chroma_ids = time_queries(chroma_search, queries)
+                result = {
+                    "chunks": size,
+                    "filter": scope,
+                    "matching_chunks": size if where is None else len(collection.get(where=where, include=[])["ids"]),
+                    "latency": latency_summary(latencies),
+                }
+                if where is not None:
+                    cache = ScopeCache(max_chunks=args.scope_cache_chunks)
+                    load_start = time.perf_counter()
+                    cache.query(shared, where, queries[:1], args.fetch_k)
+                    result["scope_cache_load_ms"] = round((time.perf_counter() - load_start) * 1000, 1)
+                    latencies, cached_ids = time_queries(
+                        lambda query: cache.query(shared, where, query[None, :], args.fetch_k), queries
+                    )
+                    result["scope_cache_latency"] = latency_summary(latencies)
+                    result["scope_cache_overlap"] = round(float(np.mean([
+                        len(set(a) & set(b)) / max(len(a), 1) for a, b in zip(chroma_ids, cached_ids)
+                    ])), 3)
+                results.append(result)
+                print(f"{size} chunks, filter {scope} ({result['matching_chunks']} match): "
+                      f"p50 {result['latency']['p50_ms']} ms, p99 {result['latency']['p99_ms']} ms"
+                      + (f"; scope cache p50 {result['scope_cache_latency']['p50_ms']} ms, "
+                         f"p99 {result['scope_cache_latency']['p99_ms']} ms, load {result['scope_cache_load_ms']} ms, "
+                         f"overlap {result['scope_cache_overlap']}" if where is not None else ""))
+            client.delete_collection(collection.name)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Sweep Chroma HNSW parameters over a saved chunk corpus.
+
+For every (space, M, construction_ef) combination an in-memory collection is
+built from the corpus embeddings and queried at each search_ef. Results are
+compared with brute-force search in the same distance space.
+
+search_ef is applied per query the same way generate_answer does it: hnswlib
+searches with ef = max(search_ef, n_results), so each query asks for
+max(k, search_ef) results and keeps the first k.
+
+    python -m benchmarks.hnsw_sweep --corpus chunks.jsonl --embeddings-cache chunks.npz \\
+        --m 8 16 32 --construction-ef 64 128 256 --search-ef 10 50 100 200
+"""
+import argparse
+import itertools
+import time
+import uuid
+
+import numpy as np
+
+from benchmarks.common import DEFAULT_QUERIES, embed_corpus, latency_summary, load_corpus, recall_at_k, write_results
+
+BATCH_SIZE = 1000
+
+
+def brute_force_top_k(queries, corpus, k, space):
+    if space == "l2":
+        scores = 2 * queries @ corpus.T - (corpus ** 2).sum(axis=1)[None, :]
+    elif space == "cosine":
+        q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        c = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+        scores = q @ c.T
+    else:
+        scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def main():
+    import chromadb
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="chunk corpus (.jsonl or .txt); defaults to the persisted collection")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--embeddings-cache", help=".npz file to cache corpus and query embeddings")
+    parser.add_argument("--space", nargs="+", default=["l2"], choices=["l2", "cosine", "ip"])
+    parser.add_argument("--m", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[64, 100, 200])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--sample-queries", type=int, default=200,
+                        help="extra queries sampled from the corpus vectors, on top of the fixed query set")
+    parser.add_argument("--k", type=int, default=12, help="neighbours per query (fetch_k in generate_answer)")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus, limit=args.limit)
+    if not texts:
+        raise SystemExit("Corpus is empty, ingest some URLs or pass --corpus")
+    corpus, queries = embed_corpus(texts, DEFAULT_QUERIES, cache=args.embeddings_cache)
+
+    rng = np.random.RandomState(0)
+    sample = rng.choice(len(corpus), size=min(args.sample_queries, len(corpus)), replace=False)
+    noise = rng.normal(scale=0.01, size=(len(sample), corpus.shape[1])).astype(np.float32)
+    queries = np.vstack([queries, corpus[sample] + noise])
+    ids = [str(i) for i in range(len(corpus))]
+
+    client = chromadb.EphemeralClient()
+    results = []
+    for space, m, construction_ef in itertools.product(args.space, args.m, args.construction_ef):
+        reference = brute_force_top_k(queries, corpus, args.k, space)
+        name = f"hnsw-sweep-{uuid.uuid4().hex[:8]}"
+        collection = client.create_collection(
+            name,
+            embedding_function=None,
+            metadata={"hnsw:space": space, "hnsw:M": m, "hnsw:construction_ef": construction_ef, "hnsw:search_ef": 1}
+        )
+
+        start = time.perf_counter()
+        for i in range(0, len(ids), BATCH_SIZE):
+            collection.add(ids=ids[i:i + BATCH_SIZE], embeddings=corpus[i:i + BATCH_SIZE].tolist())
+        build_seconds = time.perf_counter() - start
+
+        for search_ef in args.search_ef:
+            n_results = max(args.k, search_ef)
+            collection.query(query_embeddings=queries[:1].tolist(), n_results=n_results)  # Warm-up
+
+            latencies, found = [], []
+            for query in queries:
+                start = time.perf_counter()
+                result = collection.query(query_embeddings=[query.tolist()], n_results=n_results, include=[])
+                latencies.append(time.perf_counter() - start)
+                found.append([int(i) for i in result["ids"][0][:args.k]])
+
+            results.append({
+                "space": space,
+                "M": m,
+                "construction_ef": construction_ef,
+                "search_ef": search_ef,
+                "chunks": len(corpus),
+                "build_seconds": round(build_seconds, 3),
+                f"recall_at_{args.k}": round(recall_at_k(reference, found), 4),
+                "search_latency": latency_summary(latencies),
+            })
+            print(f"space={space} M={m} construction_ef={construction_ef} search_ef={search_ef} "
+                  f"recall={results[-1][f'recall_at_{args.k}']} p99={results[-1]['search_latency']['p99_ms']}ms")
+
+        client.delete_collection(name)
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Burst of questions against a quota-enforcing fake Groq server, with and without the LLM gateway.
+
+The fake server in benchmarks/fakes.py speaks the Groq chat completions API and
+answers 429 once its token or request quota is used up, plus an optional share
+of 503s. Both modes fire every question at once through a real ChatGroq client
+with its own retries disabled. Calls go straight to the client in "direct" mode
+and through llm_gateway.LLMGateway, sized to the same quota, in "gateway" mode.
+
+    python -m benchmarks.llm_gateway --questions 60 --tokens-per-minute 20000 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+from benchmarks.common import latency_summary, write_results
+from benchmarks.fakes import serve_fake_llm
+
+
+async def _burst(call, prompts):
+    async def one(prompt):
+        start = time.perf_counter()
+        try:
+            await call(prompt)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, type(e).__name__
+
+    return await asyncio.gather(*(one(prompt) for prompt in prompts))
+
+
+def run_mode(mode, args, prompts):
+    from langchain_groq import ChatGroq
+
+    import llm_gateway
+
+    with serve_fake_llm(tokens_per_minute=args.tokens_per_minute, requests_per_minute=args.requests_per_minute,
+                        latency=args.latency, error_rate=args.error_rate) as (base_url, server):
+        client = ChatGroq(model="llama-3.3-70b-versatile", api_key="fake", base_url=base_url, max_retries=0)
+        if mode == "gateway":
+            gateway = llm_gateway.LLMGateway(
+                client,
+                tokens_per_minute=args.tokens_per_minute,
+                requests_per_minute=args.requests_per_minute,
+                max_concurrency=args.max_concurrency,
+                queue_timeout=args.queue_timeout,
+                completion_tokens=64
+            )
+            call = gateway.ainvoke
+        else:
+            call = client.ainvoke
+
+        queue_before = llm_gateway.QUEUE_SECONDS.summary(mode="async")
+        start = time.perf_counter()
+        outcomes = asyncio.run(_burst(call, prompts))
+        wall_seconds = time.perf_counter() - start
+        queue_after = llm_gateway.QUEUE_SECONDS.summary(mode="async")
+
+    queued = queue_after["count"] - queue_before["count"]
+    errors = Counter(error for _, error in outcomes if error)
+    return {
+        "mode": mode,
+        "questions": len(prompts),
+        "succeeded": sum(1 for _, error in outcomes if error is None),
+        "errors": dict(errors),
+        "server_requests": server.stats["requests"],
+        "server_429s": server.stats["rate_limited"],
+        "server_503s": server.stats["server_errors"],
+        "max_in_flight": server.stats["max_in_flight"],
+        "wall_seconds": round(wall_seconds, 2),
+        "latency": latency_summary([seconds for seconds, error in outcomes if error is None] or [0.0]),
+        "mean_queue_wait_ms": round(1000 * (queue_after["sum"] - queue_before["sum"]) / queued, 2) if queued else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=60)
+    parser.add_argument("--prompt-chars", type=int, default=2000, help="prompt size, about 4 characters per token")
+    parser.add_argument("--tokens-per-minute", type=int, default=20000)
+    parser.add_argument("--requests-per-minute", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds the fake server takes per answer")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="share of admitted calls answered with 503")
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--queue-timeout", type=float, default=120.0)
+    parser.add_argument("--modes", nargs="+", default=["direct", "gateway"], choices=["direct", "gateway"])
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    prompts = [f"Question {i}: " + "mortgage rate context " * (args.prompt_chars // 22) for i in range(args.questions)]
+    results = []
+    for mode in args.modes:
+        results.append(run_mode(mode, args, prompts))
+        print(f"{mode}: {results[-1]['succeeded']}/{args.questions} succeeded, "
+              f"{results[-1]['server_429s']} 429s, {results[-1]['wall_seconds']}s")
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Answer latency and token use with every question on the full model versus
+routed between the fast and the full model.
+
+The fixture pages are ingested into a temporary vector store, then the fixed
+query set (repeated --repeats times, answer cache off) is answered with
+generate_answer in both modes. Both routes are real ChatGroq clients pointed
+at the fake Groq server from benchmarks/fakes.py, which answers each model
+with its own latency (--fast-latency, --full-latency), so the run shows which
+questions the router sends where and what that does to end-to-end latency.
+
+    python -m benchmarks.llm_routing --repeats 3 --fast-latency 0.2 --full-latency 1.0
+"""
+import argparse
+import logging
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.common import DEFAULT_QUERIES, latency_summary, write_results
+from benchmarks.fakes import serve_fake_llm, serve_fixture_pages
+from benchmarks.pipeline import run_ingest
+
+
+def run_mode(rag, routing, queries):
+    rag.LLM_ROUTING = routing
+    choose_route = rag.choose_route
+    decisions = []
+
+    def recording_choose_route(query, retrieved_docs):
+        route = choose_route(query, retrieved_docs)
+        decisions.append((query, route))
+        return route
+
+    rag.choose_route = recording_choose_route
+    latencies = {}
+    try:
+        for query in queries:
+            start = time.perf_counter()
+            rag.generate_answer(query)
+            seconds = time.perf_counter() - start
+            latencies.setdefault(decisions[-1][1], []).append(seconds)
+            latencies.setdefault("all", []).append(seconds)
+    finally:
+        rag.choose_route = choose_route
+
+    return {
+        "mode": "routed" if routing else "full_only",
+        "questions": len(queries),
+        "routes": dict(Counter(route for _, route in decisions)),
+        "latency": {route: latency_summary(seconds) for route, seconds in latencies.items()},
+        "decisions": {query: route for query, route in decisions},
+    }
+
+
+def main():
+    from langchain_groq import ChatGroq
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3, help="passes over the fixed query set")
+    parser.add_argument("--fast-latency", type=float, default=0.2, help="seconds the fake server takes per fast model answer")
+    parser.add_argument("--full-latency", type=float, default=1.0, help="seconds the fake server takes per full model answer")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    import llm_router
+    import rag
+
+    logging.getLogger().setLevel(args.log_level)
+    rag.VECTORSTORE_DIR = Path(tempfile.mkdtemp(prefix="docubot-bench-"))
+    # Fetch strategies learned from the fixture server stay out of resources/
+    rag.FETCH_STATS_DB = rag.VECTORSTORE_DIR / "fetch_stats.sqlite3"
+    rag.ANSWER_CACHE_SIZE = 0
+    # The fake server's quota is not what is measured here
+    rag.LLM_REQUESTS_PER_MINUTE = rag.LLM_TOKENS_PER_MINUTE = 10 ** 9
+    quota = 10 ** 9
+
+    model_latency = {rag.LLM_FAST_MODEL: args.fast_latency, rag.LLM_MODEL: args.full_latency}
+    with serve_fake_llm(tokens_per_minute=quota, requests_per_minute=quota, model_latency=model_latency) as (base_url, server):
+        rag.llm = ChatGroq(model=rag.LLM_MODEL, max_tokens=rag.LLM_MAX_TOKENS, api_key="fake", base_url=base_url,
+                           max_retries=0)
+        rag.fast_llm = ChatGroq(model=rag.LLM_FAST_MODEL, max_tokens=rag.LLM_FAST_MAX_TOKENS, api_key="fake",
+                                base_url=base_url, max_retries=0)
+        with serve_fixture_pages() as (_, urls):
+            run_ingest(rag, urls)
+
+        queries = DEFAULT_QUERIES * args.repeats
+        results = []
+        for routing in (False, True):
+            tokens_before = {route: llm_router.ROUTE_TOKENS.value(route=route, kind="prompt")
+                             for route in (llm_router.FAST, llm_router.FULL)}
+            result = run_mode(rag, routing, queries)
+            result["prompt_tokens"] = {
+                route: llm_router.ROUTE_TOKENS.value(route=route, kind="prompt") - before
+                for route, before in tokens_before.items()
+            }
+            results.append(result)
+            print(f"{result['mode']:>9}: routes {result['routes']}, p50 {result['latency']['all']['p50_ms']} ms, "
+                  f"p95 {result['latency']['all']['p95_ms']} ms")
+        results.append({"server_requests_by_model": server.stats["models"]})
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
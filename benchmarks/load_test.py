@@ -0,0 +1,359 @@
+"""
+Load test of one API process: virtual users replaying questions (and ingests)
+against api.py while concurrency is ramped up.
+
+The API runs in a child process with a temporary vector store and the
+deterministic FakeChatGroq, so only this machine and the embedding model are
+measured (the LLM gateway's concurrency limit still applies). The fixture
+pages are ingested once before the first step. Then, for every `--users`
+step, that many virtual users send requests back to back (with optional
+exponential think time) for `--step-seconds`:
+
+- ask: POST /ask
+- stream: POST /ask/stream, also timing the first event (the retrieved evidence)
+- ingest: POST /ingest of the fixture pages, polled until the job finishes
+
+The action mix is set with `--mix`. Questions are the fixed query set, or are
+replayed in order from `--query-log`: a .jsonl file with a "question" (and
+optionally API "filters") per line, or a history database written by
+history.py. The answer cache is off unless `--answer-cache` is given, since a
+replayed log would otherwise mostly measure cache hits.
+
+Each step reports throughput, client latency percentiles and error rates per
+action, and per-stage server percentiles (retrieve, llm, LLM queue wait, ...)
+estimated from the histogram buckets of /metrics. A step fails the SLO when
+ask p95 exceeds `--slo-p95` or the error rate exceeds `--max-error-rate`;
+the last step within it is reported as the capacity.
+
+    python -m benchmarks.load_test --users 1 2 4 8 16 --step-seconds 30 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import random
+import re
+import socket
+import sqlite3
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from benchmarks.common import DEFAULT_QUERIES, latency_summary, write_results
+from benchmarks.fakes import FakeChatGroq, serve_fixture_pages
+
+ERROR_ANSWER_PREFIX = "I encountered an error"
+# Answers without retrieved chunks, e.g. while an ingest has reset the collection
+EMPTY_ANSWER_PREFIX = "I couldn't find any relevant information"
+_BUCKET_LINE = re.compile(r'^(\w+)_bucket\{(.*)\} (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve_api(port, llm_latency, answer_cache, synthetic_embeddings, log_level):
+    """Child process: the API on a temporary store with the fake LLM"""
+    import uvicorn
+
+    import rag
+
+    logging.getLogger().setLevel(log_level)
+    workdir = Path(tempfile.mkdtemp(prefix="docubot-load-"))
+    rag.VECTORSTORE_DIR = workdir / "vectorstore"
+    rag.HISTORY_DB = workdir / "history.sqlite3"
+    rag.FETCH_STATS_DB = workdir / "fetch_stats.sqlite3"
+    rag.llm = FakeChatGroq(latency=llm_latency)
+    # The fake LLM has no quota, only the gateway's concurrency limit applies
+    rag.LLM_REQUESTS_PER_MINUTE = rag.LLM_TOKENS_PER_MINUTE = 10 ** 9
+    if not answer_cache:
+        rag.ANSWER_CACHE_SIZE = 0
+    if synthetic_embeddings:
+        from benchmarks.fakes import CpuBoundEmbeddings
+        rag.get_embeddings = lambda *args, **kwargs: CpuBoundEmbeddings()
+
+    import api
+    uvicorn.run(api.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def load_questions(path):
+    """
+    :param path: .jsonl query log, or a history.py SQLite database; None for the fixed query set
+    :return: list of (question, filters or None)
+    """
+    if not path:
+        return [(question, None) for question in DEFAULT_QUERIES]
+    path = Path(path)
+    if path.suffix == ".jsonl":
+        with path.open(encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        return [(record["question"], record.get("filters")) for record in records]
+    # The history stores filters as Chroma where clauses, which the API does not take
+    with sqlite3.connect(path) as conn:
+        return [(row[0], None) for row in conn.execute("SELECT question FROM history ORDER BY id")]
+
+
+def parse_histograms(text):
+    """
+    :param text: Prometheus text from /metrics
+    :return: {(metric name, labels without le): [(upper bound, cumulative count), ...]}
+    """
+    histograms = defaultdict(list)
+    for line in text.splitlines():
+        match = _BUCKET_LINE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        labels = dict(_LABEL.findall(labels))
+        bound = labels.pop("le")
+        key = (name, tuple(sorted(labels.items())))
+        histograms[key].append((float("inf") if bound == "+Inf" else float(bound), float(value)))
+    return histograms
+
+
+def bucket_quantile(buckets, q):
+    """Quantile of a cumulative histogram, interpolated linearly within the bucket like Prometheus"""
+    total = buckets[-1][1]
+    if total <= 0:
+        return None
+    rank = q * total
+    lower, below = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower
+            return lower + (bound - lower) * ((rank - below) / max(count - below, 1e-12))
+        lower, below = bound, count
+    return lower
+
+
+def stage_percentiles(before, after):
+    """Per-series p50/p95/p99 of the observations made between two /metrics scrapes"""
+    stages = {}
+    for key, buckets in after.items():
+        previous = dict(before.get(key, []))
+        delta = [(bound, count - previous.get(bound, 0.0)) for bound, count in buckets]
+        count = delta[-1][1]
+        if count <= 0:
+            continue
+        name, labels = key
+        label = name.replace("docubot_", "") + "".join(f"[{value}]" for _, value in labels)
+        stages[label] = {
+            "count": int(count),
+            **{f"p{int(q * 100)}_ms": round(1000 * bucket_quantile(delta, q), 1) for q in (0.5, 0.95, 0.99)},
+        }
+    return stages
+
+
+class Workload:
+    """Shared state of the virtual users: the question log position and recorded outcomes"""
+
+    def __init__(self, base_url, fixture_urls, questions, mix, think_time, rng):
+        self.base_url = base_url
+        self.fixture_urls = fixture_urls
+        self.questions = questions
+        self.actions, self.weights = zip(*mix.items())
+        self.think_time = think_time
+        self.rng = rng
+        self.position = 0
+        self.records = defaultdict(list)  # action -> [(seconds, outcome, first event seconds)]
+
+    def next_question(self):
+        question = self.questions[self.position % len(self.questions)]
+        self.position += 1
+        return question
+
+    async def ask(self, client):
+        question, filters = self.next_question()
+        response = await client.post("/ask", json={"question": question, "filters": filters})
+        response.raise_for_status()
+        return _outcome(response.json()["answer"]), None
+
+    async def stream(self, client):
+        question, filters = self.next_question()
+        start = time.perf_counter()
+        first_event, answer = None, None
+        async with client.stream("POST", "/ask/stream", json={"question": question, "filters": filters}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                if first_event is None:
+                    first_event = time.perf_counter() - start
+                event = json.loads(line[len("data: "):])
+                if event["type"] == "answer":
+                    answer = event["answer"]
+        return _outcome(answer), first_event
+
+    async def ingest(self, client):
+        response = await client.post("/ingest", json={"urls": self.fixture_urls})
+        response.raise_for_status()
+        job_id = response.json()["job_id"]
+        while True:
+            await asyncio.sleep(0.2)
+            job = (await client.get(f"/ingest/{job_id}")).json()
+            if job["status"] in ("succeeded", "failed"):
+                return ("ok" if job["status"] == "succeeded" else "error"), None
+
+    async def user(self, client, deadline):
+        while time.monotonic() < deadline:
+            action = self.rng.choices(self.actions, weights=self.weights)[0]
+            start = time.perf_counter()
+            try:
+                outcome, first_event = await getattr(self, action)(client)
+            except Exception:
+                outcome, first_event = "error", None
+            self.records[action].append((time.perf_counter() - start, outcome, first_event))
+            if self.think_time:
+                await asyncio.sleep(self.rng.expovariate(1 / self.think_time))
+
+
+def _outcome(answer):
+    if answer is None or answer.startswith(ERROR_ANSWER_PREFIX):
+        return "error"
+    if answer.startswith(EMPTY_ANSWER_PREFIX):
+        return "empty"
+    return "ok"
+
+
+async def run_step(workload, users, seconds, timeout):
+    import httpx
+
+    workload.records.clear()
+    limits = httpx.Limits(max_connections=users + 2, max_keepalive_connections=users + 2)
+    async with httpx.AsyncClient(base_url=workload.base_url, timeout=timeout, limits=limits) as client:
+        before = parse_histograms((await client.get("/metrics")).text)
+        start = time.perf_counter()
+        deadline = time.monotonic() + seconds
+        await asyncio.gather(*(workload.user(client, deadline) for _ in range(users)))
+        elapsed = time.perf_counter() - start
+        after = parse_histograms((await client.get("/metrics")).text)
+
+    actions = {}
+    for action, records in workload.records.items():
+        errors = sum(1 for _, outcome, _ in records if outcome == "error")
+        empty = sum(1 for _, outcome, _ in records if outcome == "empty")
+        actions[action] = {
+            "requests": len(records),
+            "per_second": round(len(records) / elapsed, 2),
+            "error_rate": round(errors / len(records), 4),
+            "empty_answer_rate": round(empty / len(records), 4),
+            "latency": latency_summary([seconds for seconds, _, _ in records]),
+        }
+        first_events = [first for _, _, first in records if first is not None]
+        if first_events:
+            actions[action]["first_event_latency"] = latency_summary(first_events)
+    requests = sum(len(records) for records in workload.records.values())
+    errors = sum(1 for records in workload.records.values() for _, outcome, _ in records if outcome == "error")
+    return {
+        "users": users,
+        "seconds": round(elapsed, 2),
+        "requests_per_second": round(requests / elapsed, 2),
+        "error_rate": round(errors / requests, 4) if requests else None,
+        "actions": actions,
+        "server_stages": stage_percentiles(before, after),
+    }
+
+
+def wait_for_api(base_url, timeout=600):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if httpx.get(f"{base_url}/metrics", timeout=5).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("The API did not start")
+        time.sleep(0.5)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        action, _, weight = part.partition("=")
+        if action not in ("ask", "stream", "ingest"):
+            raise ValueError(f"Unknown action '{action}', expected ask, stream or ingest")
+        mix[action] = float(weight or 1)
+    return mix
+
+
+def main():
+    import httpx
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="virtual users per ramp step")
+    parser.add_argument("--step-seconds", type=float, default=30)
+    parser.add_argument("--mix", default="ask=0.8,stream=0.2", help="action weights, e.g. ask=0.7,stream=0.2,ingest=0.1")
+    parser.add_argument("--query-log", help=".jsonl query log or history database to replay")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds a user waits between requests")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds the fake LLM sleeps per call")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the answer cache on")
+    parser.add_argument("--embeddings", default="model", choices=["model", "synthetic"],
+                        help="the configured embedding model, or a CPU-bound stand-in for it")
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--slo-p95", type=float, default=5.0, help="ask p95 seconds a step must stay under")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    questions = load_questions(args.query_log)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = multiprocessing.Process(
+        target=serve_api,
+        args=(port, args.llm_latency, args.answer_cache, args.embeddings == "synthetic", args.log_level),
+        daemon=True
+    )
+    server.start()
+    steps = []
+    try:
+        with serve_fixture_pages() as (_, urls):
+            wait_for_api(base_url)
+            job_id = httpx.post(f"{base_url}/ingest", json={"urls": urls}, timeout=30).json()["job_id"]
+            while httpx.get(f"{base_url}/ingest/{job_id}", timeout=30).json()["status"] not in ("succeeded", "failed"):
+                time.sleep(0.5)
+
+            workload = Workload(base_url, urls, questions, mix, args.think_time, random.Random(args.seed))
+            for users in args.users:
+                step = asyncio.run(run_step(workload, users, args.step_seconds, args.request_timeout))
+                ask = step["actions"].get("ask") or step["actions"].get("stream") or {}
+                p95 = ask.get("latency", {}).get("p95_ms", 0) / 1000
+                step["within_slo"] = p95 <= args.slo_p95 and (step["error_rate"] or 0) <= args.max_error_rate
+                steps.append(step)
+                print(f"{users:>4} users: {step['requests_per_second']:>7} req/s, error rate {step['error_rate']}, "
+                      f"p50 {ask.get('latency', {}).get('p50_ms')} ms, p95 {ask.get('latency', {}).get('p95_ms')} ms, "
+                      f"p99 {ask.get('latency', {}).get('p99_ms')} ms{'' if step['within_slo'] else '  (over SLO)'}")
+    finally:
+        server.terminate()
+        server.join()
+
+    # Capacity: the last step before the first one over the SLO
+    capacity = 0
+    for step in steps:
+        if not step["within_slo"]:
+            break
+        capacity = step["users"]
+    write_results({
+        "mix": mix,
+        "questions": len(questions),
+        "fake_llm_latency_seconds": args.llm_latency,
+        "answer_cache": args.answer_cache,
+        "slo": {"p95_seconds": args.slo_p95, "max_error_rate": args.max_error_rate},
+        "max_users_within_slo": capacity,
+        "steps": steps,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Logging overhead of the ingest token filter.
+
+Times rag.filter_chunks_by_tokens against the previous version of the loop,
+which logged every chunk at INFO with f-strings and re-encoded truncated
+chunks just to log their new length. Log records go to a file handler, as
+they would in a deployed app, and are counted per run.
+
+    python -m benchmarks.logging_overhead --corpus chunks.jsonl --repeats 5
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.common import load_corpus, write_results
+
+
+def legacy_filter_chunks(docs, tokenizer, max_tokens=256):
+    """Token filter as it was before per-chunk logging moved to DEBUG"""
+    filtered_docs = []
+    for i, doc in enumerate(docs):
+        if not doc.page_content.strip():
+            logging.warning(f"Skipping empty chunk {i}")
+            continue
+
+        tokens = tokenizer.encode(doc.page_content, add_special_tokens=True)
+        logging.info(f"Chunk {i} token length: {len(tokens)}")
+
+        if len(tokens) <= max_tokens and len(tokens) > 2:
+            filtered_docs.append(doc)
+        elif len(tokens) > max_tokens:
+            truncated_text = tokenizer.decode(tokens[:max_tokens], skip_special_tokens=True)
+            if len(truncated_text.strip()) > 3:
+                doc.page_content = truncated_text.strip()
+                filtered_docs.append(doc)
+                logging.info(f"Truncated chunk {i} to {len(tokenizer.encode(truncated_text, add_special_tokens=True))} tokens")
+            else:
+                logging.warning(f"Truncated chunk {i} too short, skipping")
+        else:
+            logging.warning(f"Chunk {i} has too few tokens ({len(tokens)}), skipping")
+    logging.info(f"Final filtered documents: {len(filtered_docs)}")
+    return filtered_docs
+
+
+class _CountingHandler(logging.FileHandler):
+    def __init__(self, path):
+        super().__init__(path)
+        self.records = 0
+
+    def emit(self, record):
+        self.records += 1
+        super().emit(record)
+
+
+def _run(fn, texts, tokenizer, level, handler, repeats):
+    from langchain.schema import Document
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    timings, records = [], 0
+    for _ in range(repeats):
+        docs = [Document(page_content=text) for text in texts]  # Truncation mutates the chunks
+        handler.records = 0
+        start = time.perf_counter()
+        fn(docs, tokenizer)
+        timings.append(time.perf_counter() - start)
+        records = handler.records
+    best = min(timings)
+    return {
+        "min_seconds": round(best, 4),
+        "chunks_per_second": round(len(texts) / best, 1),
+        "log_records": records,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="chunk corpus (.jsonl or .txt); defaults to the persisted collection")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    import rag
+
+    texts = load_corpus(args.corpus, limit=args.limit)
+    if not texts:
+        raise SystemExit("Corpus is empty, ingest some URLs or pass --corpus")
+    tokenizer = rag.get_tokenizer()
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    fd, log_path = tempfile.mkstemp(suffix=".log")
+    os.close(fd)
+    handler = _CountingHandler(log_path)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    root.addHandler(handler)
+
+    try:
+        legacy = _run(legacy_filter_chunks, texts, tokenizer, logging.INFO, handler, args.repeats)
+        current = _run(rag.filter_chunks_by_tokens, texts, tokenizer, logging.INFO, handler, args.repeats)
+        current_debug = _run(rag.filter_chunks_by_tokens, texts, tokenizer, logging.DEBUG, handler, args.repeats)
+    finally:
+        root.removeHandler(handler)
+        handler.close()
+        os.remove(log_path)
+
+    write_results({
+        "chunks": len(texts),
+        "legacy_info": legacy,
+        "current_info": current,
+        "current_debug": current_debug,
+        "overhead_removed_seconds": round(legacy["min_seconds"] - current["min_seconds"], 4),
+        "speedup": round(legacy["min_seconds"] / current["min_seconds"], 2),
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Micro-benchmark of MMR selection: mmr.mmr_select versus the LangChain
+maximal_marginal_relevance helper that the Chroma retriever used before.
+
+Candidates are random unit vectors of the embedding dimension, so the numbers
+only measure selection cost, not retrieval quality. Both implementations are
+checked to select the same candidates.
+
+    python -m benchmarks.mmr --fetch-k 12 50 100 200
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.common import latency_summary, write_results
+from mmr import mmr_select
+
+
+def _time(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, timings
+
+
+def main():
+    from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=[12, 50, 100, 200])
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--lambda-mult", type=float, default=0.7)
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    results = []
+    for fetch_k in args.fetch_k:
+        query = rng.randn(args.dim).astype(np.float32)
+        candidates = rng.randn(fetch_k, args.dim).astype(np.float32)
+
+        langchain_selected, langchain_times = _time(
+            lambda: maximal_marginal_relevance(query, candidates, lambda_mult=args.lambda_mult, k=args.k),
+            args.repeats
+        )
+        vectorized_selected, vectorized_times = _time(
+            lambda: mmr_select(query, candidates, k=args.k, lambda_mult=args.lambda_mult),
+            args.repeats
+        )
+
+        results.append({
+            "fetch_k": fetch_k,
+            "k": args.k,
+            "same_selection": list(langchain_selected) == list(vectorized_selected),
+            "langchain": latency_summary(langchain_times),
+            "vectorized": latency_summary(vectorized_times),
+            "speedup_p50": round(float(np.median(langchain_times) / np.median(vectorized_times)), 2),
+        })
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
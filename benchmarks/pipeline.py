@@ -0,0 +1,154 @@
+"""
+End-to-end benchmark of process_urls and generate_answer with offline fixtures.
+
+The saved pages in benchmarks/fixtures/pages are served from a local HTTP
+server, the LLM is replaced by a deterministic FakeChatGroq and the vector
+store lives in a temporary directory, so runs only depend on this machine and
+the embedding model. Every ingest stage is timed from the status messages
+process_urls yields, followed by retrieval and generate_answer latency over
+the fixed query set, with the time until the evidence (retrieve_evidence) is
+ready for display. Results are written as JSON tagged with the git commit,
+so they can be compared from commit to commit.
+
+Recent versions of unstructured refuse to fetch loopback addresses, in which
+case the fetch stage measures the requests-based fallback. The fetch strategy
+history starts empty, so the first run pays for the failing strategies and
+later runs go straight to the one that worked.
+
+    python -m benchmarks.pipeline --runs 3 --output pipeline.json
+"""
+import argparse
+import logging
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.common import DEFAULT_QUERIES, latency_summary, write_results
+from benchmarks.fakes import FakeChatGroq, serve_fixture_pages
+
+# Status message prefix -> stage that starts when the message is yielded
+STAGE_PREFIXES = [
+    ("Initializing", "init"),
+    ("Resetting", "reset"),
+    ("Syncing", "reset"),
+    ("Loading data", "fetch"),
+    ("Trying", "fetch"),
+    ("Fetched", "fetch"),
+    ("Cleaning", "clean"),
+    ("Splitting", "split"),
+    ("Filtering", "token_filter"),
+    ("Removing near-duplicate", "dedup"),
+    ("Removed", "dedup"),
+    ("Add chunks", "validate"),
+    ("Embedding", "embed"),
+    ("Writing", "upsert"),
+    ("Deleted", "sync"),
+    ("Done", None),
+]
+
+
+def stage_of(status):
+    for prefix, stage in STAGE_PREFIXES:
+        if status.startswith(prefix):
+            return stage
+    return None
+
+
+def run_ingest(rag, urls):
+    """
+    Run process_urls once
+    :return: dict of stage -> seconds, including "total"
+    """
+    timings = defaultdict(float)
+    stage, stage_start = None, time.perf_counter()
+    run_start = stage_start
+    for status in rag.process_urls(urls):
+        now = time.perf_counter()
+        if status.startswith("Error"):
+            raise RuntimeError(status)
+        if stage is not None:
+            timings[stage] += now - stage_start
+        stage, stage_start = stage_of(status), now
+    timings["total"] = time.perf_counter() - run_start
+    return dict(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="ingest runs; the first one includes model loading")
+    parser.add_argument("--query-repeats", type=int, default=3, help="passes over the fixed query set")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds the fake LLM sleeps per call")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    import metrics
+    import rag
+
+    logging.getLogger().setLevel(args.log_level)
+    rag.VECTORSTORE_DIR = Path(tempfile.mkdtemp(prefix="docubot-bench-"))
+    # Fetch strategies learned from the fixture server stay out of resources/
+    rag.FETCH_STATS_DB = rag.VECTORSTORE_DIR / "fetch_stats.sqlite3"
+    rag.llm = FakeChatGroq(latency=args.llm_latency)
+    # The fake LLM has no quota, keep the LLM gateway from pacing the queries
+    rag.LLM_REQUESTS_PER_MINUTE = rag.LLM_TOKENS_PER_MINUTE = 10 ** 9
+    # Repeated questions would be answered from the cache without retrieval or LLM
+    rag.ANSWER_CACHE_SIZE = 0
+
+    with serve_fixture_pages() as (_, urls):
+        ingest_runs = [run_ingest(rag, urls) for _ in range(args.runs)]
+
+    chunk_count = rag.vector_store._collection.count()
+    stages = sorted({stage for run in ingest_runs for stage in run})
+    ingest = {
+        stage: {
+            "first_run_seconds": round(ingest_runs[0].get(stage, 0.0), 4),
+            "mean_seconds": round(float(np.mean([run.get(stage, 0.0) for run in ingest_runs[1:] or ingest_runs])), 4),
+            "min_seconds": round(float(np.min([run.get(stage, 0.0) for run in ingest_runs[1:] or ingest_runs])), 4),
+        }
+        for stage in stages
+    }
+
+    retrieval_latencies, evidence_latencies, answer_latencies = [], [], []
+    for _ in range(args.query_repeats):
+        for query in DEFAULT_QUERIES:
+            start = time.perf_counter()
+            rag.retrieve_documents(query)
+            retrieval_latencies.append(time.perf_counter() - start)
+
+            # generate_answer in its two phases: the UI shows the evidence after the first
+            start = time.perf_counter()
+            evidence = rag.retrieve_evidence(query)
+            evidence_latencies.append(time.perf_counter() - start)
+            rag.generate_from_evidence(evidence)
+            answer_latencies.append(time.perf_counter() - start)
+
+    write_results({
+        "pages": len(urls),
+        "chunks": chunk_count,
+        "runs": args.runs,
+        "embedding_backend": rag.EMBEDDING_BACKEND,
+        "fake_llm_latency_seconds": args.llm_latency,
+        "log_level": args.log_level,
+        "ingest": ingest,
+        "retrieve": latency_summary(retrieval_latencies),
+        "time_to_evidence": latency_summary(evidence_latencies),
+        "generate_answer": latency_summary(answer_latencies),
+        # generate_answer broken down by the spans it records
+        "query_stages": {
+            stage: {
+                "mean_ms": round(1000 * summary["sum"] / summary["count"], 3),
+                "count": summary["count"],
+            }
+            for stage in ("retrieve", "prompt_build", "llm", "post_process")
+            for summary in [metrics.STAGE_SECONDS.summary(pipeline="query", stage=stage)]
+            if summary["count"]
+        },
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
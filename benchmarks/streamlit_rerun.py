@@ -0,0 +1,211 @@
+"""
+Bytes sent and server time per Streamlit rerun of the UI, for a scripted sequence
+of interactions.
+
+The app is started with `streamlit run` and driven over its websocket the way the
+browser does it: every interaction sends the current widget values, plus the
+fragment id when the widget belongs to a fragment (so only that fragment reruns),
+plus the hashes of cached messages the browser already holds. The script measures
+the ForwardMsg bytes received until the run finishes, the number of elements
+sent and the time from request to "script finished".
+
+Compare two versions of the UI by passing an older revision of main.py:
+
+    python -m benchmarks.streamlit_rerun --baseline HEAD~1
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.common import latency_summary, write_results
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+# (name, widget label, value); value None clicks a button
+INTERACTIONS = [
+    ("type_question", "What would you like to know about your processed content?", "What is the 30-year fixed rate?"),
+    ("ask", "🔍 Ask AI Assistant", None),
+    ("edit_url", "URL 1", "https://example.com/rates"),
+    ("toggle_crawl", "🕸️ Crawl linked pages", True),
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class BrowserSession:
+    """Minimal Streamlit websocket client that keeps widget state and the message cache like the browser"""
+
+    def __init__(self, port):
+        import websocket
+
+        self.ws = websocket.create_connection(
+            f"ws://127.0.0.1:{port}/_stcore/stream", subprotocols=["streamlit"], timeout=120
+        )
+        self.widgets = {}  # label -> (widget id, element type, fragment id)
+        self.values = {}  # widget id -> WidgetState
+        self.cached_hashes = set()
+
+    def _widget_state(self, widget_id, element_type, value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        state = WidgetState(id=widget_id)
+        if value is None:
+            state.trigger_value = True
+        elif isinstance(value, bool):
+            state.bool_value = value
+        elif element_type == "number_input":
+            state.int_value = value
+        else:
+            state.string_value = value
+        return state
+
+    def rerun(self, label=None, value=None):
+        """
+        Send a rerun, optionally after changing one widget
+        :return: dict with bytes, messages, elements and seconds of the run
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ClientState_pb2 import ClientState
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        from streamlit.proto.WidgetStates_pb2 import WidgetStates
+
+        fragment_id = ""
+        states = dict(self.values)
+        if label is not None:
+            widget_id, element_type, fragment_id = self.widgets[label]
+            state = self._widget_state(widget_id, element_type, value)
+            states[widget_id] = state
+            if value is not None:
+                self.values[widget_id] = state
+
+        msg = BackMsg(rerun_script=ClientState(
+            widget_states=WidgetStates(widgets=list(states.values())),
+            fragment_id=fragment_id,
+            cached_message_hashes=sorted(self.cached_hashes),
+        ))
+        start = time.perf_counter()
+        self.ws.send_binary(msg.SerializeToString())
+
+        received = messages = elements = 0
+        while True:
+            data = self.ws.recv()
+            received += len(data)
+            messages += 1
+            forward = ForwardMsg()
+            forward.ParseFromString(data)
+            kind = forward.WhichOneof("type")
+            if kind == "new_session" or kind == "session_status_changed":
+                continue
+            if forward.metadata.cacheable and forward.hash:
+                self.cached_hashes.add(forward.hash)
+            if kind == "ref_hash":
+                elements += 1
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                elements += 1
+                self._record_widget(forward.delta)
+            if kind == "script_finished":
+                break
+        return {
+            "bytes": received,
+            "messages": messages,
+            "elements": elements,
+            "seconds": time.perf_counter() - start,
+            "fragment": bool(fragment_id),
+        }
+
+    def _record_widget(self, delta):
+        element = delta.new_element
+        element_type = element.WhichOneof("type")
+        proto = getattr(element, element_type)
+        widget_id = getattr(proto, "id", "")
+        label = getattr(proto, "label", "")
+        if widget_id and label:
+            self.widgets[label] = (widget_id, element_type, delta.fragment_id)
+
+    def close(self):
+        self.ws.close()
+
+
+def run_app(script, label, repeats, port):
+    env = dict(os.environ, STREAMLIT_BROWSER_GATHER_USAGE_STATS="false")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", str(script), "--server.headless", "true",
+         "--server.port", str(port), "--server.enableXsrfProtection", "false", "--server.enableCORS", "false"],
+        cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                session = BrowserSession(port)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+
+        runs = {"initial_load": [session.rerun()]}
+        # Warm run so imports and caches do not count against the first interaction
+        session.rerun()
+        for _ in range(repeats):
+            for name, widget_label, value in INTERACTIONS:
+                runs.setdefault(name, []).append(session.rerun(widget_label, value))
+        session.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+    summary = {}
+    for name, results in runs.items():
+        summary[name] = {
+            "bytes": round(sum(r["bytes"] for r in results) / len(results)),
+            "elements": round(sum(r["elements"] for r in results) / len(results)),
+            "fragment_rerun": results[-1]["fragment"],
+            "server_time": latency_summary([r["seconds"] for r in results]),
+        }
+    return {"ui": label, "interactions": summary}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--script", default="main.py")
+    parser.add_argument("--baseline", help="git revision whose main.py is measured as the baseline")
+    parser.add_argument("--repeats", type=int, default=10, help="times the interaction sequence is repeated")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    apps = []
+    baseline_script = None
+    if args.baseline:
+        # The baseline script has to sit next to the modules it imports
+        baseline_script = REPO_DIR / f".benchmark_main_{args.baseline.replace('~', '_').replace('/', '_')}.py"
+        baseline_script.write_bytes(subprocess.run(
+            ["git", "show", f"{args.baseline}:main.py"], cwd=REPO_DIR, capture_output=True, check=True
+        ).stdout)
+        apps.append((baseline_script, args.baseline))
+    apps.append((REPO_DIR / args.script, "current"))
+
+    results = []
+    try:
+        for script, label in apps:
+            results.append(run_app(script, label, args.repeats, free_port()))
+            for name, stats in results[-1]["interactions"].items():
+                print(f"{label:>10} {name:>14}: {stats['bytes']:>7} bytes, {stats['elements']:>3} elements, "
+                      f"p50 {stats['server_time']['p50_ms']} ms{' (fragment)' if stats['fragment_rerun'] else ''}")
+    finally:
+        if baseline_script is not None:
+            baseline_script.unlink(missing_ok=True)
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Memory and query latency of several worker processes on an embedded Chroma store
+versus one shared Chroma server.
+
+A collection of random vectors is written to an embedded store and to a local
+`chroma run` server. Then `--workers` processes query it at the same time, each
+opening the store the way initialize_components does in that mode. The script
+reports the memory each worker holds (USS, memory not shared with other
+processes) after its queries, the server's memory, and per-query latency.
+
+    python -m benchmarks.vector_backend --chunks 20000 --dim 768 --workers 1 4 8
+"""
+import argparse
+import multiprocessing
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.common import latency_summary, write_results
+
+COLLECTION = "bench"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def fill(collection, vectors, batch_size=2000):
+    for start in range(0, len(vectors), batch_size):
+        batch = vectors[start:start + batch_size]
+        collection.add(
+            ids=[str(i) for i in range(start, start + len(batch))],
+            embeddings=batch.tolist(),
+            documents=[f"chunk {i}" for i in range(start, start + len(batch))]
+        )
+
+
+def worker(mode, location, queries, k, start_event, results):
+    import psutil
+
+    from vector_backend import SharedCollection, make_client
+
+    if mode == "server":
+        client = make_client(host="localhost", port=location)
+    else:
+        client = make_client(persist_directory=location)
+    collection = SharedCollection(client, COLLECTION)
+    collection.count()
+    start_event.wait()
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[query.tolist()], n_results=k, include=["documents", "distances"])
+        latencies.append(time.perf_counter() - start)
+    memory = psutil.Process().memory_full_info()
+    results.put({"latencies": latencies, "rss_mb": memory.rss / 2 ** 20, "uss_mb": memory.uss / 2 ** 20})
+
+
+def process_tree_uss_mb(pid):
+    import psutil
+
+    process = psutil.Process(pid)
+    return sum(p.memory_full_info().uss for p in [process] + process.children(recursive=True)) / 2 ** 20
+
+
+def run_workers(mode, location, workers, queries, k):
+    context = multiprocessing.get_context("spawn")
+    start_event = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(mode, location, queries, k, start_event, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    # Let every worker open the store before the clock starts
+    time.sleep(2.0 + 0.5 * workers)
+    wall_start = time.perf_counter()
+    start_event.set()
+    outcomes = [results.get() for _ in processes]
+    wall_seconds = time.perf_counter() - wall_start
+    for process in processes:
+        process.join()
+    latencies = [seconds for outcome in outcomes for seconds in outcome["latencies"]]
+    return {
+        "mode": mode,
+        "workers": workers,
+        "queries_per_second": round(len(latencies) / wall_seconds, 1),
+        "latency": latency_summary(latencies),
+        "worker_uss_mb": round(float(np.mean([o["uss_mb"] for o in outcomes])), 1),
+        "workers_total_uss_mb": round(sum(o["uss_mb"] for o in outcomes), 1),
+    }
+
+
+def main():
+    import chromadb
+
+    from vector_backend import make_client
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--queries", type=int, default=200, help="queries per worker")
+    parser.add_argument("--k", type=int, default=12)
+    parser.add_argument("--modes", nargs="+", default=["embedded", "server"], choices=["embedded", "server"])
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.chunks, args.dim)).astype(np.float32)
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+
+    workdir = Path(tempfile.mkdtemp(prefix="docubot-backend-"))
+    server = None
+    results = []
+    try:
+        if "embedded" in args.modes:
+            embedded_dir = workdir / "embedded"
+            fill(chromadb.PersistentClient(path=str(embedded_dir)).create_collection(COLLECTION, embedding_function=None), vectors)
+        if "server" in args.modes:
+            port = free_port()
+            server = subprocess.Popen(
+                [shutil.which("chroma") or "chroma", "run", "--path", str(workdir / "server"), "--port", str(port)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            client = make_client(host="localhost", port=port)
+            fill(client.create_collection(COLLECTION, embedding_function=None), vectors)
+
+        for mode in args.modes:
+            for workers in args.workers:
+                result = run_workers(mode, port if mode == "server" else str(embedded_dir), workers, queries, args.k)
+                if mode == "server":
+                    result["server_uss_mb"] = round(process_tree_uss_mb(server.pid), 1)
+                results.append(result)
+                print(f"{mode} x{workers}: {result['workers_total_uss_mb']} MB in workers"
+                      f"{', ' + str(result['server_uss_mb']) + ' MB in the server' if mode == 'server' else ''}, "
+                      f"p50 {result['latency']['p50_ms']} ms")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Recall versus size for the compact vector storage options.
+
+Every configuration is searched by brute force over the fixed query set and
+compared with exact float32 search. "pca-D" searches the projected vectors
+only, "pca-D+rescore" also rescores the top --fetch-k candidates with the
+full vectors kept by the rescoring codec, which is what VECTOR_PCA_DIM=D does.
+
+    python -m benchmarks.vector_compression --corpus chunks.jsonl --pca-dims 64 128 256
+"""
+import argparse
+
+import numpy as np
+
+from benchmarks.common import DEFAULT_QUERIES, embed_corpus, exact_top_k, load_corpus, recall_at_k, write_results
+from compact_vectors import PCAProjection, make_codec
+
+
+def _rescore(query_vectors, corpus_vectors, candidates, k):
+    rescored = []
+    for query, ids in zip(query_vectors, candidates):
+        top = exact_top_k(query[None, :], corpus_vectors[ids], k)[0]
+        rescored.append(ids[top])
+    return np.asarray(rescored)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="chunk corpus (.jsonl or .txt); defaults to the persisted collection")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--embeddings-cache", help=".npz file to cache corpus and query embeddings")
+    parser.add_argument("--pca-dims", type=int, nargs="+", default=[64, 128, 256])
+    parser.add_argument("--rescore-codec", default="float16", choices=["float16", "int8"])
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--fetch-k", type=int, default=24)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus, limit=args.limit)
+    if not texts:
+        raise SystemExit("Corpus is empty, ingest some URLs or pass --corpus")
+    corpus, queries = embed_corpus(texts, DEFAULT_QUERIES, cache=args.embeddings_cache)
+    n, dim = corpus.shape
+    reference = exact_top_k(queries, corpus, args.k)
+
+    def report(name, bytes_per_vector, top):
+        return {
+            "config": name,
+            "bytes_per_vector": int(bytes_per_vector),
+            "total_mb": round(bytes_per_vector * n / 1e6, 3),
+            "size_vs_float32": round(bytes_per_vector / (4 * dim), 3),
+            f"recall_at_{args.k}": round(recall_at_k(reference, top), 4),
+        }
+
+    results = [report("float32", 4 * dim, reference)]
+
+    for codec_name in ("float16", "int8"):
+        codec = make_codec(codec_name).fit(corpus)
+        decoded = codec.decode(codec.encode(corpus))
+        results.append(report(codec_name, codec.bytes_per_vector(dim), exact_top_k(queries, decoded, args.k)))
+
+    rescore_codec = make_codec(args.rescore_codec).fit(corpus)
+    rescore_vectors = rescore_codec.decode(rescore_codec.encode(corpus))
+    for pca_dim in args.pca_dims:
+        projection = PCAProjection(pca_dim).fit(corpus)
+        projected_corpus = projection.project(corpus)
+        projected_queries = projection.project(queries)
+
+        # Projected vectors are searched with L2 distance, like the Chroma index
+        scores = 2 * projected_queries @ projected_corpus.T - (projected_corpus ** 2).sum(axis=1)[None, :]
+        order = np.argsort(-scores, axis=1)
+        results.append(report(f"pca-{pca_dim}", 4 * pca_dim, order[:, :args.k]))
+
+        rescored = _rescore(queries, rescore_vectors, order[:, :args.fetch_k], args.k)
+        results.append(report(
+            f"pca-{pca_dim}+rescore-{args.rescore_codec}",
+            4 * pca_dim + rescore_codec.bytes_per_vector(dim),
+            rescored
+        ))
+
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Per-chunk metadata and the metadata filters used to scope retrieval.
+
+Next to the loader's `source`, every stored chunk carries:
+
+- domain: host of the source URL, lower case and without "www.", e.g. "freddiemac.com"
+- ingested_at: Unix time in seconds of the ingest that stored the chunk
+- doc_hash: hash of the cleaned page text, shared by all chunks of one page
+- position: index of the chunk within its page, in reading order
+
+Chroma stores chunk metadata in its SQLite metadata table, which is indexed on
+(key, value) for strings, integers and floats. A `where` clause on these fields
+is resolved through those indexes first, and the vector search then only
+considers the matching chunks.
+
+Resolving a filter in Chroma costs time in proportion to the number of
+matching chunks, every time. ScopeCache keeps the chunks of recently used
+filters in memory, so further questions with the same filter are searched
+exactly over that subset in one matrix product. The only Chroma calls left
+are the cheap ones that check the collection has not changed since.
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time as day_time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+import metrics
+
+SCOPE_CACHE = metrics.REGISTRY.counter(
+    "docubot_scope_cache_total", "Filtered searches by scope cache outcome (hit, load, too_large)"
+)
+
+# Filter name -> metadata key, for the equality filters
+EQUALITY_FILTERS = {"source": "source", "domain": "domain", "doc_hash": "doc_hash"}
+# Filter name -> comparison on ingested_at
+TIME_FILTERS = {"ingested_after": "$gte", "ingested_before": "$lt"}
+
+
+def source_domain(source):
+    """
+    :param source: URL, or any other source label
+    :return: host of the URL without "www." and port, or "" if it has none
+    """
+    host = urlsplit(source or "").hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def page_metadata(source, text, ingested_at):
+    """
+    Metadata shared by all chunks of one page
+    :param source: page URL
+    :param text: cleaned page text
+    :param ingested_at: Unix time in seconds of the ingest
+    """
+    return {
+        "source": source,
+        "domain": source_domain(source),
+        "ingested_at": int(ingested_at),
+        "doc_hash": hashlib.sha1(text.encode("utf-8")).hexdigest()[:16],
+    }
+
+
+def add_positions(chunks):
+    """Number the chunks of each page in order, from the split output (chunks of a page are contiguous)"""
+    positions = {}
+    for chunk in chunks:
+        key = (chunk.metadata.get("source"), chunk.metadata.get("doc_hash"))
+        chunk.metadata["position"] = positions.get(key, 0)
+        positions[key] = chunk.metadata["position"] + 1
+    return chunks
+
+
+def _timestamp(value):
+    """Unix time of a number, datetime or date (a date means its local midnight)"""
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    if isinstance(value, date):
+        return int(datetime.combine(value, day_time.min).timestamp())
+    return int(value)
+
+
+def build_where(filters):
+    """
+    Turn retrieval filters into a Chroma `where` clause
+    :param filters: dict with any of source, domain, doc_hash (a value or a list of values),
+        ingested_after and ingested_before (Unix time, datetime or date); None values are ignored
+    :return: where clause, or None when nothing is filtered
+    """
+    clauses = []
+    for name, value in (filters or {}).items():
+        if value is None or value == [] or value == "":
+            continue
+        if name in EQUALITY_FILTERS:
+            key = EQUALITY_FILTERS[name]
+            values = sorted(set(value)) if isinstance(value, (list, tuple, set)) else [value]
+            if name == "domain":
+                # Accept "www.freddiemac.com" or a full URL for "freddiemac.com"
+                values = sorted({source_domain(v if "//" in v else f"//{v}") for v in values})
+            clauses.append({key: values[0]} if len(values) == 1 else {key: {"$in": values}})
+        elif name in TIME_FILTERS:
+            clauses.append({"ingested_at": {TIME_FILTERS[name]: _timestamp(value)}})
+        else:
+            raise ValueError(f"Unknown filter '{name}', expected one of {sorted({**EQUALITY_FILTERS, **TIME_FILTERS})}")
+
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class ScopeCache:
+    """
+    In-memory copy of the chunks matching recently used filters
+    :param max_chunks: chunks held across all cached filters; a filter matching more is left to Chroma
+    :param space: HNSW distance space, so the exact search ranks chunks the same way; by default the
+        space the collection was created with, read again whenever a scope is loaded
+    :param max_scopes: filters cached at once
+    :param version: function identifying the collection contents; cached scopes are reloaded when
+        it changes. Defaults to the collection id and count
+    """
+
+    def __init__(self, max_chunks=20000, space=None, max_scopes=64, version=None):
+        self.max_chunks = max_chunks
+        self.space = space
+        self.max_scopes = max_scopes
+        self.version = version
+        self._scopes = OrderedDict()  # where clause (JSON) -> scope dict, least recently used first
+        self._lock = threading.Lock()
+
+    def _stamp(self, collection):
+        return self.version() if self.version else collection.version()
+
+    def _load(self, collection, where, stamp):
+        results = collection.get(where=where, include=["documents", "metadatas", "embeddings"])
+        if len(results["ids"]) > self.max_chunks:
+            return {"stamp": stamp, "size": 0, "too_large": True}
+        # The stamp changes when the collection is recreated, possibly in another space
+        space = self.space or collection.hnsw_settings()["hnsw:space"]
+        vectors = np.asarray(results["embeddings"], dtype=np.float32).reshape(len(results["ids"]), -1) \
+            if results["ids"] else np.zeros((0, 0), dtype=np.float32)
+        if space == "cosine":
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return {
+            "stamp": stamp,
+            "space": space,
+            "size": len(results["ids"]),
+            "too_large": False,
+            "ids": results["ids"],
+            "documents": results["documents"],
+            "metadatas": results["metadatas"],
+            "vectors": vectors,
+            "squared_norms": (vectors ** 2).sum(axis=1),
+        }
+
+    def _scope(self, collection, where):
+        key = json.dumps(where, sort_keys=True)
+        stamp = self._stamp(collection)
+        with self._lock:
+            scope = self._scopes.get(key)
+            if scope is not None and scope["stamp"] == stamp:
+                self._scopes.move_to_end(key)
+                SCOPE_CACHE.inc(outcome="too_large" if scope["too_large"] else "hit")
+                return scope
+
+        scope = self._load(collection, where, stamp)
+        SCOPE_CACHE.inc(outcome="too_large" if scope["too_large"] else "load")
+        with self._lock:
+            self._scopes[key] = scope
+            self._scopes.move_to_end(key)
+            # Evict the least recently used filters, and any left from an older collection
+            while sum(s["size"] for s in self._scopes.values()) > self.max_chunks or len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
+        if not scope["too_large"]:
+            logging.info(f"Cached {scope['size']} chunks for filter {key}")
+        return scope
+
+    def query(self, collection, where, query_embeddings, n_results):
+        """
+        Exact search over the chunks matching where
+        :param collection: SharedCollection to load from and validate against
+        :return: results shaped like Chroma's query with documents, metadatas and embeddings,
+            or None when the filter matches too many chunks to cache
+        """
+        if self.max_chunks <= 0:
+            return None
+        scope = self._scope(collection, where)
+        if scope["too_large"]:
+            return None
+
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        if not scope["size"]:
+            return {key: [[] for _ in queries] for key in ("ids", "documents", "metadatas", "embeddings")}
+
+        if scope["space"] == "l2":
+            # ||x - q||^2 ranks like ||x||^2 - 2 x.q
+            distances = scope["squared_norms"][None, :] - 2 * queries @ scope["vectors"].T
+        elif scope["space"] == "cosine":
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+            distances = -(queries @ scope["vectors"].T)
+        else:
+            distances = -(queries @ scope["vectors"].T)
+        n = min(n_results, scope["size"])
+        top = np.argpartition(distances, n - 1, axis=1)[:, :n]
+
+        results = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+        for q in range(len(queries)):
+            order = top[q][np.argsort(distances[q, top[q]])]
+            results["ids"].append([scope["ids"][i] for i in order])
+            results["documents"].append([scope["documents"][i] for i in order])
+            results["metadatas"].append([scope["metadatas"][i] for i in order])
+            results["embeddings"].append(scope["vectors"][order])
+        return results
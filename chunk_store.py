@@ -0,0 +1,218 @@
+"""
+Compressed side store for chunk text.
+
+By default Chroma keeps every chunk's text in chroma.sqlite3, plus a full-text
+search index over it that Docubot never queries, and reads the text back for
+every candidate a vector search returns. With CHUNK_STORE=zstd, the text is
+stored here instead, keyed by chunk id, and Chroma keeps only vectors and
+metadata (still needed for filters). Search asks Chroma for ids and metadata,
+and only the chunks that MMR selects are read and decompressed.
+
+Chunks are a few hundred characters each, too short for zstd to find much
+repetition within one chunk. A dictionary trained on the collection's own
+chunks (boilerplate, recurring terms and phrasing) gives each chunk that
+context up front. It is trained once min_train_samples chunks have been
+added and stored next to the chunks. Each time the store doubles, up to
+max_train_samples, it is trained again on all chunks and every chunk is
+compressed again with it. Every row records the dictionary it was
+compressed with, and dictionary ids are never reused, so readers in other
+processes never decode a row with the wrong dictionary.
+"""
+import logging
+import random
+import sqlite3
+import threading
+from pathlib import Path
+
+import zstandard
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dictionaries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    data BLOB NOT NULL,
+    samples INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id TEXT PRIMARY KEY,
+    dictionary INTEGER NOT NULL,
+    raw_size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+"""
+
+# Row dictionary value of chunks compressed before a dictionary was trained
+NO_DICTIONARY = 0
+
+# SQLite limits the number of ? parameters per statement
+_MAX_PARAMS = 900
+
+
+class CompressedChunkStore:
+    """
+    :param path: SQLite file, created if missing
+    :param level: zstd compression level
+    :param dict_size: size of the trained dictionary in bytes
+    :param min_train_samples: chunks needed to train the first dictionary; earlier chunks are
+        compressed without one and compressed again once it is trained
+    :param max_train_samples: chunks a dictionary is trained on at most; once one has been
+        trained on that many, it is kept
+    """
+
+    def __init__(self, path, level=3, dict_size=32 * 1024, min_train_samples=64, max_train_samples=8192):
+        self.path = str(path)
+        self.level = level
+        self.dict_size = dict_size
+        self.min_train_samples = min_train_samples
+        self.max_train_samples = max_train_samples
+        # Chunks in the store when training last failed, it is tried again once the store doubles
+        self._failed_at = 0
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # One connection shared by the query threads, serialized by a lock
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._decompressors = {}
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(dictionaries)")}
+            if "samples" not in columns:
+                self._conn.execute("ALTER TABLE dictionaries ADD COLUMN samples INTEGER NOT NULL DEFAULT 0")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def _dictionary(self):
+        """Newest dictionary as (id, ZstdCompressionDict, chunks it was trained on), or (NO_DICTIONARY, None, 0)"""
+        row = self._conn.execute("SELECT id, data, samples FROM dictionaries ORDER BY id DESC LIMIT 1").fetchone()
+        if row is None:
+            return NO_DICTIONARY, None, 0
+        return row[0], zstandard.ZstdCompressionDict(row[1]), row[2]
+
+    def _decompressor(self, dictionary_id):
+        decompressor = self._decompressors.get(dictionary_id)
+        if decompressor is None:
+            if dictionary_id == NO_DICTIONARY:
+                decompressor = zstandard.ZstdDecompressor()
+            else:
+                row = self._conn.execute("SELECT data FROM dictionaries WHERE id = ?", (dictionary_id,)).fetchone()
+                decompressor = zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(row[0]))
+            self._decompressors[dictionary_id] = decompressor
+        return decompressor
+
+    def _should_train(self, chunks, trained_on):
+        if trained_on >= self.max_train_samples:
+            return False
+        return chunks >= max(self.min_train_samples, 2 * trained_on, 2 * self._failed_at)
+
+    def _train(self, texts):
+        """Train and store a dictionary on the given chunks; returns its id, or NO_DICTIONARY if training failed"""
+        if len(texts) > self.max_train_samples:
+            texts = random.Random(0).sample(texts, self.max_train_samples)
+        samples = [text.encode("utf-8") for text in texts]
+        # zstd needs far more sample bytes than dictionary bytes
+        size = min(self.dict_size, max(1024, sum(map(len, samples)) // 10))
+        try:
+            dictionary = zstandard.train_dictionary(size, samples, level=self.level)
+        except zstandard.ZstdError as e:
+            logging.warning(f"Could not train a chunk compression dictionary, compressing without one: {e}")
+            return NO_DICTIONARY
+        cursor = self._conn.execute("INSERT INTO dictionaries (data, samples) VALUES (?, ?)",
+                                    (dictionary.as_bytes(), len(samples)))
+        logging.info(f"Trained a {len(dictionary.as_bytes())} byte chunk compression dictionary on {len(samples)} chunks")
+        return cursor.lastrowid
+
+    def _rows(self, ids, texts, dictionary_id, dictionary):
+        compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+        for chunk_id, text in zip(ids, texts):
+            raw = text.encode("utf-8")
+            yield chunk_id, dictionary_id, len(raw), compressor.compress(raw)
+
+    def add(self, ids, texts):
+        """
+        Store (or replace) the text of chunks.
+        A dictionary is trained when the store reaches min_train_samples chunks and trained again each time
+        it doubles; stored chunks are then compressed again with the new dictionary.
+        """
+        ids, texts = list(ids), list(texts)
+        if not ids:
+            return
+        with self._lock, self._conn:
+            dictionary_id, dictionary, trained_on = self._dictionary()
+            chunks = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0] + len(ids)
+            if self._should_train(chunks, trained_on):
+                stored = {
+                    chunk_id: self._decompressor(row_dictionary).decompress(data).decode("utf-8")
+                    for chunk_id, row_dictionary, data in self._conn.execute("SELECT id, dictionary, data FROM chunks")
+                }
+                for chunk_id in ids:
+                    stored.pop(chunk_id, None)
+                if self._train(list(stored.values()) + texts) == NO_DICTIONARY:
+                    self._failed_at = chunks
+                else:
+                    previous_id = dictionary_id
+                    dictionary_id, dictionary, _ = self._dictionary()
+                    # Stored chunks get the new dictionary too
+                    ids = list(stored) + ids
+                    texts = list(stored.values()) + texts
+                    # The previous dictionary is kept for reads already under way, older unused ones go
+                    self._conn.execute(
+                        "DELETE FROM dictionaries WHERE id < ? AND id NOT IN (SELECT DISTINCT dictionary FROM chunks)",
+                        (previous_id,)
+                    )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, dictionary, raw_size, data) VALUES (?, ?, ?, ?)",
+                self._rows(ids, texts, dictionary_id, dictionary)
+            )
+
+    def get(self, ids):
+        """
+        Decompress the text of the given chunks
+        :return: list of texts in the order of ids, None for unknown ids
+        """
+        ids = list(ids)
+        found = {}
+        with self._lock:
+            for start in range(0, len(ids), _MAX_PARAMS):
+                batch = ids[start:start + _MAX_PARAMS]
+                rows = self._conn.execute(
+                    f"SELECT id, dictionary, data FROM chunks WHERE id IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall()
+                for chunk_id, dictionary_id, data in rows:
+                    found[chunk_id] = self._decompressor(dictionary_id).decompress(data).decode("utf-8")
+        return [found.get(chunk_id) for chunk_id in ids]
+
+    def delete(self, ids):
+        ids = list(ids)
+        with self._lock, self._conn:
+            for start in range(0, len(ids), _MAX_PARAMS):
+                batch = ids[start:start + _MAX_PARAMS]
+                self._conn.execute(f"DELETE FROM chunks WHERE id IN ({', '.join('?' * len(batch))})", batch)
+
+    def reset(self):
+        """Drop all chunks and dictionaries; the next dictionary gets a new id"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM dictionaries")
+            self._failed_at = 0
+
+    def stats(self):
+        """
+        :return: dict with chunks, raw_bytes (UTF-8 text), stored_bytes (compressed), dictionary_bytes
+            (dictionaries in use) and dictionary_samples (chunks the newest dictionary was trained on, 0 without one)
+        """
+        with self._lock:
+            chunks, raw_bytes, stored_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM chunks"
+            ).fetchone()
+            dictionary_bytes, dictionary_samples = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(data)), 0), COALESCE(MAX(samples), 0) FROM dictionaries "
+                "WHERE id IN (SELECT DISTINCT dictionary FROM chunks)"
+            ).fetchone()
+        return {
+            "chunks": chunks,
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "dictionary_bytes": dictionary_bytes,
+            "dictionary_samples": dictionary_samples,
+        }
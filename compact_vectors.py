@@ -0,0 +1,446 @@
+"""
+Compact vector storage for large collections.
+
+Chroma only persists float32 vectors, so the size of its HNSW index is set by
+the vector dimension. In compact mode Chroma indexes PCA-projected vectors
+(e.g. 128 dims instead of 768) and the full vectors are kept in a small side
+store as float16 or scalar-quantized int8. Search runs on the projected
+vectors and only the top candidates are rescored with the full vectors.
+"""
+import itertools
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class Float16Codec:
+    name = "float16"
+    # Encoding does not depend on the fitted vectors
+    needs_fit = False
+
+    def fit(self, vectors):
+        return self
+
+    def encode(self, vectors):
+        return np.asarray(vectors, dtype=np.float32).astype(np.float16)
+
+    def decode(self, codes):
+        return np.asarray(codes, dtype=np.float32)
+
+    def bytes_per_vector(self, dim):
+        return 2 * dim
+
+    def state(self):
+        return {}
+
+    def load_state(self, state):
+        return self
+
+
+class Int8Codec:
+    """Per-dimension scalar quantization to 256 levels between the fitted min and max"""
+    name = "int8"
+    needs_fit = True
+
+    def __init__(self):
+        self.low = None
+        self.scale = None
+
+    def fit(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.low = vectors.min(axis=0)
+        self.scale = np.maximum(vectors.max(axis=0) - self.low, 1e-8) / 255.0
+        return self
+
+    def encode(self, vectors):
+        levels = np.rint((np.asarray(vectors, dtype=np.float32) - self.low) / self.scale)
+        return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    def decode(self, codes):
+        return (np.asarray(codes, dtype=np.float32) + 128) * self.scale + self.low
+
+    def bytes_per_vector(self, dim):
+        return dim
+
+    def state(self):
+        return {"low": self.low, "scale": self.scale}
+
+    def load_state(self, state):
+        self.low = state["low"]
+        self.scale = state["scale"]
+        return self
+
+
+CODECS = {"float16": Float16Codec, "int8": Int8Codec}
+
+# Names the current generation of a CompactVectorIndex's files and its number of rows
+MANIFEST = "index.json"
+
+
+def make_codec(name):
+    if name not in CODECS:
+        raise ValueError(f"Unknown vector codec '{name}', expected one of {', '.join(CODECS)}")
+    return CODECS[name]()
+
+
+class PCAProjection:
+    """Linear projection onto the top principal components of the collection"""
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.mean = None
+        self.components = None
+
+    @property
+    def fitted(self):
+        return self.components is not None
+
+    def fit(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.mean = vectors.mean(axis=0)
+        _, _, vt = np.linalg.svd(vectors - self.mean, full_matrices=False)
+        components = vt[:self.dim]
+        if components.shape[0] < self.dim:
+            # Fewer chunks than dimensions: pad so the index dimension stays fixed
+            padding = np.zeros((self.dim - components.shape[0], vectors.shape[1]), dtype=np.float32)
+            components = np.vstack([components, padding])
+        self.components = components.astype(np.float32)
+        return self
+
+    def project(self, vectors):
+        if not self.fitted:
+            raise RuntimeError("PCA projection has not been fitted on the collection yet")
+        return (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.components.T
+
+    def save(self, path):
+        np.savez(path, mean=self.mean, components=self.components)
+
+    def load(self, path):
+        with np.load(path) as data:
+            self.mean = data["mean"]
+            self.components = data["components"]
+        return self
+
+
+class ProjectedEmbeddings(Embeddings):
+    """
+    Wraps an embedding function so Chroma sees projected vectors
+    :param projection: PCAProjection, or a CompactVectorIndex to follow its refits
+    """
+
+    def __init__(self, base, projection):
+        self.base = base
+        self.projection = projection
+
+    def embed_documents(self, texts):
+        return self.projection.project(self.base.embed_documents(texts)).tolist()
+
+    def embed_query(self, text):
+        return self.projection.project([self.base.embed_query(text)])[0].tolist()
+
+
+class CompactVectorIndex:
+    """
+    Projection plus full-vector side store for one collection.
+
+    Codes and ids are appended to the files of the current generation. Fitting,
+    refitting and deleting write every file under a new generation. index.json
+    names the generation and the number of valid rows and is replaced last, so
+    readers in other processes reload a consistent index whenever it changes.
+    :param directory: where the projection, codes and ids are persisted
+    :param dim: number of PCA dimensions indexed by Chroma
+    :param codec: "float16" or "int8" storage for the full vectors used in rescoring
+    :param max_fit_samples: vectors the projection and codec are fitted on at most
+    """
+
+    def __init__(self, directory, dim, codec="float16", max_fit_samples=20000):
+        self.directory = Path(directory)
+        self.projection = PCAProjection(dim)
+        self.codec = make_codec(codec)
+        self.max_fit_samples = max_fit_samples
+        # Vectors the projection and the codec were last fitted on
+        self.fit_samples = 0
+        self.codec_samples = 0
+        self._generation = 0
+        self._ids_bytes = 0
+        self._ids = []
+        self._positions = {}
+        self._codes = None
+        self._stamp = None
+        # Ingest threads write while query threads read
+        self._lock = threading.RLock()
+        with self._lock:
+            self._refresh()
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._ids)
+
+    def _path(self, kind, generation=None):
+        generation = self._generation if generation is None else generation
+        return self.directory / {
+            "projection": f"projection.{generation}.npz",
+            "codec": f"{self.codec.name}_codec.{generation}.npz",
+            "codes": f"{self.codec.name}_codes.{generation}.bin",
+            "ids": f"ids.{generation}.txt",
+        }[kind]
+
+    def _manifest_stamp(self):
+        # Every write changes the generation or the row count, so the content itself is the stamp
+        try:
+            return (self.directory / MANIFEST).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def _refresh(self):
+        """Reload the index when another process has written it since this one last did"""
+        stamp = self._manifest_stamp()
+        if stamp == self._stamp:
+            return
+        try:
+            if stamp is None:
+                self._clear()
+            else:
+                self._load(json.loads(stamp))
+        except Exception as e:
+            # Keep the loaded index; a writer that replaced the files has also replaced index.json
+            logging.warning(f"Could not load compact vector index from {self.directory}: {e}")
+        self._stamp = stamp
+
+    def _clear(self):
+        # Keep the same projection object, ProjectedEmbeddings may hold a reference to it
+        self.projection.mean = None
+        self.projection.components = None
+        self.fit_samples = 0
+        self.codec_samples = 0
+        self._ids_bytes = 0
+        self._ids = []
+        self._positions = {}
+        self._codes = None
+
+    def _load(self, manifest):
+        generation, count = manifest["generation"], manifest["count"]
+        if not count:
+            self._clear()
+            self._generation = generation
+            return
+        projection = PCAProjection(self.projection.dim).load(self._path("projection", generation))
+        with np.load(self._path("codec", generation)) as data:
+            codec_state = {key: data[key] for key in data.files}
+        codes = np.memmap(self._path("codes", generation), dtype=manifest["dtype"], mode="r",
+                          shape=(count, manifest["vector_dim"]))
+        with open(self._path("ids", generation), "rb") as f:
+            ids = f.read(manifest["ids_bytes"]).decode("utf-8").splitlines()
+        if len(ids) != count:
+            raise ValueError(f"{len(ids)} ids for {count} vectors")
+
+        self.projection.mean = projection.mean
+        self.projection.components = projection.components
+        self.codec.load_state(codec_state)
+        self.fit_samples = manifest["fit_samples"]
+        self.codec_samples = manifest["codec_samples"]
+        self._generation = generation
+        self._ids_bytes = manifest["ids_bytes"]
+        self._ids = ids
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        self._codes = codes
+        logging.info(f"Loaded compact vector index with {count} vectors from {self.directory}")
+
+    def _write_manifest(self):
+        manifest = {
+            "generation": self._generation,
+            "count": len(self._ids),
+            "ids_bytes": self._ids_bytes,
+            "fit_samples": self.fit_samples,
+            "codec_samples": self.codec_samples,
+        }
+        if self._codes is not None:
+            manifest.update(dtype=self._codes.dtype.str, vector_dim=int(self._codes.shape[1]))
+        path = self.directory / MANIFEST
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.tmp", path)
+        self._stamp = self._manifest_stamp()
+
+    def _open_codes(self, count, dtype, vector_dim):
+        self._codes = np.memmap(self._path("codes"), dtype=dtype, mode="r", shape=(count, vector_dim)) if count else None
+
+    def _rewrite(self, ids, code_batches):
+        """Write the fitted projection and codec, the ids and the codes as a new generation"""
+        previous = self._generation
+        self._generation = previous + 1
+        self.directory.mkdir(parents=True, exist_ok=True)
+        dtype, vector_dim = None, None
+        with open(self._path("codes"), "wb") as f:
+            for codes in code_batches:
+                dtype, vector_dim = codes.dtype, codes.shape[1]
+                f.write(np.ascontiguousarray(codes).tobytes())
+        ids_data = "".join(f"{chunk_id}\n" for chunk_id in ids).encode("utf-8")
+        self._path("ids").write_bytes(ids_data)
+        if self.projection.fitted:
+            self.projection.save(self._path("projection"))
+            np.savez(self._path("codec"), **self.codec.state())
+
+        self._ids = list(ids)
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(self._ids)}
+        self._ids_bytes = len(ids_data)
+        self._open_codes(len(self._ids), dtype, vector_dim)
+        self._write_manifest()
+        # Readers that still map the old files keep them open until they reload
+        for kind in ("projection", "codec", "codes", "ids"):
+            self._path(kind, previous).unlink(missing_ok=True)
+
+    def _append(self, ids, codes):
+        count = len(self._ids)
+        row_bytes = codes.dtype.itemsize * codes.shape[1]
+        # Cut off rows of an append that never reached index.json
+        with open(self._path("codes"), "r+b") as f:
+            f.truncate(count * row_bytes)
+            f.seek(0, os.SEEK_END)
+            f.write(np.ascontiguousarray(codes).tobytes())
+        ids_data = "".join(f"{chunk_id}\n" for chunk_id in ids).encode("utf-8")
+        with open(self._path("ids"), "r+b") as f:
+            f.truncate(self._ids_bytes)
+            f.seek(0, os.SEEK_END)
+            f.write(ids_data)
+
+        for chunk_id in ids:
+            self._positions[chunk_id] = len(self._ids)
+            self._ids.append(chunk_id)
+        self._ids_bytes += len(ids_data)
+        self._open_codes(len(self._ids), codes.dtype, codes.shape[1])
+        self._write_manifest()
+
+    def _sample(self, count):
+        """Sorted row numbers of at most max_fit_samples of count rows"""
+        if count <= self.max_fit_samples:
+            return np.arange(count)
+        return np.sort(np.random.default_rng(0).choice(count, self.max_fit_samples, replace=False))
+
+    def _stored_vectors(self, rows):
+        return self.codec.decode(self._codes[rows])
+
+    def _recoded(self, old_codec, batch_size):
+        """Stored codes in batches, re-encoded if the codec has been fitted again since old_codec"""
+        for start in range(0, len(self._ids), batch_size):
+            codes = np.asarray(self._codes[start:start + batch_size])
+            yield codes if old_codec is None else self.codec.encode(old_codec.decode(codes))
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+            self._rewrite([], [])
+
+    def project(self, vectors):
+        """Project full vectors with the current projection, reloaded if another process refitted it"""
+        with self._lock:
+            self._refresh()
+            return self.projection.project(vectors)
+
+    def add(self, ids, vectors):
+        """
+        Store full vectors and return their projections for Chroma.
+        The projection and codec are fitted on the first batch added to an empty index. The codec
+        is fitted again, new vectors included, whenever the index doubles up to max_fit_samples,
+        so vectors outside the range of the first batch are not clipped. The projection is fitted
+        again by refit().
+        :param ids: chunk ids
+        :param vectors: full-dimension embeddings
+        :return: projected vectors
+        """
+        ids, vectors = list(ids), np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            self._refresh()
+            if not self.projection.fitted or not self._ids:
+                self.projection.fit(vectors[self._sample(len(vectors))])
+                self.codec.fit(vectors[self._sample(len(vectors))])
+                self.fit_samples = self.codec_samples = min(len(vectors), self.max_fit_samples)
+                self._rewrite(ids, [self.codec.encode(vectors)])
+            elif self.codec.needs_fit and self.codec_samples < self.max_fit_samples \
+                    and len(self._ids) + len(ids) >= 2 * self.codec_samples:
+                old_codec = make_codec(self.codec.name).load_state(self.codec.state())
+                sample = np.vstack([self._stored_vectors(self._sample(len(self._ids))), vectors])
+                self.codec.fit(sample[self._sample(len(sample))])
+                self.codec_samples = min(len(sample), self.max_fit_samples)
+                self._rewrite(self._ids + ids, itertools.chain(
+                    self._recoded(old_codec, batch_size=5000), [self.codec.encode(vectors)]
+                ))
+            else:
+                self._append(ids, self.codec.encode(vectors))
+            return self.projection.project(vectors)
+
+    def needs_refit(self):
+        """True when the index has at least doubled since the projection was fitted, up to max_fit_samples"""
+        with self._lock:
+            self._refresh()
+            return 0 < self.fit_samples < self.max_fit_samples and len(self._ids) >= 2 * self.fit_samples
+
+    def refit(self, batch_size=5000):
+        """
+        Fit the projection again on (a sample of) all stored vectors.
+        The projections already written to Chroma are stale until they are replaced, see reproject().
+        :return: ids of all stored vectors
+        """
+        with self._lock:
+            self._refresh()
+            if self._codes is None:
+                return []
+            self.projection.fit(self._stored_vectors(self._sample(len(self._ids))))
+            self.fit_samples = min(len(self._ids), self.max_fit_samples)
+            self._rewrite(self._ids, self._recoded(None, batch_size))
+            logging.info(f"Refitted the compact vector projection on {self.fit_samples} of {len(self._ids)} vectors")
+            return list(self._ids)
+
+    def delete(self, ids):
+        with self._lock:
+            self._refresh()
+            drop = {self._positions[chunk_id] for chunk_id in ids if chunk_id in self._positions}
+            if not drop:
+                return
+            # Rows replaced by a later add of the same id are dropped too
+            keep = [i for i, chunk_id in enumerate(self._ids) if i not in drop and self._positions[chunk_id] == i]
+            codes = self._codes
+            self._rewrite([self._ids[i] for i in keep], [np.asarray(codes[keep])] if keep else [])
+
+    def get(self, ids):
+        """
+        Decode the full vectors of the given chunks
+        :return: float32 matrix, one row per id (rows of unknown ids are NaN)
+        """
+        with self._lock:
+            self._refresh()
+            if self._codes is None:
+                # Nothing stored, e.g. VECTOR_PCA_DIM switched on without a re-ingest
+                width = self.projection.components.shape[1] if self.projection.fitted else 1
+                return np.full((len(ids), width), np.nan, dtype=np.float32)
+            rows = np.full((len(ids), self._codes.shape[1]), np.nan, dtype=np.float32)
+            for row, chunk_id in enumerate(ids):
+                position = self._positions.get(chunk_id)
+                if position is not None:
+                    rows[row] = self.codec.decode(self._codes[position])
+            return rows
+
+    def nbytes(self):
+        with self._lock:
+            self._refresh()
+            return 0 if self._codes is None else int(self._codes.nbytes)
+
+
+def reproject(index, update, batch_size=5000):
+    """
+    Refit a CompactVectorIndex on all its vectors and replace their projections in the collection.
+    Until every batch is written, queries search a mix of old and new projections.
+    :param update: callable(ids, embeddings) writing projected vectors to the collection
+    :return: number of vectors reprojected
+    """
+    ids = index.refit(batch_size=batch_size)
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        update(batch, index.project(index.get(batch)).tolist())
+    return len(ids)
@@ -0,0 +1,152 @@
+"""
+Content-defined chunking.
+
+RecursiveCharacterTextSplitter cuts at fixed character windows, so inserting a
+sentence near the top of a page moves every later boundary and changes every
+later chunk. ContentDefinedSplitter picks boundaries from the content itself:
+a gear rolling hash runs over the text, and wherever the hash of the last 64
+characters has its low bits all zero a boundary is triggered. The chunk then
+ends at the next sentence end. An edit only moves the boundaries near it;
+from the next trigger on, chunks are cut exactly as before.
+
+Chunks never grow past max_chars or the embedder's max_tokens (they end at an
+earlier sentence end instead) and do not end before min_chars unless the page
+ends. There is no overlap between chunks, since overlap would make a chunk
+depend on its neighbours.
+
+chunk_id derives the id of a chunk from its source and text, so an unchanged
+chunk keeps its id across ingests and does not need to be embedded again.
+"""
+import copy
+import hashlib
+import math
+import random
+import re
+
+from langchain_core.documents import Document
+
+_MASK64 = (1 << 64) - 1
+# Fixed random table: boundaries must be the same in every process and release
+_GEAR = [random.Random(20240611 + i).getrandbits(64) for i in range(256)]
+# Sentence ends, and line breaks, followed by whitespace
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+|\n\s*")
+_WORD = re.compile(r"\S+")
+
+
+def chunk_id(source, text):
+    """Content-derived chunk id, stable across ingests of an unchanged chunk"""
+    return hashlib.sha1(f"{source}\n{text}".encode("utf-8")).hexdigest()
+
+
+class ContentDefinedSplitter:
+    """
+    :param chunk_size: target average chunk size in characters
+    :param min_chars: smallest chunk, except at the end of a page (default a quarter of chunk_size)
+    :param max_chars: largest chunk (default twice chunk_size)
+    :param max_tokens: largest chunk in tokens, measured with token_length
+    :param token_length: function returning the token count of a text, e.g. from the embedder's tokenizer
+    """
+
+    def __init__(self, chunk_size=400, min_chars=None, max_chars=None, max_tokens=None, token_length=None):
+        self.chunk_size = chunk_size
+        self.min_chars = min_chars if min_chars is not None else chunk_size // 4
+        self.max_chars = max_chars or 2 * chunk_size
+        self.max_tokens = max_tokens
+        self.token_length = token_length
+        # A trigger every 2**bits characters on average, on top of min_chars
+        self._mask = (1 << max(1, int(math.log2(max(chunk_size - self.min_chars, 2))))) - 1
+
+    def _triggers(self, text):
+        """Offsets where the rolling hash triggers a boundary"""
+        triggers = []
+        h = 0
+        mask = self._mask
+        for i, char in enumerate(text):
+            h = ((h << 1) + _GEAR[ord(char) & 0xFF]) & _MASK64
+            if h & mask == 0:
+                triggers.append(i)
+        return triggers
+
+    def _sentences(self, text):
+        """(start, end) spans of the sentences of text, whitespace after them excluded"""
+        spans = []
+        start = 0
+        for match in _SENTENCE_END.finditer(text):
+            if match.start() > start:
+                spans.append((start, match.start()))
+            start = match.end()
+        if start < len(text):
+            spans.append((start, len(text)))
+        return spans
+
+    def _tokens(self, text):
+        return self.token_length(text) if self.max_tokens and self.token_length else 0
+
+    def _too_long(self, chars, tokens):
+        return chars > self.max_chars or (self.max_tokens and tokens > self.max_tokens)
+
+    def _fit(self, text, start, end):
+        """Split a sentence that is over the limits on its own, at spaces"""
+        pieces = []
+        piece_start = piece_end = None
+        piece_tokens = 0
+        words = [
+            (word_start, min(word_start + self.max_chars, word.end()))
+            for word in _WORD.finditer(text, start, end)
+            # A "word" longer than max_chars (a URL, a table without spaces) is cut into windows
+            for word_start in range(word.start(), word.end(), self.max_chars)
+        ]
+        for word_start, word_end in words:
+            tokens = self._tokens(text[word_start:word_end])
+            if piece_start is not None and self._too_long(word_end - piece_start, piece_tokens + tokens):
+                pieces.append((piece_start, piece_end))
+                piece_start = None
+            if piece_start is None:
+                piece_start, piece_tokens = word_start, 0
+            piece_end = word_end
+            piece_tokens += tokens
+        if piece_start is not None:
+            pieces.append((piece_start, piece_end))
+        return pieces
+
+    def split_text(self, text):
+        triggers = self._triggers(text)
+        chunks = []
+        chunk_start = chunk_end = None
+        chunk_tokens = 0
+        next_trigger = 0
+
+        for sentence_start, sentence_end in self._sentences(text):
+            tokens = self._tokens(text[sentence_start:sentence_end])
+            spans = [(sentence_start, sentence_end, tokens)]
+            if self._too_long(sentence_end - sentence_start, tokens):
+                spans = [(start, end, self._tokens(text[start:end])) for start, end in self._fit(text, sentence_start, sentence_end)]
+
+            for start, end, tokens in spans:
+                if chunk_start is not None and self._too_long(end - chunk_start, chunk_tokens + tokens):
+                    chunks.append(text[chunk_start:chunk_end])
+                    chunk_start = None
+                if chunk_start is None:
+                    chunk_start, chunk_tokens = start, 0
+                chunk_end = end
+                chunk_tokens += tokens
+
+                # Did the rolling hash trigger inside this piece?
+                while next_trigger < len(triggers) and triggers[next_trigger] < start:
+                    next_trigger += 1
+                triggered = next_trigger < len(triggers) and triggers[next_trigger] < end
+                if triggered and end - chunk_start >= self.min_chars:
+                    chunks.append(text[chunk_start:chunk_end])
+                    chunk_start = None
+
+        if chunk_start is not None:
+            chunks.append(text[chunk_start:chunk_end])
+        return chunks
+
+    def split_documents(self, documents):
+        """Split documents like the LangChain text splitters: one Document per chunk, metadata copied"""
+        return [
+            Document(page_content=chunk, metadata=copy.deepcopy(doc.metadata))
+            for doc in documents
+            for chunk in self.split_text(doc.page_content)
+        ]
@@ -0,0 +1,342 @@
+"""
+Crawl mode: discover pages from seed URLs and sitemaps instead of a fixed URL list.
+
+The frontier is breadth-first. Up to `workers` pages are fetched at once, while
+each host is only hit once per `host_delay` seconds (or its robots.txt
+Crawl-delay, if longer). Links are normalized before they are checked against
+the seen set, so the same page is not fetched twice under different spellings.
+Pages are handed to the caller through a bounded queue as they arrive, which lets
+the ingest pipeline clean, split and embed one batch while the next is fetched.
+"""
+import logging
+import posixpath
+import queue
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib import robotparser
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+import requests
+from bs4 import BeautifulSoup
+
+import metrics
+
+USER_AGENT = "Mozilla/5.0 (compatible; DocubotCrawler/1.0)"
+
+# Links to files that are never HTML pages
+SKIP_EXTENSIONS = (
+    ".pdf", ".zip", ".gz", ".tar", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico",
+    ".css", ".js", ".json", ".mp3", ".mp4", ".avi", ".mov", ".woff", ".woff2", ".ttf", ".exe", ".dmg",
+)
+TRACKING_PARAMS = ("utm_", "gclid", "fbclid", "mc_cid", "mc_eid")
+
+# Sitemaps listing other sitemaps are followed this deep
+MAX_SITEMAP_DEPTH = 3
+
+
+def normalize_url(url, base=None):
+    """
+    Canonical form of a URL for the seen set: lowercase scheme and host, no default
+    port, no fragment, dot segments resolved, tracking parameters dropped and the
+    remaining query parameters sorted
+    :param url: absolute URL, or relative to base
+    :return: normalized URL, or None if it is not an http(s) URL
+    """
+    if base:
+        url = urljoin(base, url)
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if scheme not in ("http", "https") or not host:
+        return None
+
+    netloc = host if port is None or (scheme, port) in (("http", 80), ("https", 443)) else f"{host}:{port}"
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    normalized_path = posixpath.normpath(path)
+    if path.endswith("/") and normalized_path != "/":
+        normalized_path += "/"
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMS)
+    ))
+    return urlunsplit((scheme, netloc, normalized_path, query, ""))
+
+
+def host_allowed(host, allowed_domains):
+    return any(host == domain or host.endswith("." + domain) for domain in allowed_domains)
+
+
+class HostRateLimiter:
+    """Spaces requests to the same host at least `delay` seconds apart"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host, delay=None):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, 0.0))
+            self._next[host] = slot + max(self.delay, delay or 0.0)
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class RobotsCache:
+    """robots.txt rules per host, fetched once"""
+
+    def __init__(self, session_factory, timeout=10):
+        self.session_factory = session_factory
+        self.timeout = timeout
+        self._parsers = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            if origin not in self._parsers:
+                parser = robotparser.RobotFileParser()
+                try:
+                    response = self.session_factory().get(f"{origin}/robots.txt", timeout=self.timeout)
+                    # No robots.txt (or an unreadable one) means everything is allowed
+                    parser.parse(response.text.splitlines() if response.status_code == 200 else [])
+                except requests.RequestException:
+                    parser.parse([])
+                self._parsers[origin] = parser
+            return self._parsers[origin]
+
+    def allowed(self, url):
+        return self.get(url).can_fetch(USER_AGENT, url)
+
+    def crawl_delay(self, url):
+        return self.get(url).crawl_delay(USER_AGENT)
+
+    def sitemaps(self, url):
+        return self.get(url).site_maps() or []
+
+
+class Crawler:
+    """
+    :param seeds: start URLs; URLs ending in .xml are read as sitemaps
+    :param allowed_domains: hosts (and their subdomains) the crawl may visit, defaults to the seed hosts
+    :param max_depth: link hops followed from the seeds and sitemap pages
+    :param max_pages: pages returned at most
+    :param workers: pages fetched concurrently
+    :param host_delay: minimum seconds between requests to the same host
+    :param use_sitemaps: also start from the sitemaps of the seed hosts
+    :param respect_robots: obey robots.txt rules and Crawl-delay
+    """
+
+    def __init__(self, seeds, allowed_domains=None, max_depth=2, max_pages=200, workers=8, host_delay=0.25,
+                 use_sitemaps=True, respect_robots=True, timeout=20):
+        self.seeds = [url for url in (normalize_url(seed) for seed in seeds) if url]
+        self.allowed_domains = [d.lower() for d in allowed_domains] if allowed_domains else \
+            sorted({urlsplit(url).hostname for url in self.seeds})
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.workers = workers
+        self.use_sitemaps = use_sitemaps
+        self.respect_robots = respect_robots
+        self.timeout = timeout
+        self.limiter = HostRateLimiter(host_delay)
+        self._local = threading.local()
+        self.robots = RobotsCache(self._session, timeout=timeout)
+        self.seen = set()
+        self.stats = {"fetched": 0, "pages": 0, "failed": 0, "skipped": 0, "robots_blocked": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _session(self):
+        # requests.Session is not thread-safe, keep one per worker thread
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+            self._local.session.headers.update({"User-Agent": USER_AGENT})
+        return self._local.session
+
+    def _allowed(self, url):
+        return host_allowed(urlsplit(url).hostname, self.allowed_domains) and \
+            not urlsplit(url).path.lower().endswith(SKIP_EXTENSIONS)
+
+    def _get(self, url):
+        if self.respect_robots:
+            if not self.robots.allowed(url):
+                self._count("robots_blocked")
+                metrics.PAGES.inc(outcome="robots_blocked")
+                return None
+            self.limiter.wait(urlsplit(url).netloc, self.robots.crawl_delay(url))
+        else:
+            self.limiter.wait(urlsplit(url).netloc)
+        self._count("fetched")
+        return self._session().get(url, timeout=self.timeout, allow_redirects=True)
+
+    def sitemap_urls(self, sitemap_url, depth=0):
+        """Page URLs listed in a sitemap, following sitemap indexes"""
+        try:
+            response = self._get(sitemap_url)
+            if response is None or response.status_code != 200:
+                return []
+            root = ET.fromstring(response.content)
+        except (requests.RequestException, ET.ParseError) as e:
+            logging.warning(f"Could not read sitemap {sitemap_url}: {e}")
+            return []
+
+        locations = [el.text.strip() for el in root.iter() if el.tag.endswith("loc") and el.text]
+        if root.tag.endswith("sitemapindex"):
+            if depth >= MAX_SITEMAP_DEPTH:
+                return []
+            return [url for location in locations for url in self.sitemap_urls(location, depth + 1)]
+        return locations
+
+    def _start_urls(self):
+        pages, sitemaps = [], []
+        for seed in self.seeds:
+            if urlsplit(seed).path.lower().endswith(".xml"):
+                sitemaps.append(seed)
+            else:
+                pages.append(seed)
+        if self.use_sitemaps:
+            for origin in dict.fromkeys(f"{urlsplit(seed).scheme}://{urlsplit(seed).netloc}" for seed in self.seeds):
+                listed = self.robots.sitemaps(origin + "/") if self.respect_robots else []
+                sitemaps.extend(listed or [origin + "/sitemap.xml"])
+        for sitemap in dict.fromkeys(sitemaps):
+            pages.extend(self.sitemap_urls(sitemap))
+        return pages
+
+    def fetch(self, url):
+        """
+        Fetch one page. Errors are logged and counted as failed pages, they do not stop the crawl
+        :return: (document or None, list of normalized outgoing links)
+        """
+        try:
+            return self._fetch(url)
+        except Exception as e:
+            logging.warning(f"Could not process {url}: {e}")
+            self._count("failed")
+            metrics.PAGES.inc(outcome="failed")
+            return None, []
+
+    def _fetch(self, url):
+        from langchain.schema import Document
+
+        with metrics.span("crawl", "fetch"):
+            try:
+                response = self._get(url)
+            except requests.RequestException as e:
+                logging.debug("Fetch failed for %s: %s", url, e)
+                self._count("failed")
+                metrics.PAGES.inc(outcome="failed")
+                return None, []
+        if response is None:
+            return None, []
+        if response.status_code != 200 or "html" not in response.headers.get("Content-Type", "html"):
+            self._count("skipped")
+            metrics.PAGES.inc(outcome="skipped")
+            return None, []
+
+        final_url = normalize_url(response.url) or url
+        soup = BeautifulSoup(response.content, "html.parser")
+        meta_robots = soup.find("meta", attrs={"name": "robots"})
+        directives = meta_robots.get("content", "").lower() if meta_robots else ""
+
+        links = []
+        if "nofollow" not in directives:
+            for anchor in soup.find_all("a", href=True):
+                link = normalize_url(anchor["href"], base=final_url)
+                if link:
+                    links.append(link)
+
+        if "noindex" in directives:
+            return None, links
+
+        # Same extraction as the requests fallback in process_urls
+        for element in soup(["script", "style", "nav", "header", "footer", "aside"]):
+            element.decompose()
+        text = " ".join(soup.get_text(separator=" ", strip=True).split())
+        if len(text) <= 100:
+            self._count("skipped")
+            metrics.PAGES.inc(outcome="skipped")
+            return None, links
+
+        metrics.PAGES.inc(outcome="crawled")
+        return Document(page_content=text, metadata={"source": final_url}), links
+
+    def _run(self, out, stop):
+        frontier = deque()
+
+        def enqueue(url, depth):
+            if url not in self.seen and self._allowed(url):
+                self.seen.add(url)
+                frontier.append((url, depth))
+
+        try:
+            for url in self.seeds:
+                if not urlsplit(url).path.lower().endswith(".xml"):
+                    enqueue(url, 0)
+            for url in self._start_urls():
+                url = normalize_url(url)
+                if url:
+                    enqueue(url, 0)
+
+            in_flight = {}
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="crawl") as pool:
+                while (frontier or in_flight) and not stop.is_set():
+                    while frontier and len(in_flight) < self.workers and self.stats["pages"] + len(in_flight) < self.max_pages:
+                        url, depth = frontier.popleft()
+                        in_flight[pool.submit(self.fetch, url)] = depth
+                    if not in_flight:
+                        break
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        depth = in_flight.pop(future)
+                        doc, links = future.result()
+                        if doc is not None and self.stats["pages"] < self.max_pages:
+                            self.stats["pages"] += 1
+                            out.put(doc)
+                        if depth < self.max_depth:
+                            for link in links:
+                                enqueue(link, depth + 1)
+        except Exception as e:
+            logging.error(f"Crawl stopped: {e}")
+        finally:
+            out.put(None)
+
+    def crawl(self):
+        """
+        Run the crawl in background threads
+        :return: generator of documents, one per page, in the order they were fetched
+        """
+        out = queue.Queue(maxsize=self.workers * 4)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._run, args=(out, stop), daemon=True)
+        thread.start()
+        try:
+            while True:
+                doc = out.get()
+                if doc is None:
+                    break
+                yield doc
+        finally:
+            stop.set()
+            # Unblock the crawl thread if it is waiting on a full queue
+            while thread.is_alive():
+                try:
+                    out.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        logging.info(
+            f"Crawl finished: {self.stats['pages']} pages from {self.stats['fetched']} requests "
+            f"({self.stats['failed']} failed, {self.stats['skipped']} skipped, {self.stats['robots_blocked']} blocked by robots.txt)"
+        )
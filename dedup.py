@@ -0,0 +1,141 @@
+"""
+Near-duplicate chunk detection using MinHash signatures and LSH banding.
+
+Every chunk is turned into a set of word shingles, hashed into a fixed-size
+MinHash signature and bucketed by bands of that signature. Only chunks that
+share a bucket are compared, so a batch of N chunks is deduplicated in
+roughly O(N) instead of comparing every pair.
+"""
+import re
+import zlib
+
+import numpy as np
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD_RE = re.compile(r"\w+")
+
+
+class NearDuplicateIndex:
+    """
+    MinHash LSH index over chunk texts
+    :param threshold: estimated Jaccard similarity above which two chunks are duplicates
+    :param num_perm: number of hash permutations in a signature
+    :param bands: number of LSH bands, must divide num_perm
+    :param shingle_size: number of words per shingle
+    """
+
+    def __init__(self, threshold=0.8, num_perm=128, bands=16, shingle_size=5, seed=1):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64) % _MERSENNE_PRIME
+        self._b = rng.randint(0, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64) % _MERSENNE_PRIME
+
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _shingles(self, text):
+        words = _WORD_RE.findall(text.lower())
+        if len(words) <= self.shingle_size:
+            return {" ".join(words)}
+        return {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        """
+        Compute the MinHash signature of a text
+        :param text: chunk text
+        :return: uint64 array of length num_perm
+        """
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in self._shingles(text)),
+            dtype=np.uint64
+        )
+        # (a * x + b) mod p for every permutation and shingle at once
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, signature[start:start + self.rows].tobytes()
+
+    def query(self, signature):
+        """
+        Find the closest indexed chunk whose estimated similarity passes the threshold
+        :param signature: signature returned by signature()
+        :return: (key, similarity) of the best match, or (None, 0.0)
+        """
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(band_key, ()))
+
+        best_key, best_similarity = None, 0.0
+        for key in candidates:
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= self.threshold and similarity > best_similarity:
+                best_key, best_similarity = key, similarity
+        return best_key, best_similarity
+
+    def add(self, key, signature):
+        self._signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, []).append(key)
+
+
+def link_duplicate(metadata, source):
+    """Record on a kept chunk's metadata that a chunk from source duplicated it"""
+    linked = metadata.get("duplicate_sources", "")
+    linked_sources = linked.split(",") if linked else []
+    if source != metadata.get("source") and source not in linked_sources:
+        linked_sources.append(source)
+        metadata["duplicate_sources"] = ",".join(linked_sources)
+    metadata["duplicate_count"] = metadata.get("duplicate_count", 0) + 1
+
+
+def deduplicate_documents(docs, index, mode="drop", keys=None, earlier_links=None):
+    """
+    Remove near-duplicate chunks from a batch of documents
+    :param docs: chunk documents, in ingest order
+    :param index: NearDuplicateIndex, possibly holding the chunks of earlier batches of the same ingest
+    :param mode: "drop" discards duplicates, "link" also records their sources on the kept chunk
+    :param keys: ids the chunks are stored under, used as index keys; defaults to their position in the index
+    :param earlier_links: dict filled in link mode with key -> sources of duplicates of chunks kept
+        by earlier calls, which are stored already and need link_duplicate on their stored metadata
+    :return: (kept documents, number of duplicates removed)
+    """
+    kept = []
+    kept_by_key = {}
+    removed = 0
+
+    for i, doc in enumerate(docs):
+        signature = index.signature(doc.page_content)
+        match, _ = index.query(signature)
+        if match is None:
+            # Unique across calls, the index may be shared by the batches of a crawl
+            key = keys[i] if keys is not None else f"chunk:{len(index)}"
+            index.add(key, signature)
+            kept_by_key[key] = doc
+            kept.append(doc)
+            continue
+
+        removed += 1
+        source = doc.metadata.get("source")
+        if mode != "link" or not source:
+            continue
+        canonical = kept_by_key.get(match)
+        if canonical is not None:
+            link_duplicate(canonical.metadata, source)
+        elif earlier_links is not None:
+            earlier_links.setdefault(match, []).append(source)
+
+    return kept, removed
@@ -0,0 +1,136 @@
+"""
+Priority scheduling of embedding work.
+
+Query embeddings and ingest batches share one model and one CPU. Without a
+scheduler, a large ingest keeps every core busy with batch work, and each
+question's query embedding queues behind it. The EmbeddingScheduler puts the
+two kinds of work on separate lanes:
+
+- query lane: embed_query and embed_queries, run as soon as they arrive,
+- ingest lane: embed_documents, split into small batches. Before each batch it
+  waits until no query embedding is pending, up to max_ingest_defer seconds, so
+  a steady stream of questions cannot stall an ingest completely.
+
+Each lane runs on its own worker thread, but both lanes share the model's CPU
+thread pool: torch.set_num_threads is process-wide, and an ONNX Runtime session
+has one pool sized by EMBEDDING_NUM_THREADS. The lanes therefore order the work
+and do not isolate it; a query that arrives while an ingest batch is running
+waits for that batch's compute, which is why ingest batches are small. For the
+torch backend the scheduler sets the pool once to the sum of the two lane
+allotments. On Linux the ingest lane thread runs at a lower CPU priority
+(ingest_nice). Niceness is per thread, so this covers the lane thread's own
+share of the work, not pool threads that are already running.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+import metrics
+from embeddings import default_num_threads
+
+QUEUE_SECONDS = metrics.REGISTRY.histogram(
+    "docubot_embedding_queue_seconds", "Time embedding work waited for its lane, by lane"
+)
+INGEST_DEFERRALS = metrics.REGISTRY.counter(
+    "docubot_embedding_ingest_deferrals_total", "Ingest embedding batches held back for query embeddings"
+)
+
+
+def lane_threads(query_threads=None, ingest_threads=None):
+    """
+    CPU threads per lane. By default a quarter of the cores (at least one) go to
+    queries and the rest to ingest
+    :return: (query threads, ingest threads)
+    """
+    cores = default_num_threads()
+    query_threads = query_threads or max(1, cores // 4)
+    ingest_threads = ingest_threads or max(1, cores - query_threads)
+    return query_threads, ingest_threads
+
+
+def _init_lane_thread(nice=0):
+    if nice and hasattr(os, "setpriority"):
+        # Linux niceness is per thread: it covers this thread, not compute pool threads already running
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+        except OSError as e:
+            logging.warning(f"Could not lower the ingest embedding priority: {e}")
+
+
+def _set_torch_threads(threads):
+    try:
+        import torch
+    except ImportError:
+        return
+    # Process-wide, so it is set once for both lanes
+    torch.set_num_threads(threads)
+
+
+class EmbeddingScheduler(Embeddings):
+    """
+    :param embeddings: embedding model shared by both lanes
+    :param query_threads: CPU threads for query embeddings; with ingest_threads, sizes torch's shared pool
+    :param ingest_threads: CPU threads for ingest batches; with query_threads, sizes torch's shared pool
+    :param ingest_batch_size: texts per ingest batch; the ingest lane yields to queries between batches
+    :param max_ingest_defer: longest an ingest batch is held back by queries, in seconds
+    :param ingest_nice: niceness added to the ingest lane thread (Linux)
+    """
+
+    def __init__(self, embeddings, query_threads=None, ingest_threads=None, ingest_batch_size=16, max_ingest_defer=2.0,
+                 ingest_nice=10):
+        self.embeddings = embeddings
+        self.query_threads, self.ingest_threads = lane_threads(query_threads, ingest_threads)
+        self.ingest_batch_size = ingest_batch_size
+        self.max_ingest_defer = max_ingest_defer
+        _set_torch_threads(self.query_threads + self.ingest_threads)
+        self._query_lane = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-query")
+        self._ingest_lane = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="embed-ingest",
+            initializer=_init_lane_thread, initargs=(ingest_nice,)
+        )
+        self._pending_queries = 0
+        self._idle = threading.Condition()
+
+    def _run_query(self, fn, submitted):
+        QUEUE_SECONDS.observe(time.monotonic() - submitted, lane="query")
+        try:
+            return fn()
+        finally:
+            with self._idle:
+                self._pending_queries -= 1
+                if self._pending_queries == 0:
+                    self._idle.notify_all()
+
+    def _query(self, fn):
+        with self._idle:
+            self._pending_queries += 1
+        return self._query_lane.submit(self._run_query, fn, time.monotonic()).result()
+
+    def _run_ingest_batch(self, texts, submitted):
+        with self._idle:
+            if self._pending_queries:
+                INGEST_DEFERRALS.inc()
+                self._idle.wait_for(lambda: self._pending_queries == 0, timeout=self.max_ingest_defer)
+        QUEUE_SECONDS.observe(time.monotonic() - submitted, lane="ingest")
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self._query(lambda: self.embeddings.embed_query(text))
+
+    def embed_queries(self, texts):
+        """Embed a batch of questions on the query lane"""
+        texts = list(texts)
+        return self._query(lambda: self.embeddings.embed_documents(texts))
+
+    def embed_documents(self, texts):
+        """Embed ingest chunks on the ingest lane, one small batch at a time"""
+        texts = list(texts)
+        vectors = []
+        for start in range(0, len(texts), self.ingest_batch_size):
+            batch = texts[start:start + self.ingest_batch_size]
+            vectors.extend(self._ingest_lane.submit(self._run_ingest_batch, batch, time.monotonic()).result())
+        return vectors
@@ -0,0 +1,238 @@
+"""
+Embedding sidecar: one process holds the embedding model for every worker on the host.
+
+Each worker that loads sentence-t5-large itself keeps a private copy of the
+weights (about 2.5 GB in fp32), which limits how many API or Streamlit workers
+fit on a host. With EMBEDDING_SOCKET set, initialize_components uses
+RemoteEmbeddings instead, and the model lives only in the sidecar:
+
+    python embedding_server.py --socket resources/embedding.sock
+    EMBEDDING_SOCKET=resources/embedding.sock uvicorn api:app --workers 8
+
+The sidecar wraps the model in the EmbeddingScheduler as before, so query
+embeddings still go ahead of ingest batches, now across all workers. Query
+requests that arrive within max_wait of each other are embedded together in
+one forward pass (up to max_batch texts).
+
+Messages on the Unix socket are a JSON header plus a binary payload, each
+preceded by its length. Requests: {"kind": "query" | "documents", "texts": [...]};
+responses: {"count": n, "dim": d} with n * d float32 values, or {"error": ...}.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import metrics
+
+_FRAME = struct.Struct("!II")
+
+BATCH_TEXTS = metrics.REGISTRY.histogram(
+    "docubot_embedding_server_batch_texts", "Query texts per forward pass of the embedding sidecar",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
+
+def _send(sock, header, payload=b""):
+    data = json.dumps(header).encode("utf-8")
+    sock.sendall(_FRAME.pack(len(data), len(payload)) + data + payload)
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(min(size - len(buffer), 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding socket closed")
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def _recv(sock):
+    header_size, payload_size = _FRAME.unpack(_recv_exact(sock, _FRAME.size))
+    header = json.loads(_recv_exact(sock, header_size))
+    return header, _recv_exact(sock, payload_size) if payload_size else b""
+
+
+class _QueryBatcher:
+    """Collects query requests for up to max_wait seconds and embeds them in one call"""
+
+    def __init__(self, embeddings, max_batch, max_wait):
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._requests = queue.Queue()
+        threading.Thread(target=self._run, name="embed-batcher", daemon=True).start()
+
+    def submit(self, texts):
+        future = Future()
+        self._requests.put((texts, future))
+        return future.result()
+
+    def _embed(self, texts):
+        if hasattr(self.embeddings, "embed_queries"):
+            return self.embeddings.embed_queries(texts)
+        return self.embeddings.embed_documents(texts)
+
+    def _run(self):
+        while True:
+            batch = [self._requests.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                try:
+                    request = self._requests.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request[0])
+
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            BATCH_TEXTS.observe(len(texts))
+            try:
+                vectors = self._embed(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for request_texts, future in batch:
+                future.set_result(vectors[start:start + len(request_texts)])
+                start += len(request_texts)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                request, _ = _recv(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                texts = list(request["texts"])
+                if request.get("kind") == "documents":
+                    vectors = server.embeddings.embed_documents(texts)
+                else:
+                    vectors = server.batcher.submit(texts)
+                vectors = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+                _send(self.request, {"count": len(texts), "dim": vectors.shape[1]}, vectors.tobytes())
+            except (ConnectionError, OSError):
+                return
+            except Exception as e:
+                logging.error(f"Embedding request failed: {e}")
+                _send(self.request, {"error": str(e)})
+
+
+class EmbeddingServer(socketserver.ThreadingUnixStreamServer):
+    """
+    :param embeddings: the model, usually an EmbeddingScheduler around it
+    :param socket_path: Unix socket to listen on; a stale socket file is replaced
+    :param max_batch: query texts embedded together at most
+    :param max_wait: seconds a query request waits for others to batch with
+    """
+    daemon_threads = True
+
+    def __init__(self, embeddings, socket_path, max_batch=64, max_wait=0.005):
+        self.embeddings = embeddings
+        self.batcher = _QueryBatcher(embeddings, max_batch, max_wait)
+        socket_path = str(socket_path)
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _Handler)
+        # Only processes of the same user (and group) may use the model
+        os.chmod(socket_path, 0o660)
+
+
+class RemoteEmbeddings(Embeddings):
+    """
+    Client of an EmbeddingServer, one connection per calling thread
+    :param socket_path: the sidecar's Unix socket
+    :param timeout: seconds to wait for a response
+    :param connect_timeout: seconds to wait for the sidecar to come up, so workers can start before it
+    """
+
+    def __init__(self, socket_path, timeout=300.0, connect_timeout=30.0):
+        self.socket_path = str(socket_path)
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+                return sock
+            except OSError:
+                sock.close()
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+
+    def _call(self, kind, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        # Embedding is idempotent, so a request on a dropped connection is sent again once
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None)
+            if sock is None:
+                sock = self._local.sock = self._connect()
+            try:
+                _send(sock, {"kind": kind, "texts": texts})
+                header, payload = _recv(sock)
+                break
+            except (ConnectionError, OSError):
+                sock.close()
+                self._local.sock = None
+                if attempt:
+                    raise
+        if "error" in header:
+            raise RuntimeError(f"Embedding sidecar error: {header['error']}")
+        return np.frombuffer(payload, dtype=np.float32).reshape(header["count"], header["dim"]).tolist()
+
+    def embed_query(self, text):
+        return self._call("query", [text])[0]
+
+    def embed_queries(self, texts):
+        """Embed a batch of questions, batched with other workers' questions"""
+        return self._call("query", texts)
+
+    def embed_documents(self, texts):
+        return self._call("documents", texts)
+
+
+def main():
+    import rag
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=rag.EMBEDDING_SOCKET or "resources/embedding.sock")
+    parser.add_argument("--max-batch", type=int, default=64, help="query texts embedded together at most")
+    parser.add_argument("--max-wait-ms", type=float, default=5, help="time a query waits for others to batch with")
+    args = parser.parse_args()
+
+    server = EmbeddingServer(rag.make_local_embeddings(), args.socket, max_batch=args.max_batch,
+                             max_wait=args.max_wait_ms / 1000)
+    logging.info(f"Serving {rag.EMBEDDING_MODEL} ({rag.EMBEDDING_BACKEND}) on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
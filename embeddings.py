@@ -0,0 +1,99 @@
+"""
+Embedding backends for the vector store.
+
+"torch" is the default SentenceTransformers model in fp32. "onnx" exports the
+same model to ONNX and runs it with ONNX Runtime, and "onnx-int8" additionally
+applies dynamic int8 quantization, which is usually the fastest option on
+CPU-only hosts. Exported models are cached on disk so the export only runs once.
+"""
+import logging
+import os
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+ONNX_CACHE_DIR = Path(__file__).parent / "resources/onnx"
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def default_num_threads():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class OnnxSentenceEmbeddings(Embeddings):
+    """
+    SentenceTransformer model executed by ONNX Runtime
+    :param model_name: Hugging Face model id, e.g. sentence-transformers/sentence-t5-large
+    :param quantize: use a dynamically int8-quantized copy of the exported model
+    :param num_threads: intra-op threads for ONNX Runtime, defaults to the usable CPU count
+    :param quantization_config: target instruction set for quantization (arm64, avx2, avx512, avx512_vnni)
+    """
+
+    def __init__(self, model_name, quantize=False, num_threads=None, quantization_config="avx2",
+                 batch_size=32, cache_dir=ONNX_CACHE_DIR):
+        import onnxruntime as ort
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.num_threads = num_threads or default_num_threads()
+
+        export_dir = Path(cache_dir) / model_name.replace("/", "__")
+        if not (export_dir / "onnx" / "model.onnx").exists():
+            logging.info(f"Exporting {model_name} to ONNX in {export_dir}")
+            SentenceTransformer(model_name, backend="onnx", device="cpu").save_pretrained(str(export_dir))
+
+        file_name = "onnx/model.onnx"
+        if quantize:
+            file_name = f"onnx/model_qint8_{quantization_config}.onnx"
+            if not (export_dir / file_name).exists():
+                from sentence_transformers import export_dynamic_quantized_onnx_model
+                logging.info(f"Quantizing ONNX model to int8 for {quantization_config}")
+                export_dynamic_quantized_onnx_model(
+                    SentenceTransformer(str(export_dir), backend="onnx", device="cpu"),
+                    quantization_config,
+                    str(export_dir)
+                )
+
+        session_options = ort.SessionOptions()
+        session_options.intra_op_num_threads = self.num_threads
+        session_options.inter_op_num_threads = 1
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.model = SentenceTransformer(
+            str(export_dir),
+            backend="onnx",
+            device="cpu",
+            model_kwargs={
+                "file_name": file_name,
+                "provider": "CPUExecutionProvider",
+                "session_options": session_options
+            }
+        )
+        logging.info(f"Loaded ONNX embedding model {file_name} with {self.num_threads} threads")
+
+    def embed_documents(self, texts):
+        embeddings = self.model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True)
+        return embeddings.tolist()
+
+    def embed_query(self, text):
+        return self.model.encode(text, convert_to_numpy=True).tolist()
+
+
+def get_embeddings(model_name, backend="torch", num_threads=None):
+    """
+    Build the embedding function for the configured backend
+    :param model_name: Hugging Face model id
+    :param backend: one of EMBEDDING_BACKENDS
+    :param num_threads: CPU threads for the ONNX backends
+    :return: object implementing embed_documents / embed_query
+    """
+    if backend == "torch":
+        from langchain_community.embeddings import SentenceTransformerEmbeddings
+        return SentenceTransformerEmbeddings(model_name=model_name)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxSentenceEmbeddings(model_name, quantize=backend == "onnx-int8", num_threads=num_threads)
+    raise ValueError(f"Unknown embedding backend '{backend}', expected one of {', '.join(EMBEDDING_BACKENDS)}")
@@ -0,0 +1,354 @@
+"""
+Page fetching for process_urls, one URL at a time, with the order of fetch
+strategies learned per domain.
+
+A page can be fetched seven ways: UnstructuredURLLoader with three desktop
+user agents, requests with standard, mobile or minimal (curl) headers, and
+a headless Chrome through Selenium. Without history, each URL tries them in
+that order until one returns enough text, with a 2 second pause between
+requests-based retries. Hard sites pay for every failing strategy on every
+ingest.
+
+StrategyStats remembers, per domain and strategy, how often the strategy
+succeeded and failed, how many times it failed in a row, and how long its
+successful fetches took. PageFetcher uses that to:
+
+- try strategies that have worked for the domain first, fastest first
+- then strategies without history, in the default order
+- then strategies that failed before but fewer than skip_after times in a row
+- skip strategies that failed skip_after times in a row, until retry_after
+  seconds have passed since their last attempt, so a site that changes gets
+  another chance
+
+Failures are only recorded for URLs that another strategy did fetch, so a
+dead link or an outage does not count against a domain's strategies, and
+neither do environment problems (Selenium or Chrome missing).
+"""
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import metrics
+from chunk_metadata import source_domain
+
+FETCH_ATTEMPTS = metrics.REGISTRY.counter(
+    "docubot_fetch_attempts_total", "Page fetch attempts of process_urls, by strategy and outcome"
+)
+FETCH_SECONDS = metrics.REGISTRY.histogram("docubot_fetch_seconds", "Page fetch attempt time by strategy")
+
+# Shortest text accepted from the requests and browser strategies
+MIN_TEXT_CHARS = 100
+
+DESKTOP_USER_AGENTS = {
+    "unstructured-mac": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "unstructured-windows": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "unstructured-linux": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+}
+
+REQUESTS_OPTIONS = {
+    "requests-standard": {
+        "headers": {
+            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Accept-Language": "en-US,en;q=0.5",
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+            "Upgrade-Insecure-Requests": "1"
+        },
+        "verify": False,
+        "timeout": 30
+    },
+    "requests-mobile": {
+        "headers": {
+            "User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 14_7_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.2 Mobile/15E148 Safari/604.1",
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"
+        },
+        "verify": False,
+        "timeout": 30
+    },
+    "requests-minimal": {
+        "headers": {
+            "User-Agent": "curl/7.68.0"
+        },
+        "verify": False,
+        "timeout": 30
+    },
+}
+
+BROWSER = "selenium"
+
+# Order tried for a domain without history
+DEFAULT_ORDER = [*DESKTOP_USER_AGENTS, *REQUESTS_OPTIONS, BROWSER]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fetch_strategies (
+    domain TEXT NOT NULL,
+    strategy TEXT NOT NULL,
+    successes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    consecutive_failures INTEGER NOT NULL DEFAULT 0,
+    mean_seconds REAL,
+    last_attempt_at REAL NOT NULL,
+    last_success_at REAL,
+    PRIMARY KEY (domain, strategy)
+);
+"""
+
+# Weight of the newest successful fetch in mean_seconds
+SECONDS_SMOOTHING = 0.3
+
+
+class StrategyStats:
+    """
+    Fetch outcomes per domain and strategy, persisted in SQLite
+    :param path: SQLite file, created if missing
+    :param skip_after: consecutive failures after which a strategy is skipped for a domain (0 never skips)
+    :param retry_after: seconds after its last attempt when a skipped strategy is tried again
+    """
+
+    def __init__(self, path, skip_after=3, retry_after=7 * 86400):
+        self.path = str(path)
+        self.skip_after = skip_after
+        self.retry_after = retry_after
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # One connection shared by the ingest threads, serialized by a lock
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def record(self, domain, strategy, success, seconds):
+        """Record one fetch attempt"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO fetch_strategies (domain, strategy, last_attempt_at) VALUES (?, ?, ?)",
+                (domain, strategy, now)
+            )
+            if success:
+                self._conn.execute(
+                    "UPDATE fetch_strategies SET successes = successes + 1, consecutive_failures = 0, "
+                    "mean_seconds = COALESCE(? * ? + (1 - ?) * mean_seconds, ?), "
+                    "last_attempt_at = ?, last_success_at = ? WHERE domain = ? AND strategy = ?",
+                    (SECONDS_SMOOTHING, seconds, SECONDS_SMOOTHING, seconds, now, now, domain, strategy)
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE fetch_strategies SET failures = failures + 1, "
+                    "consecutive_failures = consecutive_failures + 1, last_attempt_at = ? "
+                    "WHERE domain = ? AND strategy = ?",
+                    (now, domain, strategy)
+                )
+
+    def domain(self, domain):
+        """
+        :return: dict of strategy -> row (successes, failures, consecutive_failures, mean_seconds, ...)
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM fetch_strategies WHERE domain = ?", (domain,)).fetchall()
+        return {row["strategy"]: dict(row) for row in rows}
+
+    def plan(self, domain, strategies=DEFAULT_ORDER):
+        """
+        Order strategies for a domain from its history
+        :param strategies: candidate strategies in their default order
+        :return: (strategies to try in order, strategies skipped)
+        """
+        history = self.domain(domain)
+        now = time.time()
+        proven, untried, failing, skipped = [], [], [], []
+        for strategy in strategies:
+            row = history.get(strategy)
+            if row is None:
+                untried.append(strategy)
+            elif row["consecutive_failures"] == 0 and row["successes"]:
+                proven.append(strategy)
+            elif self.skip_after and row["consecutive_failures"] >= self.skip_after \
+                    and now - row["last_attempt_at"] < self.retry_after:
+                skipped.append(strategy)
+            else:
+                failing.append(strategy)
+        # Fastest proven strategy first; failing ones with the fewest failures in a row first
+        proven.sort(key=lambda strategy: history[strategy]["mean_seconds"])
+        failing.sort(key=lambda strategy: history[strategy]["consecutive_failures"])
+        return proven + untried + failing, skipped
+
+
+class _BrowserUnavailable(Exception):
+    """Selenium or Chrome is missing, which says nothing about the domain"""
+
+
+def _html_text(content):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, 'html.parser')
+    for element in soup(["script", "style", "nav", "header", "footer", "aside"]):
+        element.decompose()
+    return ' '.join(soup.get_text(separator=' ', strip=True).split())
+
+
+class PageFetcher:
+    """
+    Fetches one URL at a time with the strategies planned for its domain
+    :param stats: StrategyStats to plan with and record outcomes in; None always uses DEFAULT_ORDER
+    :param retry_delay: seconds to wait before retrying a URL with another requests strategy
+    """
+
+    def __init__(self, stats=None, retry_delay=2.0):
+        import requests
+
+        self.stats = stats
+        self.retry_delay = retry_delay
+        self.session = requests.Session()
+        self._driver = None
+        self._browser_unavailable = False
+
+    def plan(self, url):
+        if self.stats is None:
+            return list(DEFAULT_ORDER), []
+        return self.stats.plan(source_domain(url))
+
+    def fetch(self, url):
+        """
+        Fetch a page, trying planned strategies until one returns text
+        :return: (Document or None, strategy that succeeded or None)
+        """
+        domain = source_domain(url)
+        order, skipped = self.plan(url)
+        if skipped:
+            logging.info(f"Skipping fetch strategies that keep failing on {domain}: {', '.join(skipped)}")
+
+        previous = None
+        failed = []
+        for strategy in order:
+            if strategy == BROWSER and self._browser_unavailable:
+                continue
+            if strategy in REQUESTS_OPTIONS and previous in REQUESTS_OPTIONS:
+                time.sleep(self.retry_delay)
+            previous = strategy
+
+            start = time.perf_counter()
+            try:
+                doc = self._fetch(strategy, url)
+            except _BrowserUnavailable as e:
+                logging.info(f"Browser automation unavailable, skipping it: {e}")
+                self._browser_unavailable = True
+                continue
+            except Exception as e:
+                logging.warning(f"Fetch strategy {strategy} failed for {url}: {e}")
+                doc = None
+            seconds = time.perf_counter() - start
+
+            outcome = "success" if doc is not None else "failure"
+            FETCH_ATTEMPTS.inc(strategy=strategy, outcome=outcome)
+            FETCH_SECONDS.observe(seconds, strategy=strategy)
+            if doc is None:
+                failed.append((strategy, seconds))
+                continue
+            logging.info(f"Fetched {url} with {strategy} in {seconds:.2f}s ({len(doc.page_content)} chars)")
+            if self.stats is not None:
+                # Failures only count when the page could be fetched at all, a dead link is not the strategies' fault
+                for failed_strategy, failed_seconds in failed:
+                    self.stats.record(domain, failed_strategy, False, failed_seconds)
+                self.stats.record(domain, strategy, True, seconds)
+            return doc, strategy
+
+        logging.error(f"All fetch strategies failed for {url}")
+        return None, None
+
+    def _fetch(self, strategy, url):
+        if strategy in DESKTOP_USER_AGENTS:
+            return self._fetch_unstructured(url, DESKTOP_USER_AGENTS[strategy])
+        if strategy in REQUESTS_OPTIONS:
+            return self._fetch_requests(url, REQUESTS_OPTIONS[strategy])
+        return self._fetch_browser(url)
+
+    def _fetch_unstructured(self, url, user_agent):
+        from langchain_community.document_loaders import UnstructuredURLLoader
+
+        loader = UnstructuredURLLoader(
+            urls=[url],
+            headers={
+                "User-Agent": user_agent,
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
+                "Accept-Language": "en-US,en;q=0.9",
+                "Accept-Encoding": "gzip, deflate, br",
+                "Connection": "keep-alive",
+                "Upgrade-Insecure-Requests": "1",
+                "Sec-Fetch-Dest": "document",
+                "Sec-Fetch-Mode": "navigate",
+                "Sec-Fetch-Site": "none",
+                "Cache-Control": "max-age=0"
+            },
+            ssl_verify=False,
+            requests_kwargs={
+                "timeout": 30,
+                "allow_redirects": True,
+                "stream": False
+            }
+        )
+        for doc in loader.load():
+            if doc.page_content.strip():
+                return doc
+        return None
+
+    def _fetch_requests(self, url, options):
+        from langchain.schema import Document
+
+        response = self.session.get(url, **options)
+        if response.status_code != 200:
+            logging.warning(f"HTTP {response.status_code} for {url}")
+            return None
+        text = _html_text(response.content)
+        if len(text) <= MIN_TEXT_CHARS:
+            logging.warning(f"Content too short ({len(text)} chars) from {url}")
+            return None
+        return Document(page_content=text, metadata={"source": url})
+
+    def _fetch_browser(self, url):
+        from langchain.schema import Document
+
+        driver = self._browser()
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        driver.get(url)
+        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+        text = driver.find_element(By.TAG_NAME, "body").text.strip()
+        if len(text) <= MIN_TEXT_CHARS:
+            return None
+        return Document(page_content=text, metadata={"source": url})
+
+    def _browser(self):
+        if self._driver is None:
+            try:
+                from selenium import webdriver
+                from selenium.webdriver.chrome.options import Options
+            except ImportError as e:
+                raise _BrowserUnavailable("selenium is not installed") from e
+
+            chrome_options = Options()
+            chrome_options.add_argument("--headless")
+            chrome_options.add_argument("--no-sandbox")
+            chrome_options.add_argument("--disable-dev-shm-usage")
+            chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+            chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+            chrome_options.add_experimental_option('useAutomationExtension', False)
+            try:
+                self._driver = webdriver.Chrome(options=chrome_options)
+            except Exception as e:
+                raise _BrowserUnavailable(f"Chrome could not be started: {e}") from e
+            self._driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        return self._driver
+
+    def close(self):
+        if self._driver is not None:
+            self._driver.quit()
+            self._driver = None
+        self.session.close()
+
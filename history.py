@@ -0,0 +1,142 @@
+"""
+Question history on disk.
+
+Every answered question is a row in a SQLite table (question, answer, sources,
+filters, the collection version it was answered from, time). The UI keeps only
+the last few entries of a session in memory and reads older ones a page at a
+time. Retention limits (row count and age) are applied as rows are added.
+
+The rows also warm the answer cache after a restart: answers given from the
+collection version that is still current are loaded back with
+rag.warm_answer_cache.
+"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Retention runs after this many inserts instead of on every insert
+PRUNE_EVERY = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    filters TEXT,
+    collection_version TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_session ON history (session_id, id);
+CREATE INDEX IF NOT EXISTS history_created ON history (created_at);
+CREATE INDEX IF NOT EXISTS history_version ON history (collection_version, id);
+"""
+
+
+def _row(row):
+    entry = dict(row)
+    entry["filters"] = json.loads(entry["filters"]) if entry["filters"] else None
+    return entry
+
+
+class HistoryStore:
+    """
+    :param path: SQLite file, created if missing
+    :param max_entries: rows kept across all sessions, oldest deleted first (0 keeps all)
+    :param max_age_days: rows older than this are deleted (0 keeps all)
+    """
+
+    def __init__(self, path, max_entries=10000, max_age_days=30):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # One connection shared by the Streamlit session threads, serialized by a lock
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._inserts = 0
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        self.prune()
+
+    def add(self, session_id, question, answer, sources, filters=None, collection_version=None):
+        """
+        Record an answered question
+        :param filters: retrieval filters as a Chroma where clause (chunk_metadata.build_where)
+        :param collection_version: rag.collection_version() the answer was given from
+        :return: the stored entry
+        """
+        entry = {
+            "session_id": session_id,
+            "question": question,
+            "answer": answer,
+            "sources": sources,
+            "filters": filters or None,
+            "collection_version": collection_version,
+            "created_at": time.time(),
+        }
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO history (session_id, question, answer, sources, filters, collection_version, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (session_id, question, answer, sources, json.dumps(filters) if filters else None,
+                 collection_version, entry["created_at"])
+            )
+            entry["id"] = cursor.lastrowid
+            self._inserts += 1
+            prune = self._inserts % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+        return entry
+
+    def page(self, session_id, page=0, page_size=5):
+        """
+        Entries of a session, newest first
+        :param page: page number, 0 is the newest
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM history WHERE session_id = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+                (session_id, page_size, page * page_size)
+            ).fetchall()
+        return [_row(row) for row in rows]
+
+    def count(self, session_id):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM history WHERE session_id = ?", (session_id,)).fetchone()[0]
+
+    def clear(self, session_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM history WHERE session_id = ?", (session_id,))
+
+    def latest_answers(self, collection_version, limit=256):
+        """
+        Most recent answers given from a collection version, newest first, for warming the answer cache
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM history WHERE collection_version = ? ORDER BY id DESC LIMIT ?",
+                (collection_version, limit)
+            ).fetchall()
+        return [_row(row) for row in rows]
+
+    def prune(self):
+        """Apply the retention limits"""
+        with self._lock, self._conn:
+            if self.max_age_days:
+                self._conn.execute("DELETE FROM history WHERE created_at < ?",
+                                   (time.time() - self.max_age_days * 86400,))
+            if self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM history WHERE id <= (SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
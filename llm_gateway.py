@@ -0,0 +1,343 @@
+"""
+Admission control for LLM calls.
+
+Every call to the chat model goes through an LLMGateway, which
+1. reserves request and token budget from token buckets sized to the provider quota,
+2. waits for one of a bounded number of concurrency slots,
+3. gives up with LLMQueueTimeout when either wait would pass the request deadline,
+4. retries rate-limit, server and connection errors with jittered exponential backoff.
+
+Bucket reservations are taken in arrival order, so waiting requests are
+admitted first come, first served. Time spent waiting is recorded in the
+docubot_llm_queue_seconds histogram.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+import metrics
+
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+QUEUE_SECONDS = metrics.REGISTRY.histogram(
+    "docubot_llm_queue_seconds", "Time LLM calls waited for rate limit budget and a concurrency slot"
+)
+RETRIES = metrics.REGISTRY.counter("docubot_llm_retries_total", "LLM calls retried, by reason")
+REJECTED = metrics.REGISTRY.counter("docubot_llm_rejected_total", "LLM calls rejected before being sent, by reason")
+
+
+class LLMQueueTimeout(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at rate_per_minute.
+    reserve() takes tokens immediately, going into debt if needed, and returns how
+    long the caller has to wait before the reservation is covered.
+    :param rate_per_minute: sustained rate, e.g. the provider's tokens-per-minute quota
+    :param capacity: burst size, defaults to one minute of budget
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, max_wait=None):
+        """
+        :param amount: tokens to take
+        :param max_wait: when the wait would be longer, take nothing and return None
+        :return: seconds to wait before the reserved tokens are available
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = max(0.0, (amount - self.tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self.tokens -= amount
+            return wait
+
+    def refund(self, amount):
+        """Give back (or, with a negative amount, take more of) a reservation once the real cost is known"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ConcurrencySlots:
+    """
+    Counting semaphore shared by threads and event loops, so one limit covers the sync callers and
+    every event loop of the process (asyncio.run creates a new loop for every sync batch call).
+    Slots are handed to waiters first come, first served
+    :param limit: slots
+    """
+
+    def __init__(self, limit):
+        self.free = limit
+        self._waiters = deque()  # threading.Event or (loop, future), oldest first
+        self._lock = threading.Lock()
+
+    def _take(self):
+        if self.free and not self._waiters:
+            self.free -= 1
+            return True
+        return False
+
+    def acquire(self, timeout=None):
+        """:return: True once a slot is held, False when none became free within timeout"""
+        with self._lock:
+            if self._take():
+                return True
+            event = threading.Event()
+            self._waiters.append(event)
+        if event.wait(timeout):
+            return True
+        with self._lock:
+            if event in self._waiters:
+                self._waiters.remove(event)
+                return False
+        # Handed a slot as the wait timed out
+        return True
+
+    async def aacquire(self, timeout=None):
+        """Async version of acquire; a cancelled waiter passes on a slot it was handed"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._take():
+                return True
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[1]), timeout)
+            return True
+        except BaseException as e:
+            with self._lock:
+                handed = waiter not in self._waiters
+                if not handed:
+                    self._waiters.remove(waiter)
+            if handed:
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                return False
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, future = waiter
+                try:
+                    loop.call_soon_threadsafe(_hand_slot, future)
+                    return
+                except RuntimeError:
+                    # The waiter's loop is closed
+                    continue
+            self.free += 1
+
+
+def _hand_slot(future):
+    if not future.done():
+        future.set_result(True)
+
+
+def retry_reason(e):
+    """
+    :return: short reason if the error is worth retrying, otherwise None
+    """
+    status = getattr(e, "status_code", None)
+    if status in RETRYABLE_STATUS_CODES:
+        return str(status)
+    if type(e).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout", "TimeoutError"):
+        return "connection"
+    return None
+
+
+def retry_after(e):
+    """Seconds the provider asked us to wait, from the Retry-After header of the error response"""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(prompt):
+    # Roughly four characters per token for English text
+    return max(1, len(prompt) // 4)
+
+
+class LLMGateway:
+    """
+    :param llm: LangChain chat model
+    :param tokens_per_minute: provider token quota, prompt plus completion tokens
+    :param requests_per_minute: provider request quota
+    :param max_concurrency: calls in flight at once, across threads and event loops
+    :param max_retries: retries after the first attempt
+    :param backoff_base: first backoff ceiling in seconds, doubled on every retry
+    :param backoff_max: largest backoff ceiling in seconds
+    :param queue_timeout: default seconds a call may wait for admission
+    :param completion_tokens: completion tokens reserved per call until the real usage is known
+    """
+
+    def __init__(self, llm, tokens_per_minute=6000, requests_per_minute=30, max_concurrency=4,
+                 max_retries=4, backoff_base=0.5, backoff_max=20.0, queue_timeout=30.0, completion_tokens=500):
+        self.llm = llm
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.requests = TokenBucket(requests_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_timeout = queue_timeout
+        self.completion_tokens = completion_tokens
+        self._slots = ConcurrencySlots(max_concurrency)
+
+    def _backoff(self, attempt, e, reserved):
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        # A retry is another request against the quota, so it reserves budget again
+        quota_wait = max(self.requests.reserve(1), self.tokens.reserve(reserved))
+        # Full jitter, but never sooner than the provider asked for or the quota allows
+        return max(random.uniform(0, ceiling), retry_after(e) or 0.0, quota_wait)
+
+    def _reserve(self, prompt, deadline):
+        """
+        Reserve request and token budget
+        :return: (seconds to wait, tokens reserved)
+        """
+        tokens = estimate_tokens(prompt) + self.completion_tokens
+        remaining = deadline - time.monotonic()
+        request_wait = self.requests.reserve(1, max_wait=remaining)
+        if request_wait is None:
+            REJECTED.inc(reason="deadline")
+            raise LLMQueueTimeout(f"LLM request quota would not allow this call within {self.queue_timeout:.0f}s")
+        token_wait = self.tokens.reserve(tokens, max_wait=remaining)
+        if token_wait is None:
+            self.requests.refund(1)
+            REJECTED.inc(reason="deadline")
+            raise LLMQueueTimeout(f"LLM token quota would not allow this call within {self.queue_timeout:.0f}s")
+        return max(request_wait, token_wait), tokens
+
+    def _cancel(self, reserved):
+        self.requests.refund(1)
+        self.tokens.refund(reserved)
+
+    def _settle(self, reserved, message):
+        usage = getattr(message, "usage_metadata", None) or {}
+        if usage.get("total_tokens"):
+            self.tokens.refund(reserved - usage["total_tokens"])
+
+    def invoke(self, prompt, timeout=None):
+        """
+        Call the LLM once admitted, retrying transient errors
+        :param prompt: prompt text
+        :param timeout: seconds the call may wait in the queue, defaults to queue_timeout
+        :return: the LLM message
+        """
+        start = time.monotonic()
+        deadline = start + (timeout or self.queue_timeout)
+        wait, reserved = self._reserve(prompt, deadline)
+        try:
+            time.sleep(wait)
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                REJECTED.inc(reason="deadline")
+                raise LLMQueueTimeout(f"No LLM slot became free within {self.queue_timeout:.0f}s")
+        except BaseException:
+            # Not admitted (timed out, interrupted): the budget goes back
+            self._cancel(reserved)
+            raise
+        QUEUE_SECONDS.observe(time.monotonic() - start, mode="sync")
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    message = self.llm.invoke(prompt)
+                    self._settle(reserved, message)
+                    return message
+                except Exception as e:
+                    reason = retry_reason(e)
+                    if reason is None or attempt == self.max_retries:
+                        raise
+                    RETRIES.inc(reason=reason)
+                    delay = self._backoff(attempt, e, reserved)
+                    logging.warning(f"LLM call failed ({reason}), retry {attempt + 1} in {delay:.1f}s")
+                    time.sleep(delay)
+        finally:
+            self._slots.release()
+
+    async def _admit(self, prompt, timeout):
+        start = time.monotonic()
+        deadline = start + (timeout or self.queue_timeout)
+        wait, reserved = self._reserve(prompt, deadline)
+        try:
+            await asyncio.sleep(wait)
+            if not await self._slots.aacquire(timeout=max(0.0, deadline - time.monotonic())):
+                REJECTED.inc(reason="deadline")
+                raise LLMQueueTimeout(f"No LLM slot became free within {self.queue_timeout:.0f}s")
+        except BaseException:
+            # Not admitted (timed out, or cancelled when a client disconnects): the budget goes back
+            self._cancel(reserved)
+            raise
+        QUEUE_SECONDS.observe(time.monotonic() - start, mode="async")
+        return reserved
+
+    async def ainvoke(self, prompt, timeout=None):
+        """Async version of invoke"""
+        reserved = await self._admit(prompt, timeout)
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    message = await self.llm.ainvoke(prompt)
+                    self._settle(reserved, message)
+                    return message
+                except Exception as e:
+                    reason = retry_reason(e)
+                    if reason is None or attempt == self.max_retries:
+                        raise
+                    RETRIES.inc(reason=reason)
+                    delay = self._backoff(attempt, e, reserved)
+                    logging.warning(f"LLM call failed ({reason}), retry {attempt + 1} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+        finally:
+            self._slots.release()
+
+    async def astream(self, prompt, timeout=None):
+        """
+        Stream message chunks once admitted. A failed attempt is only retried
+        if it failed before the first chunk was produced.
+        """
+        reserved = await self._admit(prompt, timeout)
+        try:
+            for attempt in range(self.max_retries + 1):
+                started = False
+                total = None
+                try:
+                    async for chunk in self.llm.astream(prompt):
+                        started = True
+                        yield chunk
+                        total = chunk if total is None else total + chunk
+                    if total is not None:
+                        self._settle(reserved, total)
+                    return
+                except Exception as e:
+                    reason = retry_reason(e)
+                    if started or reason is None or attempt == self.max_retries:
+                        raise
+                    RETRIES.inc(reason=reason)
+                    delay = self._backoff(attempt, e, reserved)
+                    logging.warning(f"LLM stream failed ({reason}), retry {attempt + 1} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+        finally:
+            self._slots.release()
@@ -0,0 +1,119 @@
+"""
+Routing questions between a fast small model and the full model.
+
+Most questions are lookups ("what is the 30-year fixed rate?") that a small
+model answers from one clearly relevant chunk as well as the 70B model does,
+in a fraction of the time and quota. LLMRouter looks at cheap signals that
+are known once retrieval is done, before the prompt is sent:
+
+- question type: lookup phrasing versus explain / compare / should / why
+- query length in words
+- retrieval score spread: relevance of the best chunk over the mean of the
+  others. A clear winner means the answer sits in one chunk, a flat spread
+  means it has to be pieced together
+- context size: estimated prompt tokens of the retrieved chunks
+
+A question goes to the fast route only when every signal says it is easy;
+any hard signal sends it to the full route. Each route has its own model and
+completion token cap. Decisions, LLM time and tokens are recorded per route.
+"""
+import re
+
+import metrics
+from llm_gateway import estimate_tokens
+
+ROUTE_DECISIONS = metrics.REGISTRY.counter(
+    "docubot_llm_route_total", "Questions routed to each LLM route, by route and reason"
+)
+ROUTE_SECONDS = metrics.REGISTRY.histogram("docubot_llm_route_seconds", "LLM call time by route")
+ROUTE_TOKENS = metrics.REGISTRY.counter("docubot_llm_route_tokens_total", "LLM prompt and completion tokens by route")
+
+FAST = "fast"
+FULL = "full"
+
+_REASONING = re.compile(
+    r"\b(why|explain|compare[sd]?|comparison|difference|differ|versus|vs|should|pros|cons|trade-?offs?|impact|"
+    r"affects?|effects?|influences?|predict|forecast|recommend|strategy|analy[sz]e|summari[sz]e|if)\b",
+    re.IGNORECASE
+)
+_LOOKUP = re.compile(
+    r"^\s*(what|how (much|many|high|low|long|often)|when|who|which|where|is|are|was|were|does|do|did|can|list|show|give)\b",
+    re.IGNORECASE
+)
+
+
+def question_type(query):
+    """
+    :return: "reasoning" when the question asks for an explanation, comparison or advice,
+        "lookup" for a factual question, otherwise "other"
+    """
+    if _REASONING.search(query):
+        return "reasoning"
+    if _LOOKUP.search(query):
+        return "lookup"
+    return "other"
+
+
+def route_signals(query, retrieved_docs):
+    """
+    :param retrieved_docs: documents from retrieval, with a "relevance" metadata value (cosine
+        similarity to the query) when the search recorded one
+    :return: dict with question_type, query_words, top_relevance, relevance_spread and context_tokens
+    """
+    relevance = sorted(
+        (doc.metadata["relevance"] for doc in retrieved_docs if "relevance" in doc.metadata), reverse=True
+    )
+    spread = None
+    if len(relevance) > 1:
+        spread = relevance[0] - sum(relevance[1:]) / (len(relevance) - 1)
+    return {
+        "question_type": question_type(query),
+        "query_words": len(query.split()),
+        "top_relevance": relevance[0] if relevance else None,
+        "relevance_spread": spread,
+        "context_tokens": sum(estimate_tokens(doc.page_content) for doc in retrieved_docs),
+    }
+
+
+class LLMRouter:
+    """
+    :param max_query_words: longer questions go to the full route
+    :param min_relevance_spread: smaller spreads (no clearly best chunk) go to the full route
+    :param max_context_tokens: larger retrieved contexts go to the full route
+    :param enabled: when False every question goes to the full route
+    """
+
+    def __init__(self, max_query_words=20, min_relevance_spread=0.02, max_context_tokens=1200, enabled=True):
+        self.max_query_words = max_query_words
+        self.min_relevance_spread = min_relevance_spread
+        self.max_context_tokens = max_context_tokens
+        self.enabled = enabled
+
+    def choose(self, query, retrieved_docs):
+        """
+        Pick the route for a question
+        :return: (route, reason, signals); route is FAST or FULL, reason names the deciding signal
+        """
+        signals = route_signals(query, retrieved_docs)
+        if not self.enabled:
+            route, reason = FULL, "disabled"
+        elif signals["question_type"] != "lookup":
+            route, reason = FULL, signals["question_type"]
+        elif signals["query_words"] > self.max_query_words:
+            route, reason = FULL, "long_query"
+        elif signals["context_tokens"] > self.max_context_tokens:
+            route, reason = FULL, "large_context"
+        elif signals["relevance_spread"] is not None and signals["relevance_spread"] < self.min_relevance_spread:
+            route, reason = FULL, "flat_relevance"
+        else:
+            route, reason = FAST, "lookup"
+        ROUTE_DECISIONS.inc(route=route, reason=reason)
+        return route, reason, signals
+
+
+def record_route_call(route, seconds, usage):
+    """Record the time and token usage of one LLM call on a route"""
+    usage = usage or {}
+    ROUTE_SECONDS.observe(seconds, route=route)
+    ROUTE_TOKENS.inc(usage.get("input_tokens", 0), route=route, kind="prompt")
+    ROUTE_TOKENS.inc(usage.get("output_tokens", 0), route=route, kind="completion")
@@ -0,0 +1,44 @@
+"""
+Sampled logging for high-volume per-item events.
+
+Ingest loops can hit the same condition thousands of times (e.g. chunks that
+are too short). SampledLogger logs the first few occurrences and then every
+Nth one, and counts the rest so the stage can report them in one summary line.
+Arguments are passed through to the logging call lazily, so nothing is
+formatted for events that are not emitted.
+"""
+import logging
+
+
+class SampledLogger:
+    """
+    :param level: logging level of the sampled records
+    :param first: number of occurrences always logged
+    :param every: after that, log one occurrence in every this many
+    :param logger: logger to write to, defaults to the root logger
+    """
+
+    def __init__(self, level=logging.WARNING, first=5, every=100, logger=None):
+        self.level = level
+        self.first = first
+        self.every = every
+        self.logger = logger or logging.getLogger()
+        self.count = 0
+        self.logged = 0
+
+    def log(self, msg, *args):
+        self.count += 1
+        if self.count > self.first and self.count % self.every:
+            return
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, msg, *args)
+            self.logged += 1
+
+    @property
+    def suppressed(self):
+        return self.count - self.logged
+
+    def summary(self, what):
+        """Log how many events of this kind happened if some were not logged individually"""
+        if self.suppressed and self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, "%d %s (%d not logged individually)", self.count, what, self.suppressed)
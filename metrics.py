@@ -0,0 +1,236 @@
+"""
+Lightweight in-process metrics for the RAG pipeline.
+
+Counters, latency histograms and timing spans are plain Python objects
+guarded by a lock, cheap enough to leave on in production. They can be
+exported in Prometheus text format (render_prometheus / start_metrics_server)
+and, when the opentelemetry API is installed, mirrored to OpenTelemetry
+instruments with enable_opentelemetry().
+"""
+import http.server
+import logging
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+        self._otel = None
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        if self._otel is not None:
+            self._otel.add(amount, labels)
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(f"{self.name}{_format_labels(key)}", value) for key, value in self._values.items()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        self._otel = None
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+        if self._otel is not None:
+            self._otel.record(value, labels)
+
+    def summary(self, **labels):
+        series = self._series.get(_label_key(labels))
+        if not series:
+            return {"count": 0, "sum": 0.0}
+        return {"count": series["count"], "sum": series["sum"]}
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            for key, series in self._series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    lines.append((f"{self.name}_bucket{_format_labels(key, [('le', bound)])}", cumulative))
+                lines.append((f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])}", series["count"]))
+                lines.append((f"{self.name}_sum{_format_labels(key)}", series["sum"]))
+                lines.append((f"{self.name}_count{_format_labels(key)}", series["count"]))
+        return lines
+
+
+class Span:
+    """Times a block of work into a histogram; use as a context manager or call end()"""
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = time.perf_counter()
+        self.seconds = None
+
+    def end(self):
+        if self.seconds is None:
+            self.seconds = time.perf_counter() - self.start
+            self.histogram.observe(self.seconds, **self.labels)
+        return self.seconds
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end()
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._meter = None
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            if self._meter is not None:
+                self._bind_otel(metric)
+            return metric
+
+    def counter(self, name, description):
+        return self._register(Counter(name, description))
+
+    def histogram(self, name, description, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, description, buckets))
+
+    def render_prometheus(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {value}" for name, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def _bind_otel(self, metric):
+        if metric.kind == "counter":
+            metric._otel = self._meter.create_counter(metric.name, description=metric.description)
+        else:
+            metric._otel = self._meter.create_histogram(metric.name, unit="s", description=metric.description)
+
+    def enable_opentelemetry(self, meter_name="docubot"):
+        """
+        Mirror every metric to OpenTelemetry instruments of the global MeterProvider.
+        Exporters are configured by the application, e.g. with opentelemetry-sdk.
+        """
+        from opentelemetry import metrics as otel_metrics
+        with self._lock:
+            self._meter = otel_metrics.get_meter(meter_name)
+            for metric in self._metrics.values():
+                self._bind_otel(metric)
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "docubot_stage_seconds", "Time spent in each ingest and query stage"
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "docubot_stage_errors_total", "Ingest and query stages that ended in an error"
+)
+PAGES = REGISTRY.counter("docubot_pages_total", "Pages fetched by process_urls, by outcome")
+CHUNKS = REGISTRY.counter("docubot_chunks_total", "Chunks seen by each ingest stage")
+TOKENS = REGISTRY.counter("docubot_embedding_tokens_total", "Tokens in chunks sent to the embedding model")
+CACHE_HITS = REGISTRY.counter("docubot_cache_hits_total", "Cache hits, by cache")
+CACHE_MISSES = REGISTRY.counter("docubot_cache_misses_total", "Cache misses, by cache")
+LLM_TOKENS = REGISTRY.counter("docubot_llm_tokens_total", "LLM prompt and completion tokens")
+
+
+def span(pipeline, stage):
+    """
+    Start timing a pipeline stage
+    :param pipeline: "ingest" or "query"
+    :param stage: stage name, e.g. "fetch" or "retrieve"
+    """
+    return Span(STAGE_SECONDS, {"pipeline": pipeline, "stage": stage})
+
+
+def render_prometheus():
+    return REGISTRY.render_prometheus()
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serve /metrics in Prometheus text format from a daemon thread, once per process"""
+    global _server
+    if _server is not None:
+        return _server
+    try:
+        _server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        # Another worker on this host already serves the port
+        logging.warning(f"Metrics server not started on port {port}: {e}")
+        return None
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    logging.info(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+    return _server
@@ -0,0 +1,46 @@
+"""
+Vectorized Maximum Marginal Relevance selection.
+
+The candidate similarity matrix is computed in one matrix product and the
+greedy loop only keeps a running "most similar selected chunk" score per
+candidate, so each step costs O(fetch_k) instead of re-comparing every
+candidate with every selected chunk.
+"""
+import numpy as np
+
+
+def mmr_select(query_vector, candidate_vectors, k=6, lambda_mult=0.7):
+    """
+    Pick k diverse, relevant candidates
+    :param query_vector: query embedding
+    :param candidate_vectors: (fetch_k, dim) candidate embeddings
+    :param k: number of candidates to select
+    :param lambda_mult: 1 is pure relevance, 0 is pure diversity
+    :return: indices of the selected candidates, in selection order
+    """
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    if candidates.ndim != 2 or candidates.shape[0] == 0 or k <= 0:
+        return []
+
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    max_similarity = similarity[first].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[first] = False
+
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+
+    return selected
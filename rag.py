@@ -1,23 +1,50 @@
 import os
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+import asyncio
 import copy
+import functools
+import json
 import logging
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
 from pydantic.v1 import utils
 from uuid import uuid4
 from dotenv import load_dotenv
 from pathlib import Path
 from langchain.chains import RetrievalQAWithSourcesChain
-from langchain_community.document_loaders import UnstructuredURLLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
 from langchain_groq import ChatGroq
-from langchain_community.embeddings import SentenceTransformerEmbeddings
+from langchain.prompts import PromptTemplate
 from transformers import AutoTokenizer
 from unstructured.cleaners.core import clean_extra_whitespace, remove_punctuation
+from chunk_metadata import ScopeCache, add_positions, build_where, page_metadata
+from content_chunking import ContentDefinedSplitter, chunk_id
+from crawler import Crawler
+from dedup import NearDuplicateIndex, deduplicate_documents, link_duplicate
+from embeddings import get_embeddings
+from embedding_scheduler import EmbeddingScheduler
+from embedding_server import RemoteEmbeddings
+from fetch_strategies import PageFetcher, StrategyStats
+from compact_vectors import CompactVectorIndex, ProjectedEmbeddings, reproject
+from mmr import mmr_select
+from snapshot import import_snapshot
+from vector_backend import SharedCollection, WriteGeneration, call_with_retries, make_client
+import metrics
+from llm_gateway import LLMGateway
+from llm_router import FAST, FULL, LLMRouter, record_route_call
+from log_sampling import SampledLogger
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+try:
+    import fcntl
+except ImportError:  # Windows: ingests are only serialized within the API process
+    fcntl = None
+
+# Set up logging; per-item detail is logged at DEBUG, stages log one summary line at INFO
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Patch smart_deepcopy to handle classmethod
 original_smart_deepcopy = utils.smart_deepcopy
@@ -33,28 +60,254 @@ load_dotenv()
 
 # Constants
 CHUNK_SIZE = 400  # Increased from 200 for better context
+CHUNKING_MODE = os.getenv("CHUNKING_MODE", "recursive")  # "recursive", or "content" for content-defined chunks synced in place
 EMBEDDING_MODEL = "sentence-transformers/sentence-t5-large"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # "torch", "onnx" or "onnx-int8"
+EMBEDDING_NUM_THREADS = int(os.getenv("EMBEDDING_NUM_THREADS", "0")) or None  # ONNX Runtime threads, default all usable cores
+EMBEDDING_SOCKET = os.getenv("EMBEDDING_SOCKET", "")  # Unix socket of an embedding_server.py sidecar shared by all workers
 VECTORSTORE_DIR = Path(__file__).parent / "resources/vectorstore"
 COLLECTION_NAME = "real_estate"
+DEDUP_MODE = os.getenv("DEDUP_MODE", "drop")  # "drop", "link" or "off"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))  # Estimated Jaccard similarity of word shingles
+VECTOR_PCA_DIM = int(os.getenv("VECTOR_PCA_DIM", "0"))  # >0 indexes PCA-projected vectors of this size
+VECTOR_RESCORE_CODEC = os.getenv("VECTOR_RESCORE_CODEC", "float16")  # Full vectors kept for rescoring: "float16" or "int8"
+CHUNK_STORE = os.getenv("CHUNK_STORE", "chroma")  # "chroma", or "zstd" for chunk text compressed in a side store
+CHUNK_STORE_LEVEL = int(os.getenv("CHUNK_STORE_LEVEL", "3"))  # zstd compression level of the side store
+
+# Embedding scheduler lanes: query embeddings run first, ingest batches yield to them
+EMBED_QUERY_THREADS = int(os.getenv("EMBED_QUERY_THREADS", "0")) or None  # Default a quarter of the cores
+EMBED_INGEST_THREADS = int(os.getenv("EMBED_INGEST_THREADS", "0")) or None  # Default the remaining cores
+EMBED_INGEST_BATCH = int(os.getenv("EMBED_INGEST_BATCH", "16"))  # Chunks per ingest batch between checks for queries
+EMBED_INGEST_MAX_DEFER = float(os.getenv("EMBED_INGEST_MAX_DEFER", "2"))  # Longest an ingest batch waits for queries
+EMBED_INGEST_NICE = int(os.getenv("EMBED_INGEST_NICE", "10"))  # Lower CPU priority of the ingest lane (Linux), 0 disables
+
+# Vector store backend: embedded on VECTORSTORE_DIR, or a Chroma server shared by all processes when CHROMA_HOST is set
+CHROMA_HOST = os.getenv("CHROMA_HOST", "")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+CHROMA_SSL = os.getenv("CHROMA_SSL", "false").lower() == "true"
+CHROMA_READ_HOST = os.getenv("CHROMA_READ_HOST", "") or CHROMA_HOST  # Endpoint for queries, defaults to the write endpoint
+CHROMA_READ_PORT = int(os.getenv("CHROMA_READ_PORT", "0")) or CHROMA_PORT
+CHROMA_MAX_CONNECTIONS = int(os.getenv("CHROMA_MAX_CONNECTIONS", "20"))  # Pooled HTTP connections per client
+CHROMA_RETRIES = int(os.getenv("CHROMA_RETRIES", "3"))  # Retries of connection errors per call
+CHROMA_CONNECT_TIMEOUT = float(os.getenv("CHROMA_CONNECT_TIMEOUT", "30"))  # Seconds to wait for the server on startup
+
+# HNSW index settings, applied when the collection is created
+HNSW_SPACE = os.getenv("HNSW_SPACE", "l2")  # "l2", "cosine" or "ip"
+HNSW_CONSTRUCTION_EF = int(os.getenv("HNSW_CONSTRUCTION_EF", "100"))
+HNSW_SEARCH_EF = int(os.getenv("HNSW_SEARCH_EF", "100"))
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+
+# Retrieval settings
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "6"))  # Increased from 3 to get more context
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "12"))  # Candidates fetched before MMR filtering
+MMR_LAMBDA_MULT = float(os.getenv("MMR_LAMBDA_MULT", "0.7"))  # Balance between relevance and diversity
+SCOPE_CACHE_MAX_CHUNKS = int(os.getenv("SCOPE_CACHE_MAX_CHUNKS", "20000"))  # Chunks of filtered searches kept in memory, 0 disables
+
+# LLM admission control, sized to the Groq quota of the model
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "6000"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))  # Seconds a question may wait for the LLM
+
+# LLM routing: easy lookups go to a fast small model, everything else to the full model (see llm_router.py).
+# Groq quotas are per model, so each route gets its own gateway with the limits above
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "1500"))  # Completion token cap of the full route
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "llama-3.1-8b-instant")
+LLM_FAST_MAX_TOKENS = int(os.getenv("LLM_FAST_MAX_TOKENS", "400"))  # Completion token cap of the fast route
+LLM_ROUTING = os.getenv("LLM_ROUTING", "true").lower() == "true"  # false sends every question to LLM_MODEL
+# Completion tokens the gateway reserves per call until the real usage is known, at most the route's token cap
+LLM_RESERVED_COMPLETION_TOKENS = int(os.getenv("LLM_RESERVED_COMPLETION_TOKENS", "500"))
+ROUTER_MAX_QUERY_WORDS = int(os.getenv("ROUTER_MAX_QUERY_WORDS", "20"))  # Longer questions use the full model
+ROUTER_MIN_RELEVANCE_SPREAD = float(os.getenv("ROUTER_MIN_RELEVANCE_SPREAD", "0.02"))  # Flatter retrieval scores use the full model
+ROUTER_MAX_CONTEXT_TOKENS = int(os.getenv("ROUTER_MAX_CONTEXT_TOKENS", "1200"))  # Larger contexts use the full model
+
+# Question history (see history.py) and the answer cache it warms after a restart
+HISTORY_DB = Path(os.getenv("HISTORY_DB", str(Path(__file__).parent / "resources/history.sqlite3")))
+HISTORY_MAX_ENTRIES = int(os.getenv("HISTORY_MAX_ENTRIES", "10000"))  # Rows kept across all sessions, 0 keeps all
+HISTORY_MAX_AGE_DAYS = int(os.getenv("HISTORY_MAX_AGE_DAYS", "30"))  # 0 keeps all
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "5"))  # Recent questions per UI session kept in memory
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))  # Answers kept per process, 0 disables
+
+# Fetch strategies of process_urls, ordered per domain from earlier ingests (see fetch_strategies.py)
+FETCH_STRATEGY_MEMORY = os.getenv("FETCH_STRATEGY_MEMORY", "true").lower() == "true"  # false always uses the default order
+FETCH_STATS_DB = Path(os.getenv("FETCH_STATS_DB", str(Path(__file__).parent / "resources/fetch_stats.sqlite3")))
+FETCH_SKIP_AFTER = int(os.getenv("FETCH_SKIP_AFTER", "3"))  # Failures in a row after which a strategy is skipped for a domain, 0 never skips
+FETCH_RETRY_SKIPPED_DAYS = float(os.getenv("FETCH_RETRY_SKIPPED_DAYS", "7"))  # Skipped strategies are tried again after this long
+
+# Snapshot loaded on startup when the collection is empty, see snapshot.py
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "")
+
+# Crawl mode
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "2"))  # Link hops followed from the seed URLs
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "200"))
+CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", "8"))  # Pages fetched concurrently
+CRAWL_HOST_DELAY = float(os.getenv("CRAWL_HOST_DELAY", "0.25"))  # Minimum seconds between requests to one host
+CRAWL_BATCH_PAGES = int(os.getenv("CRAWL_BATCH_PAGES", "20"))  # Pages indexed together while the crawl continues
+
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))  # LLM calls in flight per batch of questions
+
+# Metrics export: Prometheus text on this port (0 disables), optionally mirrored to OpenTelemetry
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_OTEL = os.getenv("METRICS_OTEL", "false").lower() == "true"
 
 llm = None
+fast_llm = None
 vector_store = None
+write_collection = None
+read_collection = None
+scope_cache = None
+write_generation = None
+embeddings = None
+compact_index = None
+chunk_store = None
+tokenizer = None
+llm_gateways = {}
+llm_gateways_lock = threading.Lock()
+answer_cache = OrderedDict()
+answer_cache_lock = threading.Lock()
+
+# Custom prompt template for more reliable answers
+ANSWER_PROMPT = PromptTemplate(
+    template="""You are an intelligent assistant that provides accurate, detailed answers based on the given context. 
+
+Context information:
+{context}
+
+Question: {question}
+
+Instructions:
+1. Provide a comprehensive answer based ONLY on the information in the context above
+2. If the context contains relevant information, provide a detailed, well-structured response
+3. Include specific details, numbers, dates, and facts when available
+4. If the context doesn't contain enough information to fully answer the question, say "Based on the available information..." and provide what you can
+5. NEVER say "I don't know" - always try to extract and present any relevant information from the context
+6. Organize your response clearly with proper formatting
+7. Be specific and cite relevant details from the source material
+
+Answer:""",
+    input_variables=["context", "question"]
+)
+
+def hnsw_metadata():
+    """Collection metadata carrying the HNSW index settings"""
+    return {
+        "hnsw:space": HNSW_SPACE,
+        "hnsw:construction_ef": HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": HNSW_SEARCH_EF,
+        "hnsw:M": HNSW_M
+    }
+
+def warn_on_hnsw_mismatch():
+    """
+    An existing collection keeps the HNSW settings it was created with: Chroma ignores the
+    metadata it is reopened with, and content mode never recreates it
+    """
+    try:
+        stored = write_collection.hnsw_settings()
+    except Exception as e:
+        logging.warning(f"Could not read the HNSW settings of the collection: {e}")
+        return
+    changed = {key: (stored[key], value) for key, value in hnsw_metadata().items()
+               if stored[key] is not None and stored[key] != value}
+    if changed:
+        settings = ", ".join(f"{key.split(':')[1]} {old} (configured {new})" for key, (old, new) in changed.items())
+        when = "until it is deleted" if CHUNKING_MODE == "content" else "until the next ingest recreates it"
+        logging.warning(f"The collection keeps the HNSW settings it was created with, {when}: {settings}")
+
+def get_tokenizer():
+    """Tokenizer used to enforce the embedding token limit, loaded once per process"""
+    global tokenizer
+    if tokenizer is None:
+        metrics.CACHE_MISSES.inc(cache="tokenizer")
+        tokenizer = AutoTokenizer.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
+    else:
+        metrics.CACHE_HITS.inc(cache="tokenizer")
+    return tokenizer
+
+def get_llm_gateway(route=FULL):
+    """Gateway around the current model of a route, rebuilt if the model has been replaced"""
+    model = fast_llm if route == FAST else llm
+    # One gateway per route, so every thread paces against the same buckets and slots
+    with llm_gateways_lock:
+        gateway = llm_gateways.get(route)
+        if gateway is None or gateway.llm is not model:
+            max_tokens = LLM_FAST_MAX_TOKENS if route == FAST else LLM_MAX_TOKENS
+            gateway = llm_gateways[route] = LLMGateway(
+                model,
+                tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                max_concurrency=LLM_MAX_CONCURRENCY,
+                max_retries=LLM_MAX_RETRIES,
+                queue_timeout=LLM_QUEUE_TIMEOUT,
+                completion_tokens=min(LLM_RESERVED_COMPLETION_TOKENS, max_tokens)
+            )
+    return gateway
+
+def choose_route(query, retrieved_docs):
+    """
+    Route a question to the fast or the full model
+    :return: FAST or FULL; always FULL when routing is off or no fast model is set
+    """
+    router = LLMRouter(
+        max_query_words=ROUTER_MAX_QUERY_WORDS,
+        min_relevance_spread=ROUTER_MIN_RELEVANCE_SPREAD,
+        max_context_tokens=ROUTER_MAX_CONTEXT_TOKENS,
+        enabled=LLM_ROUTING and fast_llm is not None
+    )
+    route, reason, signals = router.choose(query, retrieved_docs)
+    logging.info(f"Routed to the {route} model ({reason}): {signals}")
+    return route
+
+def make_local_embeddings():
+    """Load the embedding model in this process, behind the query/ingest scheduler"""
+    return EmbeddingScheduler(
+        get_embeddings(
+            EMBEDDING_MODEL,
+            backend=EMBEDDING_BACKEND,
+            num_threads=EMBEDDING_NUM_THREADS
+        ),
+        query_threads=EMBED_QUERY_THREADS,
+        ingest_threads=EMBED_INGEST_THREADS,
+        ingest_batch_size=EMBED_INGEST_BATCH,
+        max_ingest_defer=EMBED_INGEST_MAX_DEFER,
+        ingest_nice=EMBED_INGEST_NICE
+    )
 
 def initialize_components():
-    global llm, vector_store
+    global llm, fast_llm, vector_store, write_collection, read_collection, scope_cache, write_generation, embeddings, compact_index, chunk_store
     logging.info("Initializing components...")
+
+    if METRICS_PORT:
+        metrics.start_metrics_server(METRICS_PORT)
+    if METRICS_OTEL:
+        try:
+            metrics.REGISTRY.enable_opentelemetry()
+        except ImportError:
+            logging.warning("METRICS_OTEL is set but opentelemetry is not installed")
     
     if llm is None:
         try:
             # Optimized LLM configuration for better, more reliable answers
             llm = ChatGroq(
-                model="llama-3.3-70b-versatile", 
+                model=LLM_MODEL,
                 temperature=0.1,  # Lower temperature for more consistent, factual responses
-                max_tokens=1500,  # Increased token limit for more detailed answers
+                max_tokens=LLM_MAX_TOKENS,  # Increased token limit for more detailed answers
                 top_p=0.9,       # Focus on most likely tokens
                 frequency_penalty=0.1,  # Reduce repetition
-                presence_penalty=0.1    # Encourage diverse vocabulary
+                presence_penalty=0.1,   # Encourage diverse vocabulary
+                max_retries=0           # Retries are handled by the LLM gateway
             )
+            # Only paired with the default model: a replaced llm (tests, benchmarks) answers everything
+            if LLM_ROUTING and fast_llm is None:
+                fast_llm = ChatGroq(
+                    model=LLM_FAST_MODEL,
+                    temperature=0.1,
+                    max_tokens=LLM_FAST_MAX_TOKENS,
+                    top_p=0.9,
+                    max_retries=0
+                )
             logging.info("LLM initialized successfully")
         except Exception as e:
             logging.error(f"Failed to initialize LLM: {e}")
@@ -62,357 +315,334 @@ def initialize_components():
 
     if vector_store is None:
         try:
-            ef = SentenceTransformerEmbeddings(
-                model_name=EMBEDDING_MODEL
-            )
-            vector_store = Chroma(
+            if EMBEDDING_SOCKET:
+                # The model lives in the sidecar, this process keeps no copy of the weights
+                embeddings = RemoteEmbeddings(EMBEDDING_SOCKET)
+                logging.info(f"Using the embedding sidecar on {EMBEDDING_SOCKET}")
+            else:
+                embeddings = make_local_embeddings()
+            ef = embeddings
+            if VECTOR_PCA_DIM > 0:
+                # Chroma indexes projected vectors, full vectors live in the compact side store
+                compact_index = CompactVectorIndex(
+                    VECTORSTORE_DIR / f"{COLLECTION_NAME}_compact",
+                    dim=VECTOR_PCA_DIM,
+                    codec=VECTOR_RESCORE_CODEC
+                )
+                # Projects through the index, which follows refits and re-ingests by other processes
+                ef = ProjectedEmbeddings(embeddings, compact_index)
+                if CHROMA_HOST:
+                    logging.warning("VECTOR_PCA_DIM keeps full vectors in a local side store, which processes on other hosts cannot see")
+            if CHUNK_STORE == "zstd":
+                from chunk_store import CompressedChunkStore
+
+                # Chroma keeps vectors and metadata, chunk text lives compressed in the side store
+                chunk_store = CompressedChunkStore(VECTORSTORE_DIR / f"{COLLECTION_NAME}_chunks.sqlite3",
+                                                   level=CHUNK_STORE_LEVEL)
+                if CHROMA_HOST:
+                    logging.warning("CHUNK_STORE=zstd keeps chunk text in a local side store, which processes on other hosts cannot see")
+
+            write_client = make_client(CHROMA_HOST, CHROMA_PORT, CHROMA_SSL, VECTORSTORE_DIR, CHROMA_MAX_CONNECTIONS,
+                                       connect_timeout=CHROMA_CONNECT_TIMEOUT)
+            read_client = write_client
+            if (CHROMA_READ_HOST, CHROMA_READ_PORT) != (CHROMA_HOST, CHROMA_PORT):
+                read_client = make_client(CHROMA_READ_HOST, CHROMA_READ_PORT, CHROMA_SSL, VECTORSTORE_DIR,
+                                          CHROMA_MAX_CONNECTIONS, connect_timeout=CHROMA_CONNECT_TIMEOUT)
+
+            # The LangChain store resets the collection; reads and writes go through handles that
+            # follow the collection when another process (or the reset) recreates it
+            vector_store = call_with_retries(lambda: Chroma(
                 collection_name=COLLECTION_NAME,
                 embedding_function=ef,
-                persist_directory=str(VECTORSTORE_DIR)
-            )
-            logging.info("Vector store initialized successfully")
+                client=write_client,
+                collection_metadata=hnsw_metadata()
+            ), retries=CHROMA_RETRIES)
+            write_collection = SharedCollection(write_client, COLLECTION_NAME, hnsw_metadata(), retries=CHROMA_RETRIES,
+                                                label="write")
+            read_collection = SharedCollection(read_client, COLLECTION_NAME, hnsw_metadata(), retries=CHROMA_RETRIES)
+            write_generation = WriteGeneration(write_client, COLLECTION_NAME, retries=CHROMA_RETRIES)
+            # Ranks in the space the collection was created with, which may not be HNSW_SPACE
+            scope_cache = ScopeCache(max_chunks=SCOPE_CACHE_MAX_CHUNKS, version=collection_version)
+            warn_on_hnsw_mismatch()
+            backend = f"Chroma server at {CHROMA_HOST}:{CHROMA_PORT}" if CHROMA_HOST else f"embedded Chroma in {VECTORSTORE_DIR}"
+            logging.info(f"Vector store initialized successfully ({backend})")
         except Exception as e:
             logging.error(f"Failed to initialize vector store: {e}")
             raise
 
-def process_urls(urls):
+        # Warm start from a prebuilt collection instead of scraping and embedding
+        if SNAPSHOT_PATH and write_collection.count() == 0:
+            try:
+                import_snapshot(SNAPSHOT_PATH, write_collection, compact_index, embedding_model=EMBEDDING_MODEL,
+                                chunk_store=chunk_store, dim=len(embeddings.embed_query("dimension")))
+            except Exception as e:
+                logging.error(f"Failed to load snapshot {SNAPSHOT_PATH}: {e}")
+
+def filter_chunks_by_tokens(docs, tokenizer, max_tokens=256):
     """
-    This function scrapes data from a url and stores it in a vector db
-    :param urls: input urls
-    :return:
+    Drop chunks with too few tokens and truncate chunks over the embedding model limit
+    :param docs: chunks from the text splitter, truncated in place
+    :param tokenizer: tokenizer of the embedding model
+    :param max_tokens: embedding model token limit
+    :return: (kept chunks, total tokens in the kept chunks)
+    """
+    filtered_docs = []
+    token_count = 0
+    truncated = 0
+    skipped = SampledLogger()
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+    for i, doc in enumerate(docs):
+        # Skip empty documents
+        if not doc.page_content.strip():
+            skipped.log("Skipping empty chunk %d", i)
+            continue
+
+        tokens = tokenizer.encode(doc.page_content, add_special_tokens=True)
+        if debug:
+            logging.debug("Chunk %d token length: %d", i, len(tokens))
+
+        if len(tokens) <= max_tokens and len(tokens) > 2:  # Reduced from 5 to 2
+            filtered_docs.append(doc)
+            token_count += len(tokens)
+        elif len(tokens) > max_tokens:
+            truncated_text = tokenizer.decode(tokens[:max_tokens], skip_special_tokens=True)
+            if len(truncated_text.strip()) > 3:  # Reduced from 10 to 3
+                doc.page_content = truncated_text.strip()
+                filtered_docs.append(doc)
+                token_count += max_tokens
+                truncated += 1
+                if debug:
+                    logging.debug("Truncated chunk %d from %d to %d tokens", i, len(tokens), max_tokens)
+            else:
+                skipped.log("Truncated chunk %d too short, skipping", i)
+        else:
+            skipped.log("Chunk %d has too few tokens (%d), skipping", i, len(tokens))
+
+    skipped.summary("chunks skipped by the token filter")
+    logging.info(
+        f"Token filter kept {len(filtered_docs)} of {len(docs)} chunks "
+        f"({truncated} truncated to {max_tokens} tokens, {skipped.count} skipped, {token_count} tokens)"
+    )
+    return filtered_docs, token_count
+
+def exclusive_ingest(ingest):
+    """
+    Run an ingest generator while holding a file lock, so ingests from Streamlit, API workers and
+    the CLI on this host run one at a time: each one resets or syncs the whole collection.
+    Processes on other hosts sharing a Chroma server are not covered.
+    """
+    @functools.wraps(ingest)
+    def locked(*args, **kwargs):
+        if fcntl is None:
+            yield from ingest(*args, **kwargs)
+            return
+        VECTORSTORE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(VECTORSTORE_DIR / f"{COLLECTION_NAME}.ingest.lock", "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield "Waiting for another ingest to finish...✅"
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield from ingest(*args, **kwargs)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return locked
+
+def start_ingest():
+    """
+    Initialize components and reset the collection before an ingest, yielding status messages
+    :return: True when ready, False after an error status was yielded
     """
     yield "Initializing Components"
     try:
-        initialize_components()
+        with metrics.span("ingest", "init"):
+            initialize_components()
     except Exception as e:
+        metrics.STAGE_ERRORS.inc(pipeline="ingest", stage="init")
         logging.error(f"Error initializing components: {e}")
         yield f"Error initializing components: {e}"
-        return
+        return False
+
+    if CHUNKING_MODE == "content":
+        # Content-defined chunks are synced in place, unchanged chunks keep their ids and vectors
+        yield "Syncing vector store...✅"
+        return True
 
     yield "Resetting vector store...✅"
     try:
-        vector_store.reset_collection()
+        with metrics.span("ingest", "reset"):
+            call_with_retries(vector_store.reset_collection, retries=CHROMA_RETRIES)
+            if compact_index is not None:
+                compact_index.reset()
+            if chunk_store is not None:
+                chunk_store.reset()
         logging.info("Vector store reset successfully")
     except Exception as e:
+        metrics.STAGE_ERRORS.inc(pipeline="ingest", stage="reset")
         logging.error(f"Error resetting vector store: {e}")
         yield f"Error resetting vector store: {e}"
-        return
+        return False
 
-    yield "Loading data...✅"
+    return True
+
+def make_text_splitter():
+    if CHUNKING_MODE == "content":
+        tokenizer = get_tokenizer()
+        return ContentDefinedSplitter(
+            chunk_size=CHUNK_SIZE,
+            # The token filter limit, less the special tokens it counts
+            max_tokens=254,
+            token_length=lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+        )
+    return RecursiveCharacterTextSplitter(
+        separators=["\n\n", "\n", ".", "!", "?", ";", " "],  # More granular separators
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=100,  # Increased overlap for better continuity
+        length_function=len,
+        is_separator_regex=False
+    )
+
+def index_documents(data, dedup_index=None, synced_ids=None):
+    """
+    Clean, split, filter, deduplicate, embed and store loaded pages, yielding status messages
+    :param data: loaded page documents
+    :param dedup_index: NearDuplicateIndex shared across calls (e.g. crawl batches); a new one
+        is built when None
+    :param synced_ids: set collecting the ids of the chunks this ingest keeps (content mode),
+        for remove_stale_chunks
+    :return: True when the chunks were stored (or all were duplicates of earlier batches), False after an
+        error status was yielded
+    """
+    # Clean and validate documents
+    yield "Cleaning documents...✅"
+    stage = metrics.span("ingest", "clean")
+    ingested_at = time.time()
     try:
-        # Clean URLs by removing fragments and query parameters that might cause issues
-        cleaned_urls = []
-        for url in urls:
-            # Remove fragments (#) and clean the URL
-            if '#' in url:
-                url = url.split('#')[0]
-            cleaned_urls.append(url)
-            logging.info(f"Cleaned URL: {url}")
-        
-        # Try multiple user agents and methods
-        user_agents = [
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        ]
-        
-        data = []
-        successful_loads = 0
-        
-        # Method 1: Try UnstructuredURLLoader with different configurations
-        for i, user_agent in enumerate(user_agents):
-            if successful_loads >= len(cleaned_urls):
-                break
-                
-            try:
-                logging.info(f"Trying UnstructuredURLLoader with user agent {i+1}")
-                loader = UnstructuredURLLoader(
-                    urls=cleaned_urls,
-                    headers={
-                        "User-Agent": user_agent,
-                        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-                        "Accept-Language": "en-US,en;q=0.9",
-                        "Accept-Encoding": "gzip, deflate, br",
-                        "Connection": "keep-alive",
-                        "Upgrade-Insecure-Requests": "1",
-                        "Sec-Fetch-Dest": "document",
-                        "Sec-Fetch-Mode": "navigate",
-                        "Sec-Fetch-Site": "none",
-                        "Cache-Control": "max-age=0"
-                    },
-                    ssl_verify=False,
-                    requests_kwargs={
-                        "timeout": 30,
-                        "allow_redirects": True,
-                        "stream": False
-                    }
-                )
-                temp_data = loader.load()
-                
-                for doc in temp_data:
-                    if len(doc.page_content.strip()) > 0:
-                        data.append(doc)
-                        successful_loads += 1
-                        logging.info(f"UnstructuredURLLoader success: {len(doc.page_content)} chars from {doc.metadata.get('source', 'unknown')}")
-                
-                if successful_loads > 0:
-                    break
-                    
-            except Exception as e:
-                logging.warning(f"UnstructuredURLLoader attempt {i+1} failed: {e}")
-                continue
-        
-        # Method 2: Advanced requests with session and multiple strategies
-        if successful_loads == 0:
-            yield "Trying advanced content extraction methods..."
-            import requests
-            from bs4 import BeautifulSoup
-            import time
-            
-            session = requests.Session()
-            
-            for url in cleaned_urls:
-                success = False
-                
-                # Try different approaches for each URL
-                strategies = [
-                    # Strategy 1: Standard request with session
-                    {
-                        "headers": {
-                            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                            "Accept-Language": "en-US,en;q=0.5",
-                            "Accept-Encoding": "gzip, deflate",
-                            "Connection": "keep-alive",
-                            "Upgrade-Insecure-Requests": "1"
-                        },
-                        "verify": False,
-                        "timeout": 30
-                    },
-                    # Strategy 2: Mobile user agent
-                    {
-                        "headers": {
-                            "User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 14_7_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.2 Mobile/15E148 Safari/604.1",
-                            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"
-                        },
-                        "verify": False,
-                        "timeout": 30
-                    },
-                    # Strategy 3: Minimal headers
-                    {
-                        "headers": {
-                            "User-Agent": "curl/7.68.0"
-                        },
-                        "verify": False,
-                        "timeout": 30
-                    }
-                ]
-                
-                for i, strategy in enumerate(strategies):
-                    try:
-                        logging.info(f"Trying strategy {i+1} for {url}")
-                        
-                        # Add small delay between requests
-                        if i > 0:
-                            time.sleep(2)
-                        
-                        response = session.get(url, **strategy)
-                        
-                        # Check for different success conditions
-                        if response.status_code == 200:
-                            # Parse with BeautifulSoup
-                            soup = BeautifulSoup(response.content, 'html.parser')
-                            
-                            # Remove unwanted elements
-                            for element in soup(["script", "style", "nav", "header", "footer", "aside"]):
-                                element.decompose()
-                            
-                            # Extract text content
-                            text = soup.get_text(separator=' ', strip=True)
-                            
-                            # Clean up extra whitespace
-                            text = ' '.join(text.split())
-                            
-                            if len(text.strip()) > 100:
-                                from langchain.schema import Document
-                                doc = Document(page_content=text.strip(), metadata={"source": url})
-                                data.append(doc)
-                                successful_loads += 1
-                                success = True
-                                logging.info(f"Strategy {i+1} success: extracted {len(text)} chars from {url}")
-                                break
-                            else:
-                                logging.warning(f"Strategy {i+1}: Content too short ({len(text)} chars)")
-                        else:
-                            logging.warning(f"Strategy {i+1}: HTTP {response.status_code} for {url}")
-                            
-                    except Exception as e:
-                        logging.warning(f"Strategy {i+1} failed for {url}: {e}")
-                        continue
-                
-                if not success:
-                    logging.error(f"All strategies failed for {url}")
-        
-        # Method 3: Try with selenium as last resort (if available)
-        if successful_loads == 0:
-            try:
-                yield "Trying browser automation as last resort..."
-                from selenium import webdriver
-                from selenium.webdriver.chrome.options import Options
-                from selenium.webdriver.common.by import By
-                from selenium.webdriver.support.ui import WebDriverWait
-                from selenium.webdriver.support import expected_conditions as EC
-                
-                chrome_options = Options()
-                chrome_options.add_argument("--headless")
-                chrome_options.add_argument("--no-sandbox")
-                chrome_options.add_argument("--disable-dev-shm-usage")
-                chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-                chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-                chrome_options.add_experimental_option('useAutomationExtension', False)
-                
-                driver = webdriver.Chrome(options=chrome_options)
-                driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-                
-                for url in cleaned_urls:
-                    try:
-                        driver.get(url)
-                        WebDriverWait(driver, 10).until(
-                            EC.presence_of_element_located((By.TAG_NAME, "body"))
-                        )
-                        
-                        # Get page text
-                        text = driver.find_element(By.TAG_NAME, "body").text
-                        
-                        if len(text.strip()) > 100:
-                            from langchain.schema import Document
-                            doc = Document(page_content=text.strip(), metadata={"source": url})
-                            data.append(doc)
-                            successful_loads += 1
-                            logging.info(f"Selenium success: extracted {len(text)} chars from {url}")
-                        
-                    except Exception as e:
-                        logging.warning(f"Selenium failed for {url}: {e}")
-                
-                driver.quit()
-                
-            except ImportError:
-                logging.info("Selenium not available, skipping browser automation")
-            except Exception as e:
-                logging.warning(f"Selenium method failed: {e}")
-        
-        # Validate results
-        if not data or successful_loads == 0:
-            error_msg = f"Unable to extract content from any of the {len(urls)} URLs. This could be due to:\n"
-            error_msg += "1. Websites blocking automated access (403/404 errors)\n"
-            error_msg += "2. Content loaded dynamically with JavaScript\n"
-            error_msg += "3. URLs requiring authentication or special access\n"
-            error_msg += "4. Network connectivity issues\n\n"
-            error_msg += "Please try:\n"
-            error_msg += "- Using different URLs that are more accessible\n"
-            error_msg += "- Checking if the URLs work in a regular browser\n"
-            error_msg += "- Using URLs from sites that allow web scraping"
-            
-            logging.error(error_msg)
-            yield f"Error: {error_msg}"
-            return
-        
-        # Clean and validate documents
         valid_docs = []
+        too_short = SampledLogger()
         for i, doc in enumerate(data):
-            logging.info(f"Document {i} original length: {len(doc.page_content)} characters")
-            
+            logging.debug("Document %d original length: %d characters", i, len(doc.page_content))
+
             # Clean whitespace but preserve content
             doc.page_content = clean_extra_whitespace(doc.page_content)
-            
+
             # Lenient validation
             if len(doc.page_content.strip()) > 10:
                 cleaned_content = doc.page_content.strip()
                 doc.page_content = cleaned_content
+                doc.metadata.update(page_metadata(doc.metadata.get("source", ""), cleaned_content, ingested_at))
                 valid_docs.append(doc)
-                logging.info(f"Document {i} cleaned length: {len(doc.page_content)} characters")
+                logging.debug("Document %d cleaned length: %d characters", i, len(doc.page_content))
             else:
-                logging.warning(f"Document {i} too short after cleaning ({len(doc.page_content)} chars), skipping")
-        
+                too_short.log("Document %d too short after cleaning (%d chars), skipping", i, len(doc.page_content))
+        too_short.summary("documents too short after cleaning")
+
         if not valid_docs:
             logging.error("No valid documents found after cleaning")
             yield "Error: Content was extracted but became invalid after cleaning"
-            return
-            
+            return False
+
         data = valid_docs
-        logging.info(f"Successfully processed {len(data)} documents")
-        
+        stage.end()
+        logging.info(f"Successfully processed {len(data)} documents ({too_short.count} skipped as too short)")
+
     except Exception as e:
-        logging.error(f"Error loading data: {e}")
-        yield f"Error loading data: {e}"
-        return
+        metrics.STAGE_ERRORS.inc(pipeline="ingest", stage="clean")
+        logging.error(f"Error cleaning documents: {e}")
+        yield f"Error cleaning documents: {e}"
+        return False
 
     yield "Splitting text into chunks...✅"
+    stage = metrics.span("ingest", "split")
     try:
-        text_splitter = RecursiveCharacterTextSplitter(
-            separators=["\n\n", "\n", ".", "!", "?", ";", " "],  # More granular separators
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=100,  # Increased overlap for better continuity
-            length_function=len,
-            is_separator_regex=False
-        )
-        docs = text_splitter.split_documents(data)
+        docs = add_positions(make_text_splitter().split_documents(data))
         logging.info(f"Split into {len(docs)} chunks")
         
         # Filter out empty chunks with more lenient criteria
         docs = [doc for doc in docs if len(doc.page_content.strip()) > 10]
         logging.info(f"After filtering empty chunks: {len(docs)} chunks remain")
+        stage.end()
+        metrics.CHUNKS.inc(len(docs), stage="split")
         
         if not docs:
             logging.error("No chunks remain after splitting")
             yield "Error: Content could not be properly split into chunks"
-            return
+            return False
         
     except Exception as e:
+        metrics.STAGE_ERRORS.inc(pipeline="ingest", stage="split")
         logging.error(f"Error splitting text: {e}")
         yield f"Error splitting text: {e}"
-        return
+        return False
 
     # Filter chunks by token length
     yield "Filtering chunks by token length...✅"
+    stage = metrics.span("ingest", "token_filter")
     try:
-        tokenizer = AutoTokenizer.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
-        max_tokens = 256
-        filtered_docs = []
-        
-        for i, doc in enumerate(docs):
-            # Skip empty documents
-            if not doc.page_content.strip():
-                logging.warning(f"Skipping empty chunk {i}")
-                continue
-                
-            tokens = tokenizer.encode(doc.page_content, add_special_tokens=True)
-            logging.info(f"Chunk {i} token length: {len(tokens)}")
-            
-            if len(tokens) <= max_tokens and len(tokens) > 2:  # Reduced from 5 to 2
-                filtered_docs.append(doc)
-            elif len(tokens) > max_tokens:
-                truncated_text = tokenizer.decode(tokens[:max_tokens], skip_special_tokens=True)
-                if len(truncated_text.strip()) > 3:  # Reduced from 10 to 3
-                    doc.page_content = truncated_text.strip()
-                    filtered_docs.append(doc)
-                    logging.info(f"Truncated chunk {i} to {len(tokenizer.encode(truncated_text, add_special_tokens=True))} tokens")
-                else:
-                    logging.warning(f"Truncated chunk {i} too short, skipping")
-            else:
-                logging.warning(f"Chunk {i} has too few tokens ({len(tokens)}), skipping")
+        filtered_docs, token_count = filter_chunks_by_tokens(docs, get_tokenizer())
         
         if not filtered_docs:
             logging.error("No valid chunks found after filtering")
             yield "Error: No valid content chunks found after token filtering"
-            return
+            return False
             
-        logging.info(f"Final filtered documents: {len(filtered_docs)}")
+        stage.end()
+        metrics.CHUNKS.inc(len(filtered_docs), stage="token_filter")
+        metrics.TOKENS.inc(token_count)
         
     except Exception as e:
+        metrics.STAGE_ERRORS.inc(pipeline="ingest", stage="token_filter")
         logging.error(f"Error filtering chunks: {e}")
         yield f"Error filtering chunks: {e}"
-        return
+        return False
+
+    # Ids are assigned before dedup, so the dedup index is keyed by the ids chunks are stored under
+    if CHUNKING_MODE == "content":
+        # Content-derived ids: a chunk that is already stored is not embedded again
+        chunk_ids = {id(doc): chunk_id(doc.metadata.get("source", ""), doc.page_content) for doc in filtered_docs}
+    else:
+        chunk_ids = {id(doc): str(uuid4()) for doc in filtered_docs}
+
+    if DEDUP_MODE != "off":
+        yield "Removing near-duplicate chunks...✅"
+        stage = metrics.span("ingest", "dedup")
+        try:
+            if dedup_index is None:
+                # Not seeded with stored chunks: in recursive mode start_ingest has just reset the
+                # collection, and in content mode remove_stale_chunks deletes every stored chunk this
+                # ingest does not produce again, so a new chunk dropped as a duplicate of one would be lost
+                dedup_index = NearDuplicateIndex(threshold=DEDUP_THRESHOLD)
+
+            total_chunks = len(filtered_docs)
+            earlier_links = {}
+            filtered_docs, removed = deduplicate_documents(filtered_docs, dedup_index, mode=DEDUP_MODE,
+                                                           keys=[chunk_ids[id(doc)] for doc in filtered_docs],
+                                                           earlier_links=earlier_links)
+            if earlier_links:
+                # Duplicates of chunks an earlier crawl batch stored are linked on the stored chunks
+                stored = write_collection.get(ids=list(earlier_links), include=["metadatas"])
+                for chunk, metadata in zip(stored["ids"], stored["metadatas"]):
+                    for source in earlier_links[chunk]:
+                        link_duplicate(metadata, source)
+                write_collection.update(ids=stored["ids"], metadatas=stored["metadatas"])
+            dedup_ratio = removed / total_chunks if total_chunks else 0.0
+            stage.end()
+            metrics.CHUNKS.inc(removed, stage="dedup_removed")
+            logging.info(f"Removed {removed} of {total_chunks} chunks as near-duplicates (dedup ratio {dedup_ratio:.1%})")
+            yield f"Removed {removed} near-duplicate chunks ({dedup_ratio:.1%} of {total_chunks})...✅"
+            if not filtered_docs:
+                # Every chunk duplicates one an earlier batch of this ingest stored (and added to
+                # synced_ids), normal for the boilerplate pages of a crawl: nothing to embed or sync
+                yield "No new chunks in this batch...✅"
+                return True
+
+        except Exception as e:
+            metrics.STAGE_ERRORS.inc(pipeline="ingest", stage="dedup")
+            logging.error(f"Error removing near-duplicate chunks: {e}")
+            yield f"Error removing near-duplicate chunks: {e}"
+            return False
 
     yield "Add chunks to vector database...✅"
     try:
@@ -421,103 +651,404 @@ def process_urls(urls):
             
         # Double-check all documents have content with lenient criteria
         valid_filtered_docs = []
+        minimal = SampledLogger()
         for doc in filtered_docs:
             if doc.page_content and len(doc.page_content.strip()) > 2:  # Reduced from 5 to 2
                 valid_filtered_docs.append(doc)
             else:
-                logging.warning(f"Skipping document with empty/minimal content: '{doc.page_content[:50]}'")
+                minimal.log("Skipping document with empty/minimal content: '%s'", doc.page_content[:50])
+        minimal.summary("documents skipped with empty/minimal content")
         
         if not valid_filtered_docs:
             raise ValueError("All documents are empty after final validation")
         
-        uuids = [str(uuid4()) for _ in range(len(valid_filtered_docs))]
-        vector_store.add_documents(valid_filtered_docs, ids=uuids)
+        if CHUNKING_MODE == "content":
+            by_id = {}
+            for doc in valid_filtered_docs:
+                by_id.setdefault(chunk_ids[id(doc)], doc)
+            stored = set(write_collection.get(ids=list(by_id), include=[])["ids"])
+            if synced_ids is not None:
+                synced_ids.update(by_id)
+            unchanged = [chunk for chunk in by_id if chunk in stored]
+            if unchanged:
+                # Refresh position and ingest time without re-embedding
+                write_collection.update(ids=unchanged, metadatas=[by_id[chunk].metadata for chunk in unchanged])
+                metrics.CHUNKS.inc(len(unchanged), stage="unchanged")
+            uuids = [chunk for chunk in by_id if chunk not in stored]
+            valid_filtered_docs = [by_id[chunk] for chunk in uuids]
+            logging.info(f"{len(uuids)} new chunks, {len(unchanged)} unchanged chunks kept")
+        else:
+            uuids = [chunk_ids[id(doc)] for doc in valid_filtered_docs]
+        texts = [doc.page_content for doc in valid_filtered_docs]
+
+        if texts:
+            yield f"Embedding {len(texts)} chunks...✅"
+            stage = metrics.span("ingest", "embed")
+            vectors = embeddings.embed_documents(texts)
+            if compact_index is not None:
+                vectors = compact_index.add(uuids, vectors).tolist()
+            stage.end()
+
+            yield "Writing chunks to vector database...✅"
+            stage = metrics.span("ingest", "upsert")
+            if chunk_store is not None:
+                # Text first, so a chunk that search can find always has its text
+                chunk_store.add(uuids, texts)
+            # Upserts by id are safe to repeat after a dropped connection
+            write_collection.upsert(
+                ids=uuids,
+                embeddings=vectors,
+                documents=texts if chunk_store is None else None,
+                metadatas=[doc.metadata for doc in valid_filtered_docs]
+            )
+            stage.end()
+        write_generation.bump()
+        metrics.CHUNKS.inc(len(valid_filtered_docs), stage="stored")
         logging.info(f"Added {len(valid_filtered_docs)} documents to vector store")
         
     except Exception as e:
+        metrics.STAGE_ERRORS.inc(pipeline="ingest", stage="upsert")
         logging.error(f"Error adding documents to vector store: {e}")
         yield f"Error adding documents to vector store: {e}"
-        return
+        return False
 
-    yield "Done adding docs to vector database...✅"
+    return True
 
-def generate_answer(query):
-    if not vector_store:
-        logging.error("Vector database is not initialized")
-        raise RuntimeError("Vector database is not initialized")
+def remove_stale_chunks(synced_ids, batch_size=5000):
+    """
+    End a content-mode ingest: delete the stored chunks it did not produce again, i.e. the
+    old versions of edited passages and pages that are no longer part of the ingest
+    :param synced_ids: ids collected by index_documents
+    :return: True when done, False after an error status was yielded
+    """
+    try:
+        stored = write_collection.get(include=[])["ids"]
+        stale = [chunk for chunk in stored if chunk not in synced_ids]
+        for start in range(0, len(stale), batch_size):
+            batch = stale[start:start + batch_size]
+            write_collection.delete(ids=batch)
+        if compact_index is not None:
+            compact_index.delete(stale)
+        if chunk_store is not None:
+            chunk_store.delete(stale)
+        write_generation.bump()
+        metrics.CHUNKS.inc(len(stale), stage="stale_removed")
+        logging.info(f"Removed {len(stale)} outdated chunks")
+        yield f"Deleted {len(stale)} outdated chunks...✅"
+    except Exception as e:
+        metrics.STAGE_ERRORS.inc(pipeline="ingest", stage="sync")
+        logging.error(f"Error removing outdated chunks: {e}")
+        yield f"Error removing outdated chunks: {e}"
+        return False
+    return True
 
+def refit_compact_index(batch_size=5000):
+    """
+    End an ingest in compact mode: the PCA projection is fitted on the first batch written, which
+    can be a few crawled pages, so once the collection has doubled since then it is fitted again on
+    the whole collection and the projected vectors in Chroma are replaced
+    :return: True when done, False after an error status was yielded
+    """
+    if compact_index is None or not compact_index.needs_refit():
+        return True
     try:
-        # Enhanced retrieval configuration
-        retriever = vector_store.as_retriever(
-            search_type="mmr",  # Maximum Marginal Relevance for diverse results
-            search_kwargs={
-                "k": 6,           # Increased from 3 to get more context
-                "fetch_k": 12,   # Fetch more candidates before MMR filtering
-                "lambda_mult": 0.7  # Balance between relevance and diversity
-            }
-        )
-        
-        # Test retrieval to ensure we have relevant documents
-        retrieved_docs = retriever.get_relevant_documents(query)
-        if not retrieved_docs:
-            logging.warning("No relevant documents found for the query")
-            return "I couldn't find any relevant information in the knowledge base to answer your question. Please try rephrasing your question or ensure the relevant content has been loaded.", ""
+        with metrics.span("ingest", "refit"):
+            count = reproject(compact_index, lambda ids, vectors: write_collection.update(ids=ids, embeddings=vectors),
+                              batch_size=batch_size)
+        write_generation.bump()
+        yield f"Refitted the vector projection on {count} chunks...✅"
+    except Exception as e:
+        metrics.STAGE_ERRORS.inc(pipeline="ingest", stage="refit")
+        logging.error(f"Error refitting the vector projection: {e}")
+        yield f"Error refitting the vector projection: {e}"
+        return False
+    return True
+
+fetch_stats = None
+fetch_stats_lock = threading.Lock()
+
+def get_fetch_stats():
+    """Per-domain fetch strategy history shared by the ingests of this process, None when FETCH_STRATEGY_MEMORY is off"""
+    global fetch_stats
+    if not FETCH_STRATEGY_MEMORY:
+        return None
+    with fetch_stats_lock:
+        if fetch_stats is None or fetch_stats.path != str(FETCH_STATS_DB):
+            fetch_stats = StrategyStats(FETCH_STATS_DB, skip_after=FETCH_SKIP_AFTER,
+                                        retry_after=FETCH_RETRY_SKIPPED_DAYS * 86400)
+        return fetch_stats
+
+@exclusive_ingest
+def process_urls(urls):
+    """
+    This function scrapes data from a url and stores it in a vector db
+    :param urls: input urls
+    :return:
+    """
+    ingest_span = metrics.span("ingest", "total")
+    if not (yield from start_ingest()):
+        return
+
+    yield "Loading data...✅"
+    stage = metrics.span("ingest", "fetch")
+    try:
+        # Clean URLs by removing fragments and query parameters that might cause issues
+        cleaned_urls = []
+        for url in urls:
+            # Remove fragments (#) and clean the URL
+            if '#' in url:
+                url = url.split('#')[0]
+            cleaned_urls.append(url)
+            logging.debug("Cleaned URL: %s", url)
         
-        logging.info(f"Retrieved {len(retrieved_docs)} documents for query: {query}")
-        for i, doc in enumerate(retrieved_docs):
-            logging.info(f"Doc {i+1}: {len(doc.page_content)} chars from {doc.metadata.get('source', 'unknown')}")
+        # One URL at a time, trying the strategies that worked for its domain before first
+        data = []
+        successful_loads = 0
+        fetcher = PageFetcher(get_fetch_stats())
+        try:
+            for url in cleaned_urls:
+                doc, strategy = fetcher.fetch(url)
+                if doc is None:
+                    yield f"Fetched no content from {url}, every fetch strategy failed"
+                    continue
+                data.append(doc)
+                successful_loads += 1
+                yield f"Fetched {url} with {strategy}...✅"
+        finally:
+            fetcher.close()
         
-        # Create custom prompt for better responses
-        from langchain.prompts import PromptTemplate
-        from langchain.chains import RetrievalQA
+        # Validate results
+        stage.end()
+        metrics.PAGES.inc(successful_loads, outcome="loaded")
+        metrics.PAGES.inc(max(len(cleaned_urls) - successful_loads, 0), outcome="failed")
+        if not data or successful_loads == 0:
+            error_msg = f"Unable to extract content from any of the {len(urls)} URLs. This could be due to:\n"
+            error_msg += "1. Websites blocking automated access (403/404 errors)\n"
+            error_msg += "2. Content loaded dynamically with JavaScript\n"
+            error_msg += "3. URLs requiring authentication or special access\n"
+            error_msg += "4. Network connectivity issues\n\n"
+            error_msg += "Please try:\n"
+            error_msg += "- Using different URLs that are more accessible\n"
+            error_msg += "- Checking if the URLs work in a regular browser\n"
+            error_msg += "- Using URLs from sites that allow web scraping"
+            
+            logging.error(error_msg)
+            yield f"Error: {error_msg}"
+            return
         
-        # Custom prompt template for more reliable answers
-        custom_prompt = PromptTemplate(
-            template="""You are an intelligent assistant that provides accurate, detailed answers based on the given context. 
+    except Exception as e:
+        metrics.STAGE_ERRORS.inc(pipeline="ingest", stage="fetch")
+        logging.error(f"Error loading data: {e}")
+        yield f"Error loading data: {e}"
+        return
 
-Context information:
-{context}
+    synced_ids = set()
+    if not (yield from index_documents(data, synced_ids=synced_ids)):
+        return
+    if CHUNKING_MODE == "content" and not (yield from remove_stale_chunks(synced_ids)):
+        return
+    if not (yield from refit_compact_index()):
+        return
 
-Question: {question}
+    ingest_span.end()
+    yield "Done adding docs to vector database...✅"
 
-Instructions:
-1. Provide a comprehensive answer based ONLY on the information in the context above
-2. If the context contains relevant information, provide a detailed, well-structured response
-3. Include specific details, numbers, dates, and facts when available
-4. If the context doesn't contain enough information to fully answer the question, say "Based on the available information..." and provide what you can
-5. NEVER say "I don't know" - always try to extract and present any relevant information from the context
-6. Organize your response clearly with proper formatting
-7. Be specific and cite relevant details from the source material
+@exclusive_ingest
+def process_crawl(seeds, max_depth=CRAWL_MAX_DEPTH, max_pages=CRAWL_MAX_PAGES, allowed_domains=None):
+    """
+    Crawl from seed URLs (or sitemap.xml URLs) and store the pages in the vector db.
+    Pages are indexed in batches of CRAWL_BATCH_PAGES while the crawl keeps fetching.
+    :param seeds: start URLs
+    :param max_depth: link hops followed from the seeds
+    :param max_pages: pages indexed at most
+    :param allowed_domains: hosts the crawl may visit, defaults to the seed hosts
+    :return:
+    """
+    ingest_span = metrics.span("ingest", "total")
+    if not (yield from start_ingest()):
+        return
 
-Answer:""",
-            input_variables=["context", "question"]
+    crawler = Crawler(
+        seeds,
+        allowed_domains=allowed_domains,
+        max_depth=max_depth,
+        max_pages=max_pages,
+        workers=CRAWL_WORKERS,
+        host_delay=CRAWL_HOST_DELAY
+    )
+    yield f"Crawling {', '.join(crawler.allowed_domains)} (depth {max_depth}, up to {max_pages} pages)...✅"
+
+    # One index for the whole crawl, so duplicates across batches are caught
+    dedup_index = NearDuplicateIndex(threshold=DEDUP_THRESHOLD) if DEDUP_MODE != "off" else None
+    pages = 0
+    batch = []
+    synced_ids = set()
+    for doc in crawler.crawl():
+        batch.append(doc)
+        if len(batch) < CRAWL_BATCH_PAGES:
+            continue
+        pages += len(batch)
+        if not (yield from index_documents(batch, dedup_index, synced_ids)):
+            return
+        yield f"Crawled and indexed {pages} pages...✅"
+        batch = []
+
+    if batch:
+        pages += len(batch)
+        if not (yield from index_documents(batch, dedup_index, synced_ids)):
+            return
+    if pages == 0:
+        yield f"Error: No pages could be crawled from {', '.join(seeds)}"
+        return
+    if CHUNKING_MODE == "content" and not (yield from remove_stale_chunks(synced_ids)):
+        return
+    if not (yield from refit_compact_index()):
+        return
+
+    ingest_span.end()
+    yield f"Done adding {pages} crawled pages to vector database...✅"
+
+def search_documents(query_vectors, k=RETRIEVAL_K, fetch_k=RETRIEVAL_FETCH_K, lambda_mult=MMR_LAMBDA_MULT, search_ef=None,
+                     where=None):
+    """
+    Vector search plus Maximum Marginal Relevance for a batch of query embeddings,
+    with a single query to the collection
+    :param query_vectors: full-dimension query embeddings, one row per query
+    :param where: Chroma metadata filter applied before the vector search
+    :return: list with the list of documents of each query
+    """
+    query_vectors = np.asarray(query_vectors, dtype=np.float32)
+    index_vectors = query_vectors if compact_index is None else compact_index.project(query_vectors)
+
+    # hnswlib searches with ef = max(search_ef, n_results), so asking for more
+    # results widens the search for this query without touching the collection
+    n_results = max(fetch_k, search_ef or 0)
+    # With the chunk store, text is read only for the chunks MMR selects
+    include = ["metadatas"] if chunk_store is not None else ["documents", "metadatas"]
+    if compact_index is None:
+        include.append("embeddings")
+    results = None
+    if where is not None:
+        # Filters asked again are searched exactly in memory instead of resolved by Chroma
+        results = scope_cache.query(read_collection, where, index_vectors, n_results)
+    if results is None:
+        results = read_collection.query(
+            query_embeddings=index_vectors.tolist(),
+            n_results=n_results,
+            where=where,
+            include=include
         )
-        
-        # Use RetrievalQA with custom prompt instead of RetrievalQAWithSourcesChain
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=retriever,
-            chain_type_kwargs={
-                "prompt": custom_prompt,
-                "verbose": True
-            },
-            return_source_documents=True
+
+    from langchain.schema import Document
+    batch = []
+    for q, query_vector in enumerate(query_vectors):
+        ids = results["ids"][q][:fetch_k]
+        if not ids:
+            batch.append([])
+            continue
+
+        if compact_index is None:
+            candidate_vectors = np.asarray(results["embeddings"][q][:fetch_k], dtype=np.float32)
+            known = list(range(len(ids)))
+        else:
+            # Rescore the candidates from the projected index with their full vectors
+            candidate_vectors = compact_index.get(ids)
+            known = [i for i in range(len(ids)) if not np.isnan(candidate_vectors[i]).any()]
+            if not known:
+                batch.append([])
+                continue
+            candidate_vectors = candidate_vectors[known]
+
+        selected = mmr_select(query_vector, candidate_vectors, k=k, lambda_mult=lambda_mult)
+        if chunk_store is not None:
+            texts = chunk_store.get([ids[known[i]] for i in selected])
+        else:
+            texts = [results["documents"][q][known[i]] for i in selected]
+        # Cosine similarity to the question, a routing signal (llm_router.route_signals)
+        relevance = (candidate_vectors @ query_vector) / np.maximum(
+            np.linalg.norm(candidate_vectors, axis=1) * np.linalg.norm(query_vector), 1e-12
         )
-        
-        # Generate answer
-        result = qa_chain.invoke({"query": query})
-        answer = result['result']
-        source_docs = result['source_documents']
-        
-        # Extract sources
-        sources = []
-        for doc in source_docs:
-            source = doc.metadata.get('source', 'Unknown')
-            if source not in sources:
-                sources.append(source)
-        
-        sources_str = ", ".join(sources) if sources else "No sources available"
+        batch.append([
+            Document(
+                page_content=text,
+                metadata={**(results["metadatas"][q][known[i]] or {}), "relevance": round(float(relevance[i]), 4)},
+                id=ids[known[i]]
+            )
+            for i, text in zip(selected, texts)
+            if text is not None
+        ])
+    return batch
+
+def retrieve_documents(query, k=RETRIEVAL_K, fetch_k=RETRIEVAL_FETCH_K, lambda_mult=MMR_LAMBDA_MULT, search_ef=None,
+                       filters=None):
+    """
+    Retrieve chunks for a query with Maximum Marginal Relevance
+    :param query: question text
+    :param k: number of chunks returned
+    :param fetch_k: candidates fetched before MMR filtering
+    :param lambda_mult: balance between relevance and diversity
+    :param search_ef: optional wider HNSW search for this query only, HNSW_SEARCH_EF stays the floor
+    :param filters: optional metadata filters (see chunk_metadata.build_where), e.g.
+        {"domain": "freddiemac.com", "ingested_after": date.today()}
+    :return: list of documents
+    """
+    where = build_where(filters)
+    query_vector = embeddings.embed_query(query)
+    return search_documents([query_vector], k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, search_ef=search_ef,
+                            where=where)[0]
+
+def retrieve_documents_batch(queries, search_ef=None, filters=None):
+    """
+    Retrieve chunks for many questions: one batched embedding forward pass and one vector search
+    :param filters: optional metadata filters applied to every question
+    :return: list with the list of documents of each question
+    """
+    if not queries:
+        return []
+    where = build_where(filters)
+    # The embedding backends encode queries and documents the same way, so a
+    # document batch on the query lane gives the query vectors in one pass
+    query_vectors = embeddings.embed_queries(list(queries))
+    return search_documents(query_vectors, search_ef=search_ef, where=where)
+
+NO_DOCUMENTS_ANSWER = "I couldn't find any relevant information in the knowledge base to answer your question. Please try rephrasing your question or ensure the relevant content has been loaded."
+
+def error_answer(e):
+    # Provide a more helpful error message
+    return f"I encountered an error while processing your question: {str(e)}. Please try rephrasing your question or contact support if the issue persists."
+
+def build_answer_prompt(query, retrieved_docs):
+    """Stuff the retrieved documents into the custom prompt"""
+    logging.info(f"Retrieved {len(retrieved_docs)} documents for query: {query}")
+    for i, doc in enumerate(retrieved_docs):
+        logging.debug("Doc %d: %d chars from %s", i + 1, len(doc.page_content), doc.metadata.get('source', 'unknown'))
+
+    with metrics.span("query", "prompt_build"):
+        context = "\n\n".join(doc.page_content for doc in retrieved_docs)
+        return ANSWER_PROMPT.format(context=context, question=query)
+
+def record_llm_usage(usage, route=FULL, seconds=0.0):
+    usage = usage or {}
+    metrics.LLM_TOKENS.inc(usage.get("input_tokens", 0), kind="prompt")
+    metrics.LLM_TOKENS.inc(usage.get("output_tokens", 0), kind="completion")
+    record_route_call(route, seconds, usage)
+
+def collect_sources(retrieved_docs):
+    """:return: distinct sources of the documents in retrieval order, comma separated"""
+    sources = []
+    for doc in retrieved_docs:
+        source = doc.metadata.get('source', 'Unknown')
+        if source not in sources:
+            sources.append(source)
+    return ", ".join(sources) if sources else "No sources available"
+
+def finalize_answer(query, answer, retrieved_docs):
+    """
+    Collect sources and fall back to the retrieved text when the LLM gave no usable answer
+    :return: (answer, comma separated sources)
+    """
+    with metrics.span("query", "post_process"):
+        sources_str = collect_sources(retrieved_docs)
         
         # Post-process answer to ensure quality
         if not answer or answer.strip().lower() in ["i don't know", "i don't know.", "unknown", "not available"]:
@@ -534,13 +1065,304 @@ Answer:""",
         logging.info(f"Generated answer for query: {query}")
         logging.info(f"Answer length: {len(answer)} characters")
         logging.info(f"Sources: {sources_str}")
-        
+    return answer, sources_str
+
+def collection_version():
+    """
+    Identifies the collection contents: a reset gives the collection a new id, adding chunks
+    changes its count, and every ingest bumps the write generation
+    """
+    return f"{read_collection.version()}:{write_generation.get()}"
+
+def _answer_key(query, where, version):
+    return " ".join(query.lower().split()), json.dumps(where, sort_keys=True), version
+
+def cached_answer(query, filters=None):
+    """
+    Look up a question in the answer cache
+    :return: (cache key, (answer, sources) or None); the key is None when the cache is disabled
+    """
+    if ANSWER_CACHE_SIZE <= 0:
+        return None, None
+    key = _answer_key(query, build_where(filters), collection_version())
+    with answer_cache_lock:
+        hit = answer_cache.get(key)
+        if hit is not None:
+            answer_cache.move_to_end(key)
+    (metrics.CACHE_HITS if hit is not None else metrics.CACHE_MISSES).inc(cache="answer")
+    return key, hit
+
+def store_answer(key, answer, sources):
+    if key is None:
+        return
+    with answer_cache_lock:
+        answer_cache[key] = (answer, sources)
+        answer_cache.move_to_end(key)
+        while len(answer_cache) > ANSWER_CACHE_SIZE:
+            answer_cache.popitem(last=False)
+
+def warm_answer_cache(entries):
+    """
+    Load earlier answers into the answer cache, e.g. HistoryStore.latest_answers after a restart.
+    Only answers with sources given from the current collection version are used, not errors
+    :param entries: dicts with question, filters (where clause), answer, sources and collection_version, newest first
+    :return: number of answers loaded
+    """
+    if ANSWER_CACHE_SIZE <= 0:
+        return 0
+    version = collection_version()
+    loaded = 0
+    # Oldest first, so the newest answers end up most recently used
+    for entry in reversed(list(entries)):
+        if entry["collection_version"] == version and entry["sources"]:
+            store_answer(_answer_key(entry["question"], entry["filters"], version), entry["answer"], entry["sources"])
+            loaded += 1
+    logging.info(f"Warmed the answer cache with {loaded} answers")
+    return loaded
+
+def retrieve_evidence(query, search_ef=None, filters=None):
+    """
+    First phase of answering a question: answer cache and retrieval, no LLM call. Retrieval
+    finishes long before the LLM does, so the UI shows the snippets while generate_from_evidence
+    writes the answer
+    :param search_ef: optional wider HNSW search for this question
+    :param filters: optional metadata filters that narrow the chunks searched, e.g. {"domain": "freddiemac.com"}
+    :return: evidence dict with the query, the retrieved documents, their sources (comma separated)
+        and snippets (source, text and relevance of each chunk, in retrieval order). "answer" is
+        already set when no LLM call is needed: a cached answer, no matching chunks or an error
+    """
+    if not vector_store:
+        logging.error("Vector database is not initialized")
+        raise RuntimeError("Vector database is not initialized")
+
+    evidence = {
+        "query": query,
+        "documents": [],
+        "sources": "",
+        "snippets": [],
+        "answer": None,
+        "cache_key": None,
+        "span": metrics.span("query", "total"),
+    }
+    try:
+        evidence["cache_key"], cached = cached_answer(query, filters)
+        if cached is not None:
+            evidence["answer"], evidence["sources"] = cached
+            return evidence
+
+        with metrics.span("query", "retrieve"):
+            retrieved_docs = retrieve_documents(query, search_ef=search_ef, filters=filters)
+        if not retrieved_docs:
+            logging.warning("No relevant documents found for the query")
+            evidence["answer"] = NO_DOCUMENTS_ANSWER
+            return evidence
+
+        evidence["documents"] = retrieved_docs
+        evidence["sources"] = collect_sources(retrieved_docs)
+        evidence["snippets"] = [
+            {"source": doc.metadata.get("source", "Unknown"), "text": doc.page_content,
+             "relevance": doc.metadata.get("relevance")}
+            for doc in retrieved_docs
+        ]
+    except Exception as e:
+        metrics.STAGE_ERRORS.inc(pipeline="query", stage="retrieve")
+        logging.error(f"Error generating answer: {e}")
+        evidence["answer"] = error_answer(e)
+    return evidence
+
+def generate_from_evidence(evidence):
+    """
+    Second phase of answering a question: the LLM answer from retrieve_evidence's documents
+    :return: (answer, comma separated sources)
+    """
+    if evidence["answer"] is not None:
+        return evidence["answer"], evidence["sources"]
+
+    query, retrieved_docs = evidence["query"], evidence["documents"]
+    stage = "prompt_build"
+    try:
+        prompt_text = build_answer_prompt(query, retrieved_docs)
+
+        # Generate answer
+        stage = "llm"
+        route = choose_route(query, retrieved_docs)
+        start = time.perf_counter()
+        with metrics.span("query", "llm"):
+            message = get_llm_gateway(route).invoke(prompt_text)
+        record_llm_usage(getattr(message, "usage_metadata", None), route, time.perf_counter() - start)
+
+        stage = "post_process"
+        answer, sources_str = finalize_answer(query, message.content, retrieved_docs)
+        store_answer(evidence["cache_key"], answer, sources_str)
+        evidence["span"].end()
         return answer, sources_str
-        
+
+    except Exception as e:
+        metrics.STAGE_ERRORS.inc(pipeline="query", stage=stage)
+        logging.error(f"Error generating answer: {e}")
+        return error_answer(e), ""
+
+async def agenerate_from_evidence(evidence):
+    """Async version of generate_from_evidence"""
+    if evidence["answer"] is not None:
+        return evidence["answer"], evidence["sources"]
+
+    query, retrieved_docs = evidence["query"], evidence["documents"]
+    stage = "prompt_build"
+    try:
+        prompt_text = build_answer_prompt(query, retrieved_docs)
+
+        stage = "llm"
+        route = choose_route(query, retrieved_docs)
+        start = time.perf_counter()
+        with metrics.span("query", "llm"):
+            message = await get_llm_gateway(route).ainvoke(prompt_text)
+        record_llm_usage(getattr(message, "usage_metadata", None), route, time.perf_counter() - start)
+
+        stage = "post_process"
+        answer, sources_str = finalize_answer(query, message.content, retrieved_docs)
+        store_answer(evidence["cache_key"], answer, sources_str)
+        evidence["span"].end()
+        return answer, sources_str
+
     except Exception as e:
+        metrics.STAGE_ERRORS.inc(pipeline="query", stage=stage)
         logging.error(f"Error generating answer: {e}")
-        # Provide a more helpful error message
-        return f"I encountered an error while processing your question: {str(e)}. Please try rephrasing your question or contact support if the issue persists.", ""
+        return error_answer(e), ""
+
+def generate_answer(query, search_ef=None, filters=None):
+    """
+    Answer a question from the collection: retrieve_evidence, then generate_from_evidence
+    :param search_ef: optional wider HNSW search for this question
+    :param filters: optional metadata filters that narrow the chunks searched, e.g. {"domain": "freddiemac.com"}
+    :return: (answer, comma separated sources)
+    """
+    return generate_from_evidence(retrieve_evidence(query, search_ef=search_ef, filters=filters))
+
+async def agenerate_answer(query, search_ef=None, filters=None):
+    """
+    Async version of generate_answer for the HTTP API: retrieval (query embedding and
+    vector search) runs in a worker thread and the LLM is awaited with ainvoke, so one
+    event loop can hold many questions in flight
+    """
+    evidence = await asyncio.to_thread(retrieve_evidence, query, search_ef=search_ef, filters=filters)
+    return await agenerate_from_evidence(evidence)
+
+async def astream_answer(query, search_ef=None, filters=None):
+    """
+    Stream an answer as it is generated
+    :return: async generator of events: {"type": "evidence", "sources": ..., "snippets": [...]} as soon as
+        retrieval is done (not for cached answers), {"type": "token", "text": ...} while the LLM streams, then
+        {"type": "answer", "answer": ..., "sources": ...} with the final (possibly fallback) answer
+    """
+    evidence = await asyncio.to_thread(retrieve_evidence, query, search_ef=search_ef, filters=filters)
+    if evidence["answer"] is not None:
+        yield {"type": "answer", "answer": evidence["answer"], "sources": evidence["sources"]}
+        return
+    yield {"type": "evidence", "sources": evidence["sources"], "snippets": evidence["snippets"]}
+
+    retrieved_docs = evidence["documents"]
+    stage = "prompt_build"
+    try:
+        prompt_text = build_answer_prompt(query, retrieved_docs)
+
+        stage = "llm"
+        parts = []
+        usage = {}
+        route = choose_route(query, retrieved_docs)
+        start = time.perf_counter()
+        with metrics.span("query", "llm"):
+            async for chunk in get_llm_gateway(route).astream(prompt_text):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield {"type": "token", "text": chunk.content}
+                for key, value in (getattr(chunk, "usage_metadata", None) or {}).items():
+                    if isinstance(value, int):
+                        usage[key] = usage.get(key, 0) + value
+        record_llm_usage(usage, route, time.perf_counter() - start)
+
+        stage = "post_process"
+        answer, sources_str = finalize_answer(query, "".join(parts), retrieved_docs)
+        store_answer(evidence["cache_key"], answer, sources_str)
+        evidence["span"].end()
+        yield {"type": "answer", "answer": answer, "sources": sources_str}
+
+    except Exception as e:
+        metrics.STAGE_ERRORS.inc(pipeline="query", stage=stage)
+        logging.error(f"Error generating answer: {e}")
+        yield {"type": "answer", "answer": error_answer(e), "sources": ""}
+
+async def agenerate_answers(queries, max_concurrency=BATCH_MAX_CONCURRENCY, search_ef=None, filters=None):
+    """
+    Answer many questions against the current collection. Questions are embedded in one
+    batched forward pass and searched together, questions with identical prompts (same
+    question and retrieved context) share one LLM call, and LLM calls run concurrently
+    :param queries: list of questions
+    :param max_concurrency: LLM calls in flight at once for this batch
+    :param filters: optional metadata filters applied to every question
+    :return: (list of (answer, sources) in the order of queries, stats dict with throughput)
+    """
+    if not vector_store:
+        logging.error("Vector database is not initialized")
+        raise RuntimeError("Vector database is not initialized")
+
+    start = time.perf_counter()
+    results = [None] * len(queries)
+    try:
+        with metrics.span("query", "retrieve_batch"):
+            batch_docs = await asyncio.to_thread(retrieve_documents_batch, queries, search_ef=search_ef, filters=filters)
+    except Exception as e:
+        metrics.STAGE_ERRORS.inc(pipeline="query", stage="retrieve_batch")
+        logging.error(f"Error retrieving documents for batch: {e}")
+        batch_docs = None
+        results = [(error_answer(e), "")] * len(queries)
+
+    # Group questions by prompt so identical contexts are only sent to the LLM once
+    prompts = {}
+    for i, (query, retrieved_docs) in enumerate(zip(queries, batch_docs or [])):
+        if not retrieved_docs:
+            results[i] = (NO_DOCUMENTS_ANSWER, "")
+            continue
+        prompt_text = build_answer_prompt(query, retrieved_docs)
+        prompts.setdefault(prompt_text, []).append(i)
+
+    slots = asyncio.Semaphore(max_concurrency)
+
+    async def answer(prompt_text, indexes):
+        query, retrieved_docs = queries[indexes[0]], batch_docs[indexes[0]]
+        async with slots:
+            try:
+                route = choose_route(query, retrieved_docs)
+                start = time.perf_counter()
+                with metrics.span("query", "llm"):
+                    message = await get_llm_gateway(route).ainvoke(prompt_text)
+                record_llm_usage(getattr(message, "usage_metadata", None), route, time.perf_counter() - start)
+                result = finalize_answer(query, message.content, retrieved_docs)
+            except Exception as e:
+                metrics.STAGE_ERRORS.inc(pipeline="query", stage="llm")
+                logging.error(f"Error generating answer: {e}")
+                result = (error_answer(e), "")
+        for i in indexes:
+            results[i] = result
+
+    await asyncio.gather(*(answer(prompt_text, indexes) for prompt_text, indexes in prompts.items()))
+
+    seconds = time.perf_counter() - start
+    stats = {
+        "questions": len(queries),
+        "llm_calls": len(prompts),
+        "seconds": round(seconds, 3),
+        "questions_per_second": round(len(queries) / seconds, 2) if seconds else None,
+    }
+    logging.info(
+        f"Answered {stats['questions']} questions with {stats['llm_calls']} LLM calls "
+        f"in {stats['seconds']}s ({stats['questions_per_second']} questions/s)"
+    )
+    return results, stats
+
+def generate_answers(queries, max_concurrency=BATCH_MAX_CONCURRENCY, search_ef=None, filters=None):
+    """Blocking version of agenerate_answers for scripts and offline jobs"""
+    return asyncio.run(agenerate_answers(queries, max_concurrency=max_concurrency, search_ef=search_ef, filters=filters))
 
 if __name__ == "__main__":
     urls = [
@@ -0,0 +1,310 @@
+"""
+Collection snapshots: export a built collection to one file and load it on another node
+without scraping or embedding anything.
+
+File layout (little-endian):
+
+    0   magic b"DOCUSNAP", format version (uint32), header offset and length (uint64 x2)
+    64  vector block: float32 matrix, one row per chunk, memory-mappable in place
+    ... records block: one JSON line per chunk with id, document, metadata and sha256
+    ... header: JSON with counts, dimension, embedding model, HNSW space, block offsets
+        and a content hash per source
+
+The vectors are always the full embeddings. A node running in compact mode
+(VECTOR_PCA_DIM) projects them again on import.
+
+    python snapshot.py export resources/real_estate.docsnap
+    python snapshot.py import resources/real_estate.docsnap
+"""
+import argparse
+import hashlib
+import json
+import logging
+import shutil
+import struct
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from vector_backend import hnsw_settings
+
+MAGIC = b"DOCUSNAP"
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct("<8sIQQ")
+VECTORS_OFFSET = 64
+PAGE_SIZE = 2000
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _source_hashes(by_source):
+    """
+    Per source: number of chunks and a hash over its chunk hashes in id order
+    :param by_source: dict of source -> list of (chunk id, sha256)
+    """
+    return {
+        source: {
+            "chunks": len(chunks),
+            "sha256": hashlib.sha256("".join(h for _, h in sorted(chunks)).encode("ascii")).hexdigest(),
+        }
+        for source, chunks in by_source.items()
+    }
+
+
+def export_snapshot(path, collection, compact_index=None, embedding_model=None, chunk_store=None):
+    """
+    Write every chunk of a collection to a snapshot file
+    :param path: output file
+    :param collection: chromadb collection
+    :param compact_index: CompactVectorIndex holding the full vectors in compact mode
+    :param chunk_store: CompressedChunkStore holding the chunk text with CHUNK_STORE=zstd
+    :param embedding_model: name stored in the header and checked on import
+    :return: snapshot header
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    count = collection.count()
+    exported = 0
+    by_source = {}
+    dim = None
+    # Records are spooled to a temporary file page by page and copied after the vectors, so only
+    # one page and the chunk hashes are ever in memory
+    with open(tmp_path, "wb") as f, tempfile.TemporaryFile() as records_file:
+        f.write(b"\0" * VECTORS_OFFSET)
+        for offset in range(0, count, PAGE_SIZE):
+            page = collection.get(
+                limit=PAGE_SIZE,
+                offset=offset,
+                include=(["metadatas"] if chunk_store is not None else ["documents", "metadatas"])
+                + ([] if compact_index is not None else ["embeddings"])
+            )
+            if chunk_store is not None:
+                page["documents"] = chunk_store.get(page["ids"])
+            if compact_index is not None:
+                vectors = compact_index.get(page["ids"])
+            else:
+                vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            if np.isnan(vectors).any():
+                raise ValueError("Some chunks have no full vector in the compact index, re-ingest before exporting")
+            dim = vectors.shape[1] if dim is None else dim
+            f.write(np.ascontiguousarray(vectors, dtype="<f4").tobytes())
+            for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                record = {
+                    "id": chunk_id,
+                    "document": document,
+                    "metadata": metadata or {},
+                    "sha256": content_hash(document or ""),
+                }
+                records_file.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+                source = record["metadata"].get("source", "unknown")
+                by_source.setdefault(source, []).append((chunk_id, record["sha256"]))
+                exported += 1
+
+        records_offset = f.tell()
+        records_file.seek(0)
+        shutil.copyfileobj(records_file, f)
+        records_length = f.tell() - records_offset
+
+        header = {
+            "format_version": FORMAT_VERSION,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "collection": collection.name,
+            "collection_metadata": collection.metadata or {},
+            "hnsw_space": hnsw_settings(collection)["hnsw:space"],
+            "embedding_model": embedding_model,
+            "count": exported,
+            "dim": dim or 0,
+            "dtype": "<f4",
+            "vectors_offset": VECTORS_OFFSET,
+            "records_offset": records_offset,
+            "records_length": records_length,
+            "sources": _source_hashes(by_source),
+        }
+        header_bytes = json.dumps(header).encode("utf-8")
+        header_offset = f.tell()
+        f.write(header_bytes)
+        f.seek(0)
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, header_offset, len(header_bytes)))
+    tmp_path.replace(path)
+    logging.info(f"Exported {exported} chunks from {len(header['sources'])} sources to {path}")
+    return header
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        magic, version, header_offset, header_length = PREAMBLE.unpack(f.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a Docubot snapshot")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"Snapshot format version {version} is newer than supported ({FORMAT_VERSION})")
+        f.seek(header_offset)
+        return json.loads(f.read(header_length))
+
+
+def open_snapshot(path):
+    """
+    :return: (header, memory-mapped vector matrix, generator of records)
+    """
+    header = read_header(path)
+    vectors = np.memmap(path, dtype=header["dtype"], mode="r", offset=header["vectors_offset"],
+                        shape=(header["count"], header["dim"])) if header["count"] else np.zeros((0, header["dim"]), np.float32)
+
+    def records():
+        with open(path, "rb") as f:
+            f.seek(header["records_offset"])
+            remaining = header["records_length"]
+            while remaining > 0:
+                line = f.readline()
+                remaining -= len(line)
+                yield json.loads(line)
+
+    return header, vectors, records()
+
+
+def check_compatible(header, embedding_model=None, space=None, dim=None):
+    """
+    Raise ValueError when this node could not search the vectors of a snapshot
+    :param header: snapshot header
+    :param embedding_model: model this node queries with
+    :param space: HNSW space of the collection the snapshot goes into
+    :param dim: dimension of the vectors this node queries with (before any compact projection)
+    """
+    if embedding_model and header.get("embedding_model") and header["embedding_model"] != embedding_model:
+        raise ValueError(
+            f"Snapshot was built with {header['embedding_model']}, this node uses {embedding_model}"
+        )
+    # Snapshots written before the space was recorded only have it if the metadata set it
+    snapshot_space = header.get("hnsw_space") or header.get("collection_metadata", {}).get("hnsw:space")
+    if space and snapshot_space and snapshot_space != space:
+        raise ValueError(f"Snapshot was built in HNSW space {snapshot_space}, the collection uses {space}")
+    if dim and header["count"] and header["dim"] != dim:
+        raise ValueError(f"Snapshot vectors have {header['dim']} dimensions, this node uses {dim}")
+
+
+def import_snapshot(path, collection, compact_index=None, embedding_model=None, verify=True, batch_size=5000,
+                    chunk_store=None, dim=None):
+    """
+    Load a snapshot into an empty collection without embedding anything
+    :param path: snapshot file
+    :param collection: chromadb collection to fill
+    :param compact_index: CompactVectorIndex to project the vectors with in compact mode
+    :param chunk_store: CompressedChunkStore to write the chunk text to instead of the collection
+    :param embedding_model: model this node queries with; must match the snapshot
+    :param dim: dimension of the vectors this node queries with; must match the snapshot
+    :param verify: check every chunk against its content hash
+    :return: snapshot header
+    """
+    start = time.perf_counter()
+    header, vectors, records = open_snapshot(path)
+    settings = collection.hnsw_settings() if hasattr(collection, "hnsw_settings") else hnsw_settings(collection)
+    check_compatible(header, embedding_model=embedding_model, space=settings["hnsw:space"], dim=dim)
+    if hasattr(collection, "get_max_batch_size"):
+        batch_size = min(batch_size, collection.get_max_batch_size())
+
+    batch = []
+    done = 0
+    for record in records:
+        if verify and content_hash(record["document"] or "") != record["sha256"]:
+            raise ValueError(f"Chunk {record['id']} does not match its content hash, the snapshot is corrupt")
+        batch.append(record)
+        if len(batch) == batch_size:
+            _add_batch(collection, compact_index, chunk_store, batch, vectors[done:done + len(batch)])
+            done += len(batch)
+            batch = []
+    if batch:
+        _add_batch(collection, compact_index, chunk_store, batch, vectors[done:done + len(batch)])
+        done += len(batch)
+    if compact_index is not None and compact_index.needs_refit():
+        from compact_vectors import reproject
+
+        # The projection was fitted on the first batch only
+        reproject(compact_index, lambda ids, embeddings: collection.update(ids=ids, embeddings=embeddings),
+                  batch_size=batch_size)
+
+    logging.info(f"Imported {done} chunks from {path} in {time.perf_counter() - start:.1f}s")
+    return header
+
+
+def _add_batch(collection, compact_index, chunk_store, batch, vectors):
+    ids = [record["id"] for record in batch]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if compact_index is not None:
+        vectors = compact_index.add(ids, vectors)
+    documents = [record["document"] for record in batch]
+    if chunk_store is not None:
+        chunk_store.add(ids, [document or "" for document in documents])
+    collection.upsert(
+        ids=ids,
+        embeddings=vectors.tolist(),
+        documents=documents if chunk_store is None else None,
+        metadatas=[record["metadata"] or None for record in batch]
+    )
+
+
+def main():
+    import rag
+    from compact_vectors import CompactVectorIndex
+    from embeddings import get_embeddings
+    from embedding_server import RemoteEmbeddings
+    from vector_backend import make_client
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["export", "import", "info"])
+    parser.add_argument("path", help="snapshot file")
+    parser.add_argument("--no-verify", action="store_true", help="skip content hash checks on import")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        header = read_header(args.path)
+        header["sources"] = len(header["sources"])
+        print(json.dumps(header, indent=2))
+        return
+
+    # The store the app and API use: the Chroma server with CHROMA_HOST set, else the local directory
+    client = make_client(rag.CHROMA_HOST, rag.CHROMA_PORT, rag.CHROMA_SSL, rag.VECTORSTORE_DIR,
+                         rag.CHROMA_MAX_CONNECTIONS, connect_timeout=rag.CHROMA_CONNECT_TIMEOUT)
+    compact_index = None
+    if rag.VECTOR_PCA_DIM > 0:
+        compact_index = CompactVectorIndex(
+            rag.VECTORSTORE_DIR / f"{rag.COLLECTION_NAME}_compact",
+            dim=rag.VECTOR_PCA_DIM,
+            codec=rag.VECTOR_RESCORE_CODEC
+        )
+    chunk_store = None
+    if rag.CHUNK_STORE == "zstd":
+        from chunk_store import CompressedChunkStore
+        chunk_store = CompressedChunkStore(rag.VECTORSTORE_DIR / f"{rag.COLLECTION_NAME}_chunks.sqlite3",
+                                           level=rag.CHUNK_STORE_LEVEL)
+
+    if args.command == "export":
+        collection = client.get_collection(rag.COLLECTION_NAME)
+        header = export_snapshot(args.path, collection, compact_index, embedding_model=rag.EMBEDDING_MODEL,
+                                 chunk_store=chunk_store)
+        print(f"Exported {header['count']} chunks ({header['dim']} dims) to {args.path}")
+    else:
+        embeddings = RemoteEmbeddings(rag.EMBEDDING_SOCKET) if rag.EMBEDDING_SOCKET else \
+            get_embeddings(rag.EMBEDDING_MODEL, backend=rag.EMBEDDING_BACKEND, num_threads=rag.EMBEDDING_NUM_THREADS)
+        dim = len(embeddings.embed_query("dimension"))
+        # Checked before the collection is replaced, as an ingest would
+        check_compatible(read_header(args.path), embedding_model=rag.EMBEDDING_MODEL,
+                         space=rag.hnsw_metadata()["hnsw:space"], dim=dim)
+        try:
+            client.delete_collection(rag.COLLECTION_NAME)
+        except Exception:
+            pass
+        if compact_index is not None:
+            compact_index.reset()
+        if chunk_store is not None:
+            chunk_store.reset()
+        collection = client.create_collection(rag.COLLECTION_NAME, metadata=rag.hnsw_metadata(), embedding_function=None)
+        header = import_snapshot(args.path, collection, compact_index, embedding_model=rag.EMBEDDING_MODEL,
+                                 verify=not args.no_verify, chunk_store=chunk_store, dim=dim)
+        print(f"Imported {header['count']} chunks into {rag.COLLECTION_NAME}")
+
+
+if __name__ == "__main__":
+    main()
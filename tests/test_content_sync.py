@@ -0,0 +1,115 @@
+"""
+Content-mode ingests (CHUNKING_MODE=content) sync the collection in place:
+chunks the ingest produces again are kept, all others are deleted.
+Runs offline with the benchmark fakes instead of the embedding model.
+"""
+import pytest
+
+import rag
+from benchmarks.fakes import CpuBoundEmbeddings, FakeChatGroq
+
+
+class WordTokenizer:
+    """Whitespace stand-in for the embedding model tokenizer"""
+
+    def encode(self, text, add_special_tokens=True):
+        return text.split()
+
+    def decode(self, tokens, skip_special_tokens=True):
+        return " ".join(tokens)
+
+
+def page(source, text):
+    from langchain.schema import Document
+    return Document(page_content=text, metadata={"source": source})
+
+
+def paragraph(topic, words=120):
+    return " ".join(f"{topic}{i}" for i in range(words)) + "."
+
+
+def ingest(docs):
+    """index_documents plus remove_stale_chunks, as process_urls runs them"""
+    synced_ids = set()
+    statuses = list(rag.index_documents(docs, synced_ids=synced_ids))
+    statuses += list(rag.remove_stale_chunks(synced_ids))
+    errors = [status for status in statuses if status.startswith("Error")]
+    assert not errors, errors
+
+
+def stored_text():
+    stored = rag.write_collection.get(include=["documents", "metadatas"])
+    return " ".join(stored["documents"]), {metadata["source"] for metadata in stored["metadatas"]}
+
+
+@pytest.fixture
+def content_rag(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag, "VECTORSTORE_DIR", tmp_path)
+    monkeypatch.setattr(rag, "CHUNKING_MODE", "content")
+    monkeypatch.setattr(rag, "DEDUP_MODE", "drop")
+    monkeypatch.setattr(rag, "VECTOR_PCA_DIM", 0)
+    monkeypatch.setattr(rag, "CHUNK_STORE", "chroma")
+    monkeypatch.setattr(rag, "EMBEDDING_SOCKET", "")
+    monkeypatch.setattr(rag, "get_embeddings", lambda *args, **kwargs: CpuBoundEmbeddings(dim=32, tokens=16, layers=1))
+    monkeypatch.setattr(rag, "tokenizer", WordTokenizer())
+    monkeypatch.setattr(rag, "llm", FakeChatGroq())
+    for name in ("vector_store", "write_collection", "read_collection", "scope_cache", "write_generation",
+                 "embeddings", "compact_index", "chunk_store"):
+        monkeypatch.setattr(rag, name, None)
+    rag.initialize_components()
+    return rag
+
+
+def test_reingest_keeps_chunk_duplicating_a_page_left_out(content_rag):
+    shared = paragraph("shared")
+    ingest([page("https://a.example/", shared + "\n\n" + paragraph("alpha"))])
+
+    # B repeats a passage of A, and A is not part of this ingest
+    ingest([page("https://b.example/", shared + "\n\n" + paragraph("beta"))])
+
+    text, sources = stored_text()
+    assert sources == {"https://b.example/"}
+    assert "shared0" in text and "shared119" in text
+    assert "beta0" in text
+    assert "alpha0" not in text
+
+
+def test_duplicates_within_one_ingest_are_dropped(content_rag):
+    shared = paragraph("shared")
+    ingest([
+        page("https://a.example/", shared + "\n\n" + paragraph("alpha")),
+        page("https://b.example/", shared + "\n\n" + paragraph("beta")),
+    ])
+
+    text, _ = stored_text()
+    assert text.count("shared0 ") == 1
+    assert "alpha0" in text and "beta0" in text
+
+
+def run(generator):
+    """:return: (return value, statuses) of an ingest generator"""
+    statuses = []
+    while True:
+        try:
+            statuses.append(next(generator))
+        except StopIteration as stop:
+            return stop.value, statuses
+
+
+def test_crawl_batch_of_only_duplicates_is_not_an_error(content_rag):
+    shared = paragraph("shared")
+    dedup_index = rag.NearDuplicateIndex(threshold=rag.DEDUP_THRESHOLD)
+    synced_ids = set()
+    ok, _ = run(rag.index_documents([page("https://a.example/", shared + "\n\n" + paragraph("alpha"))],
+                                    dedup_index, synced_ids))
+    assert ok
+
+    # A later crawl batch whose only page repeats a passage indexed before
+    ok, statuses = run(rag.index_documents([page("https://a.example/copy", shared)], dedup_index, synced_ids))
+    assert ok, statuses
+    assert not [status for status in statuses if status.startswith("Error")]
+
+    ok, _ = run(rag.remove_stale_chunks(synced_ids))
+    assert ok
+    text, _ = stored_text()
+    assert "shared0" in text and "alpha0" in text
@@ -0,0 +1,202 @@
+"""
+Vector store backends.
+
+Embedded (default): Chroma runs inside the process on a local directory. Every
+worker process loads its own copy of the index, and processes writing to the
+same directory race on its SQLite file.
+
+Server (CHROMA_HOST set): all processes talk to one Chroma server
+(`chroma run --path <dir> --port 8000`) over pooled keep-alive HTTP
+connections, so the index is held in memory once and an ingest in one process is
+visible to queries in every other process.
+
+Reads and writes go through separate clients. Writes (reset, upsert) use the
+write endpoint; queries use CHROMA_READ_HOST when set, e.g. a load balancer
+in front of the server. Both are retried on connection errors. Readers look
+the collection up by name and look it up again when another process has
+recreated it, which every ingest does.
+
+Caches in each process (answers, filtered scopes) need to know when the
+collection changed. A reset gives it a new id and most writes change its count,
+but an incremental re-ingest can replace chunks one for one. Writers therefore
+also bump a WriteGeneration, a one-record side collection every process can read.
+"""
+import logging
+import time
+from uuid import uuid4
+
+import chromadb
+import httpx
+from chromadb.config import Settings
+from chromadb.errors import NotFoundError
+
+import metrics
+
+# Errors worth retrying: the server restarted, a pooled connection went stale, a timeout
+CONNECTION_ERRORS = (httpx.TransportError, ConnectionError, TimeoutError)
+
+RETRIES = metrics.REGISTRY.counter("docubot_vector_store_retries_total", "Vector store calls retried, by client and reason")
+
+
+def make_client(host=None, port=8000, ssl=False, persist_directory=None, max_connections=20, keepalive_seconds=40.0,
+                connect_timeout=30.0):
+    """
+    :param host: Chroma server host, or None for an embedded store
+    :param persist_directory: directory of the embedded store
+    :param max_connections: HTTP connections kept open to the server per process
+    :param connect_timeout: seconds to wait for the server to come up, so workers can start before it
+    :return: chromadb client
+    """
+    if not host:
+        return chromadb.PersistentClient(path=str(persist_directory))
+    settings = Settings(
+        anonymized_telemetry=False,
+        chroma_http_max_connections=max_connections,
+        chroma_http_max_keepalive_connections=max_connections,
+        chroma_http_keepalive_secs=keepalive_seconds,
+    )
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            # The client sends a heartbeat on creation and raises ValueError if nothing answers
+            return chromadb.HttpClient(host=host, port=port, ssl=ssl, settings=settings)
+        except (ValueError,) + CONNECTION_ERRORS as e:
+            if time.monotonic() >= deadline:
+                raise ConnectionError(f"Chroma server at {host}:{port} did not answer within {connect_timeout:.0f}s: {e}")
+            time.sleep(0.5)
+
+
+def hnsw_settings(collection):
+    """
+    HNSW settings a chromadb collection was created with, as collection metadata keys. Opening an
+    existing collection keeps them, whatever metadata it is opened with
+    """
+    hnsw = (getattr(collection, "configuration", None) or {}).get("hnsw") or {}
+    metadata = collection.metadata or {}
+    return {
+        "hnsw:space": hnsw.get("space", metadata.get("hnsw:space", "l2")),
+        "hnsw:construction_ef": hnsw.get("ef_construction", metadata.get("hnsw:construction_ef")),
+        "hnsw:search_ef": hnsw.get("ef_search", metadata.get("hnsw:search_ef")),
+        "hnsw:M": hnsw.get("max_neighbors", metadata.get("hnsw:M")),
+    }
+
+
+def call_with_retries(fn, retries=3, backoff=0.2, name="write"):
+    """
+    Call fn, retrying connection errors with exponential backoff
+    :param name: client label for the retry counter
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except CONNECTION_ERRORS as e:
+            if attempt == retries:
+                raise
+            RETRIES.inc(client=name, reason=type(e).__name__)
+            delay = backoff * 2 ** attempt
+            logging.warning(f"Vector store call failed ({e}), retry {attempt + 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+class SharedCollection:
+    """
+    Collection handle for readers and writers, resolved by name so that a collection recreated
+    by another process (or by reset_collection in this one) is picked up
+    :param client: chromadb client
+    :param name: collection name
+    :param metadata: collection metadata used if the reader gets to create the collection first
+    :param retries: retries of connection errors per call
+    """
+
+    def __init__(self, client, name, metadata=None, retries=3, backoff=0.2, label="read"):
+        self.client = client
+        self.name = name
+        self.metadata = metadata
+        self.retries = retries
+        self.backoff = backoff
+        self.label = label
+        self._collection = None
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            # No embedding function: callers always pass vectors
+            self._collection = self.client.get_or_create_collection(
+                self.name, metadata=self.metadata, embedding_function=None
+            )
+        return self._collection
+
+    def _call(self, method, *args, **kwargs):
+        def attempt():
+            try:
+                return getattr(self.collection, method)(*args, **kwargs)
+            except NotFoundError:
+                # Deleted and recreated under the same name since we looked it up
+                self._collection = None
+                return getattr(self.collection, method)(*args, **kwargs)
+
+        return call_with_retries(attempt, retries=self.retries, backoff=self.backoff, name=self.label)
+
+    def query(self, **kwargs):
+        return self._call("query", **kwargs)
+
+    def get(self, **kwargs):
+        return self._call("get", **kwargs)
+
+    def count(self):
+        return self._call("count")
+
+    # Writes by id, safe to repeat after a dropped connection
+    def upsert(self, **kwargs):
+        return self._call("upsert", **kwargs)
+
+    def update(self, **kwargs):
+        return self._call("update", **kwargs)
+
+    def delete(self, **kwargs):
+        return self._call("delete", **kwargs)
+
+    def hnsw_settings(self):
+        """HNSW settings the collection was created with, see hnsw_settings()"""
+        return hnsw_settings(self.collection)
+
+    def version(self):
+        """Collection id and chunk count, after following a recreated collection"""
+        count = self.count()
+        return f"{self.collection.id}:{count}"
+
+    def heartbeat(self):
+        return call_with_retries(self.client.heartbeat, retries=self.retries, backoff=self.backoff, name=self.label)
+
+
+class WriteGeneration:
+    """
+    Write marker of a collection, stored in a one-record side collection so every
+    process sees it. Writers bump it after changing the collection
+    :param client: chromadb client
+    :param name: name of the collection it tracks
+    """
+
+    def __init__(self, client, name, retries=3, backoff=0.2):
+        self.client = client
+        self.name = f"{name}_generation"
+        self.retries = retries
+        self.backoff = backoff
+        self._collection = None
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = self.client.get_or_create_collection(self.name, embedding_function=None)
+        return self._collection
+
+    def get(self):
+        results = call_with_retries(lambda: self.collection.get(ids=["generation"], include=["metadatas"]),
+                                    retries=self.retries, backoff=self.backoff, name="read")
+        return results["metadatas"][0]["value"] if results["ids"] else "0"
+
+    def bump(self):
+        # A random value rather than a counter, so concurrent writers cannot produce the same one
+        call_with_retries(lambda: self.collection.upsert(
+            ids=["generation"], embeddings=[[0.0]], metadatas=[{"value": uuid4().hex}]
+        ), retries=self.retries, backoff=self.backoff)